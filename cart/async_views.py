@@ -0,0 +1,192 @@
+"""
+Variantes asynchrones des vues JSON du panier, pour un déploiement ASGI (cmz/asgi.py).
+
+Elles sont branchées sur les mêmes URL que les vues synchrones lorsque le réglage
+CART_ASYNC_VIEWS est actif (voir cart/urls.py). Les lectures simples passent par
+l'ORM asynchrone ; les mutations du stockage restent du code synchrone transactionnel,
+exécuté dans un thread via sync_to_async pour ne pas bloquer la boucle d'événements.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET, require_POST
+
+from product.models import ProductPage, VariantOption
+from .storage import get_cart_storage
+from .summary import aget_cart_etag, aget_cart_summary
+
+logger = logging.getLogger(__name__)
+
+
+async def _aget_storage(request):
+    """
+    Résout l'utilisateur de façon asynchrone : get_cart_storage ne fait alors plus de requête.
+    """
+    request.user = await request.auser()
+    return get_cart_storage(request)
+
+
+async def _totals_response(storage, message):
+    # Total TTC du résumé, recalculé après la mutation puis servi depuis le cache au badge
+    summary = await aget_cart_summary(storage)
+    return JsonResponse({
+        'success': True,
+        'message': message,
+        'cart_item_count': summary['cart_item_count'],
+        'cart_total': summary['cart_total'],
+    })
+
+
+@require_POST
+async def add_to_cart(request, product_id):
+    """
+    Ajoute un produit au panier avec les options sélectionnées.
+    """
+    try:
+        storage = await _aget_storage(request)
+        product = await ProductPage.objects.filter(id=product_id).afirst()
+        if product is None:
+            raise Http404("Produit introuvable.")
+
+        selected_option_ids = [
+            int(value) for key, value in request.POST.items()
+            if key.startswith('variant_') and value.isdigit()
+        ]
+        selected_options = [option async for option in VariantOption.objects.filter(id__in=selected_option_ids)]
+
+        if selected_option_ids and not selected_options:
+            logger.error(f"Options sélectionnées invalides pour le produit {product_id}.")
+            return JsonResponse({
+                'success': False,
+                'message': 'Options sélectionnées invalides.',
+            }, status=400)
+
+        cart_item = await sync_to_async(storage.add)(product, selected_options)
+        logger.debug(f"Product added to cart: {product.title}, Quantity: {cart_item.quantity}")
+        return await _totals_response(storage, 'Produit ajouté au panier avec succès !')
+    except Exception as e:
+        logger.error(f"Erreur lors de l'ajout au panier: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de l\'ajout au panier.',
+        }, status=500)
+
+
+@require_POST
+async def remove_from_cart(request, item_id):
+    """
+    Supprime un article du panier.
+    """
+    try:
+        storage = await _aget_storage(request)
+        await sync_to_async(storage.remove)(item_id)
+        logger.debug(f"Item removed from cart: {item_id}")
+        return await _totals_response(storage, 'Produit supprimé du panier.')
+    except Exception as e:
+        logger.error(f"Erreur lors de la suppression du produit: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de la suppression du produit.',
+        }, status=500)
+
+
+@require_POST
+async def update_cart(request, item_id):
+    """
+    Met à jour la quantité d'un article dans le panier.
+    """
+    try:
+        storage = await _aget_storage(request)
+        quantity = int(request.POST.get('quantity', 1))
+        await sync_to_async(storage.update)(item_id, quantity)
+        logger.debug(f"Cart item updated: {item_id}, New Quantity: {quantity}")
+        return await _totals_response(storage, 'Quantité mise à jour.')
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour du panier: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de la mise à jour du panier.',
+        }, status=500)
+
+
+@require_POST
+async def batch_update_cart(request):
+    """
+    Applique en une seule requête une liste d'ajouts, mises à jour et suppressions
+    (même format que cart.views.batch_update_cart).
+    """
+    try:
+        operations = json.loads(request.body).get('operations')
+        if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+            raise ValueError("Liste d'opérations invalide.")
+        storage = await _aget_storage(request)
+        await sync_to_async(storage.apply_operations)(operations)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.error(f"Lot d'opérations invalide: {e}")
+        return JsonResponse({
+            'success': False,
+            'message': 'Opérations sur le panier invalides.',
+        }, status=400)
+    except Http404:
+        return JsonResponse({
+            'success': False,
+            'message': 'Produit ou article introuvable.',
+        }, status=404)
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour groupée du panier: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de la mise à jour du panier.',
+        }, status=500)
+    logger.debug(f"Cart batch applied: {len(operations)} operations")
+    return await _totals_response(storage, 'Panier mis à jour.')
+
+
+@require_GET
+async def cart_summary(request):
+    """
+    Renvoie le nombre d'articles et le total du panier pour le badge de l'en-tête.
+    Un résumé à jour est servi depuis le cache sans toucher la base.
+    """
+    try:
+        storage = await _aget_storage(request)
+        owner = storage.owner_key()
+        etag = await aget_cart_etag(owner)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            summary = await aget_cart_summary(storage)
+            response = JsonResponse({
+                'success': True,
+                'cart_item_count': summary['cart_item_count'],
+                'cart_total': summary['cart_total'],
+            })
+    except Exception as e:
+        logger.error(f"Erreur dans cart_summary: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de la récupération du résumé du panier.',
+        }, status=500)
+    response.headers.setdefault('ETag', etag)
+    # Le résumé dépend du visiteur : jamais dans un cache partagé, toujours revalidé
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def get_cart_data(request):
+    """
+    Renvoie les données du panier au format JSON.
+    """
+    try:
+        storage = await _aget_storage(request)
+        data = await sync_to_async(storage.serialize)()
+        logger.debug(f"Cart Data: {data['cart_item_count']} items, Total: {data['cart_total']}")
+        return JsonResponse({'success': True, **data})
+    except Exception as e:
+        logger.error(f"Erreur dans get_cart_data: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de la récupération des données du panier.',
+        }, status=500)
@@ -0,0 +1,88 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit (requêtes/s) et la latence p50/p99 d'un point d'accès du panier "
+        "sur un serveur lancé à part. Pour comparer les deux chemins, lancer la commande "
+        "contre « gunicorn cmz.wsgi:application » puis contre « uvicorn cmz.asgi:application » "
+        "avec CART_ASYNC_VIEWS = True, à concurrence et nombre de requêtes identiques."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Adresse du serveur à mesurer")
+        parser.add_argument('--path', default='/cart/summary/', help="Point d'accès GET à mesurer")
+        parser.add_argument('--requests', type=int, default=2000, help="Nombre total de requêtes")
+        parser.add_argument('--concurrency', type=int, default=200, help="Nombre de clients simultanés")
+        parser.add_argument(
+            '--product-id', type=int,
+            help="Chaque client ajoute d'abord ce produit à son panier (panier non vide)",
+        )
+        parser.add_argument('--timeout', type=float, default=30, help="Délai maximal par requête (secondes)")
+
+    def handle(self, *args, **options):
+        try:
+            import httpx
+        except ImportError:
+            raise CommandError("Le paquet httpx est requis pour ce banc d'essai.")
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--requests et --concurrency doivent être positifs.")
+
+        latencies, errors, elapsed = asyncio.run(self.run(httpx, options))
+        if not latencies:
+            raise CommandError(f"Aucune requête réussie ({errors} erreur(s)).")
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(f"Point d'accès : {options['url']}{options['path']}")
+        self.stdout.write(f"Requêtes : {len(latencies)} réussies, {errors} en erreur, concurrence {options['concurrency']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(latencies) / elapsed:.1f} requêtes/s, "
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+        ))
+
+    async def run(self, httpx, options):
+        # Chaque client a son propre jeu de cookies, donc son propre panier
+        clients = [
+            httpx.AsyncClient(base_url=options['url'], timeout=options['timeout'])
+            for _ in range(options['concurrency'])
+        ]
+        try:
+            if options['product_id']:
+                await asyncio.gather(*(self.fill_cart(client, options['product_id']) for client in clients))
+
+            remaining = iter(range(options['requests']))
+            latencies = []
+            errors = 0
+
+            async def worker(client):
+                nonlocal errors
+                for _ in remaining:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.get(options['path'])
+                        response.raise_for_status()
+                    except httpx.HTTPError:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for client in clients))
+            return latencies, errors, time.perf_counter() - start
+        finally:
+            await asyncio.gather(*(client.aclose() for client in clients))
+
+    async def fill_cart(self, client, product_id):
+        # La page du panier dépose le cookie CSRF exigé par les vues POST
+        await client.get('/cart/')
+        response = await client.post(
+            f'/cart/add/{product_id}/',
+            headers={'X-CSRFToken': client.cookies.get('csrftoken', ''), 'Referer': str(client.base_url)},
+        )
+        if response.status_code != 200:
+            raise CommandError(f"Ajout au panier impossible (HTTP {response.status_code}).")
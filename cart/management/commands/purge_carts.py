@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from cart.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime par lots les paniers anonymes plus anciens que --days jours, "
+        "avec leurs lignes et leurs options"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Âge minimal des paniers à supprimer (jours)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Nombre de paniers par lot")
+        parser.add_argument('--sleep', type=float, default=0, help="Pause entre deux lots (secondes)")
+        parser.add_argument('--dry-run', action='store_true', help="Compter sans supprimer")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        carts = Cart.objects.using(using).filter(user__isnull=True, created_at__lt=cutoff)
+
+        if options['dry_run']:
+            items = CartItem.objects.using(using).filter(cart__in=carts)
+            through = CartItem.selected_options.through.objects.using(using).filter(cartitem__cart__in=carts)
+            self.stdout.write(
+                f"{carts.count()} panier(s), {items.count()} ligne(s) et "
+                f"{through.count()} option(s) seraient supprimés."
+            )
+            return
+
+        deleted = {'carts': 0, 'items': 0, 'options': 0}
+        last_pk = 0
+        while True:
+            # Pagination par clé primaire : seul le lot courant d'identifiants est en mémoire
+            batch = list(
+                carts.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]
+            with transaction.atomic(using=using):
+                deleted['options'] += CartItem.selected_options.through.objects.using(using).filter(
+                    cartitem__cart_id__in=batch
+                )._raw_delete(using)
+                deleted['items'] += CartItem.objects.using(using).filter(cart_id__in=batch)._raw_delete(using)
+                deleted['carts'] += Cart.objects.using(using).filter(pk__in=batch)._raw_delete(using)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Lot jusqu'à l'id {last_pk} supprimé.")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{deleted['carts']} panier(s), {deleted['items']} ligne(s) et "
+            f"{deleted['options']} option(s) supprimés."
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from cart.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Recalcule depuis zéro les totaux stockés (sous-total, nombre de lignes) de tous les paniers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reprice',
+            action='store_true',
+            help="Relire aussi le prix unitaire de chaque ligne depuis le catalogue",
+        )
+
+    def handle(self, *args, **options):
+        reprice = options['reprice']
+        updated = 0
+        for cart in Cart.objects.iterator():
+            with transaction.atomic():
+                previous = (cart.subtotal, cart.item_count)
+                cart.recalculate_totals(reprice=reprice)
+                if previous != (cart.subtotal, cart.item_count):
+                    updated += 1
+        self.stdout.write(self.style.SUCCESS(f"Paniers réconciliés : {updated} corrigé(s)."))
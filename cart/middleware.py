@@ -0,0 +1,33 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+class CartStorageMiddleware:
+    """
+    Écrit dans la réponse les modifications du panier anonyme (cookie signé, jeton de cache).
+    Middleware sync et async : sous ASGI, la réponse est complétée dans la boucle
+    d'événements, sans passage par un thread (voir aupdate_response).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        storage = getattr(request, '_guest_cart_storage', None)
+        if storage is not None:
+            storage.update_response(response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        storage = getattr(request, '_guest_cart_storage', None)
+        if storage is not None:
+            await storage.aupdate_response(response)
+        return response
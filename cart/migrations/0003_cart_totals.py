@@ -0,0 +1,52 @@
+# Generated by Django 5.0.9 on 2026-10-17 02:31
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model("cart", "Cart")
+    CartItem = apps.get_model("cart", "CartItem")
+
+    for cart in Cart.objects.iterator():
+        items = list(
+            CartItem.objects.filter(cart=cart)
+            .select_related("product")
+            .prefetch_related("selected_options")
+        )
+        for item in items:
+            additional_price = sum(
+                option.additional_price or 0 for option in item.selected_options.all()
+            )
+            item.unit_price = item.product.price + additional_price
+        CartItem.objects.bulk_update(items, ["unit_price"])
+        cart.subtotal = sum((item.unit_price * item.quantity for item in items), Decimal("0"))
+        cart.item_count = len(items)
+        cart.save(update_fields=["subtotal", "item_count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cart",
+            name="item_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="cart",
+            name="subtotal",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name="cartitem",
+            name="unit_price",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
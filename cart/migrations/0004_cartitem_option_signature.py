@@ -0,0 +1,60 @@
+# Generated by Django 5.0.9 on 2026-10-17 02:32
+
+from django.db import migrations, models
+
+
+# Lignes chargées par lot : la mémoire occupée ne dépend pas du nombre de lignes
+BATCH_SIZE = 1000
+
+
+def backfill_option_signatures(apps, schema_editor):
+    Cart = apps.get_model("cart", "Cart")
+    CartItem = apps.get_model("cart", "CartItem")
+
+    # Signatures par lots de clés primaires croissantes
+    last_pk = 0
+    while True:
+        batch = list(
+            CartItem.objects.filter(pk__gt=last_pk).order_by("pk").prefetch_related("selected_options")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for item in batch:
+            option_ids = sorted({option.id for option in item.selected_options.all()})
+            item.option_signature = ",".join(str(option_id) for option_id in option_ids)
+        CartItem.objects.bulk_update(batch, ["option_signature"])
+        last_pk = batch[-1].pk
+
+    # Fusionner les doublons existants dans la première ligne de chaque groupe, avant la
+    # contrainte d'unicité (migration suivante). Les groupes en double sont peu nombreux.
+    groups = list(
+        CartItem.objects.values("cart_id", "product_id", "option_signature")
+        .annotate(lines=models.Count("id"), quantity=models.Sum("quantity"), keep=models.Min("id"))
+        .filter(lines__gt=1)
+        .order_by()
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for group in groups:
+        CartItem.objects.filter(id=group["keep"]).update(quantity=group["quantity"])
+        CartItem.objects.filter(
+            cart_id=group["cart_id"], product_id=group["product_id"], option_signature=group["option_signature"],
+        ).exclude(id=group["keep"]).delete()
+    for cart_id in {group["cart_id"] for group in groups}:
+        Cart.objects.filter(id=cart_id).update(item_count=CartItem.objects.filter(cart_id=cart_id).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0003_cart_totals"),
+        ("product", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartitem",
+            name="option_signature",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.RunPython(backfill_option_signatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.9 on 2026-10-17 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0004_cartitem_option_signature"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                fields=("cart", "product", "option_signature"),
+                name="cart_item_unique_product_options",
+            ),
+        ),
+    ]
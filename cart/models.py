@@ -1,4 +1,6 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Subquery, Sum
 from django.conf import settings
 from product.models import ProductPage, VariantOption
 from django.utils import timezone
@@ -7,6 +9,9 @@ class Cart(models.Model):
     user = models.OneToOneField( settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    # Totaux maintenus à chaque mutation du panier (voir apply_delta / recalculate_totals)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         if self.user:
@@ -15,19 +20,111 @@ class Cart(models.Model):
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.subtotal
+
+    @property
+    def owner_key(self):
+        """Identifiant du propriétaire utilisé par le cache du résumé (voir cart.summary)."""
+        if self.user_id:
+            return f"user:{self.user_id}"
+        if self.session_key:
+            return f"session:{self.session_key}"
+        return None
+
+    def bump_version(self):
+        from .summary import bump_cart_version
+        bump_cart_version(self.owner_key)
+
+    def apply_delta(self, amount, count=0):
+        """
+        Répercute une variation de montant et de nombre de lignes sur les totaux stockés.
+        La mise à jour se fait en base via des expressions F() pour rester correcte en concurrence.
+        """
+        Cart.objects.filter(pk=self.pk).update(
+            subtotal=F('subtotal') + amount,
+            item_count=F('item_count') + count,
+        )
+        self.refresh_from_db(fields=['subtotal', 'item_count'])
+        self.bump_version()
+
+    def recalculate_totals(self, reprice=False):
+        """
+        Recalcule les totaux à partir des lignes du panier.
+        Avec reprice=True, le prix unitaire de chaque ligne est relu depuis le catalogue.
+        """
+        if reprice:
+            items = list(self.items.select_related('product').prefetch_related('selected_options'))
+            for item in items:
+                item.unit_price = item.compute_unit_price()
+            CartItem.objects.bulk_update(items, ['unit_price'])
+        totals = self.items.aggregate(
+            subtotal=Sum(ExpressionWrapper(
+                F('unit_price') * F('quantity'),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            )),
+            item_count=Count('id'),
+        )
+        self.subtotal = totals['subtotal'] or Decimal('0')
+        self.item_count = totals['item_count']
+        self.save(update_fields=['subtotal', 'item_count'])
+        self.bump_version()
+
+    def merge(self, other):
+        """
+        Fusionne le panier `other` dans ce panier puis le supprime.
+        Opérations ensemblistes : le nombre de requêtes ne dépend pas du nombre de lignes.
+        """
+        same_line = {
+            'product': OuterRef('product'),
+            'option_signature': OuterRef('option_signature'),
+        }
+        other_lines = CartItem.objects.filter(cart=other, **same_line)
+        own_lines = CartItem.objects.filter(cart=self, **same_line)
+        with transaction.atomic():
+            # Lignes présentes dans les deux paniers : cumul des quantités
+            CartItem.objects.filter(cart=self).filter(Exists(other_lines)).update(
+                quantity=F('quantity') + Subquery(other_lines.values('quantity')[:1])
+            )
+            duplicates = CartItem.objects.filter(cart=other).filter(Exists(own_lines))
+            CartItem.selected_options.through.objects.filter(cartitem__in=duplicates).delete()
+            duplicates.delete()
+            # Lignes propres à l'autre panier : simple rattachement
+            CartItem.objects.filter(cart=other).update(cart=self)
+            Cart.objects.filter(pk=other.pk).delete()
+            self.recalculate_totals()
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(ProductPage, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     selected_options = models.ManyToManyField(VariantOption, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Identifiants triés des options sélectionnées, ex. "3,7,12" (chaîne vide sans option)
+    option_signature = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cart', 'product', 'option_signature'],
+                name='cart_item_unique_product_options',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.quantity} x {self.product.title}"
 
+    @staticmethod
+    def build_option_signature(option_ids):
+        """Signature canonique d'un ensemble d'options : identifiants uniques, triés, séparés par des virgules."""
+        return ','.join(str(option_id) for option_id in sorted(set(option_ids)))
+
+    def compute_unit_price(self, options=None):
+        """Prix unitaire du produit augmenté du supplément des options sélectionnées."""
+        if options is None:
+            options = self.selected_options.all()
+        additional_price = sum(option.additional_price or 0 for option in options)
+        return self.product.price + additional_price
+
     @property
     def total_price(self):
-        base_price = self.product.price
-        additional_price = sum(option.additional_price or 0 for option in self.selected_options.all())
-        return (base_price + additional_price) * self.quantity
+        return self.unit_price * self.quantity
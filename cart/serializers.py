@@ -0,0 +1,65 @@
+from django.db.models import Prefetch
+from checkout.models import CheckoutSettings
+from product.models import VariantOption
+from site_settings.provider import get_settings
+from taxes.pricing import get_tax_user, price_cart_items
+from .models import CartItem
+
+
+def get_cart_items(cart):
+    """
+    Charge toutes les lignes du panier avec produit, image et options en un nombre fixe de requêtes.
+    """
+    return list(
+        CartItem.objects.filter(cart=cart)
+        .select_related('product', 'product__featured_image')
+        .prefetch_related(
+            Prefetch('selected_options', queryset=VariantOption.objects.select_related('variant'))
+        )
+        .order_by('id')
+    )
+
+
+def price_cart(items, user=None):
+    """
+    Chiffre les lignes du panier pour `user` : taux de la catégorie fiscale du client, taux
+    par défaut de la boutique (CheckoutSettings.tax_rate_default) pour les visiteurs, les
+    clients sans catégorie fiscale et les produits sans matrice.
+    """
+    settings_instance = get_settings(CheckoutSettings)
+    default_rate = settings_instance.tax_rate_default if settings_instance else None
+    return price_cart_items(items, get_tax_user(user), default_rate)
+
+
+def serialize_cart_item(item, request=None):
+    """Représentation JSON d'une ligne de panier déjà chargée par get_cart_items."""
+    product = item.product
+    image = product.featured_image
+    return {
+        'id': item.id,
+        'product_title': product.title,
+        # Les chemins racine des sites sont mis en cache sur la requête par Wagtail
+        'product_url': product.get_url(request=request) or '#',
+        'product_image': image.file.url if image else '',
+        'unit_price': float(product.price),
+        'selected_options': [f"{option.variant.name}: {option.name}" for option in item.selected_options.all()],
+        'quantity': item.quantity,
+        'total_price': float(item.total_price),
+    }
+
+
+def serialize_cart(cart, request=None, items=None):
+    """
+    Sérialise le panier complet en une seule passe : lignes, nombre d'articles et totaux
+    HT/TVA/TTC (voir taxes.pricing). Le nombre de requêtes ne dépend pas du nombre de lignes.
+    """
+    if items is None:
+        items = get_cart_items(cart)
+    pricing = price_cart(items, getattr(request, 'user', None))
+    return {
+        'cart_item_count': len(items),
+        'cart_total': float(pricing.ttc),
+        'cart_total_ht': float(pricing.ht),
+        'cart_total_tva': float(pricing.tva),
+        'items': [serialize_cart_item(item, request) for item in items],
+    }
@@ -0,0 +1,25 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Cart
+from .storage import get_guest_storage_class
+
+
+@receiver(user_logged_in)
+def materialize_guest_cart(sender, request, user, **kwargs):
+    """
+    À la connexion, transfère le panier anonyme dans le panier en base de l'utilisateur
+    (voir la méthode materialize de chaque stockage).
+    """
+    if request is None:
+        return
+    if not hasattr(request, '_guest_cart_storage'):
+        request._guest_cart_storage = get_guest_storage_class()(request)
+    request._guest_cart_storage.materialize(user)
+
+
+@receiver(post_delete, sender=Cart)
+def invalidate_cart_summary(sender, instance, **kwargs):
+    """Un panier supprimé (commande passée, fusion) ne doit plus être servi depuis le cache."""
+    instance.bump_version()
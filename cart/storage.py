@@ -0,0 +1,546 @@
+"""
+Stockage des paniers.
+
+Les paniers des utilisateurs connectés sont toujours en base (Cart / CartItem).
+Pour les visiteurs anonymes, le backend est choisi par le réglage CART_GUEST_STORAGE :
+
+- ``cart.storage.SignedCookieCartStorage`` : le panier est stocké dans un cookie signé ;
+- ``cart.storage.CacheCartStorage`` : le panier est stocké dans le cache, le cookie ne contient qu'un jeton ;
+- ``cart.storage.DatabaseCartStorage`` : comportement historique, un Cart par session.
+
+Avec les deux premiers backends, un panier anonyme ne devient une ligne en base
+qu'à la connexion (voir ``materialize``), le checkout exigeant un compte.
+"""
+import copy
+import hashlib
+import json
+import secrets
+from contextlib import contextmanager
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.module_loading import import_string
+
+from product.models import ProductPage, VariantOption
+from .models import Cart, CartItem
+from .serializers import get_cart_items, price_cart, serialize_cart
+from .summary import bump_cart_version
+
+DEFAULT_GUEST_STORAGE = 'cart.storage.SignedCookieCartStorage'
+
+
+def get_cart_storage(request):
+    """
+    Renvoie le stockage de panier de la requête (mis en cache sur la requête).
+    """
+    if request.user.is_authenticated:
+        attribute, storage_class = '_user_cart_storage', DatabaseCartStorage
+    else:
+        attribute, storage_class = '_guest_cart_storage', get_guest_storage_class()
+    if not hasattr(request, attribute):
+        setattr(request, attribute, storage_class(request))
+    return getattr(request, attribute)
+
+
+def get_guest_storage_class():
+    return import_string(getattr(settings, 'CART_GUEST_STORAGE', DEFAULT_GUEST_STORAGE))
+
+
+class BaseCartStorage:
+    """
+    Interface commune des stockages de panier.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def get_cart(self):
+        raise NotImplementedError
+
+    def add(self, product, options):
+        """Ajoute une unité du produit avec les options données, renvoie la ligne."""
+        raise NotImplementedError
+
+    def update(self, item_id, quantity):
+        """Fixe la quantité d'une ligne ; une quantité nulle supprime la ligne."""
+        raise NotImplementedError
+
+    def remove(self, item_id):
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self):
+        """Regroupe plusieurs mutations : tout ou rien, totaux mis à jour une seule fois."""
+        yield
+
+    def apply_operations(self, operations):
+        """
+        Applique une liste d'opérations dans un seul lot :
+        ``{"op": "add", "product_id": 1, "options": [3]}``, ``{"op": "update", "item_id": 5, "quantity": 2}``
+        ou ``{"op": "remove", "item_id": 5}``.
+        Lève ValueError pour une opération invalide et Http404 pour un produit ou une ligne absents.
+        """
+        adds = [operation for operation in operations if operation.get('op') == 'add']
+        products = ProductPage.objects.in_bulk({int(operation['product_id']) for operation in adds})
+        options = VariantOption.objects.in_bulk(
+            {int(option_id) for operation in adds for option_id in operation.get('options', [])}
+        )
+        with self.batch():
+            for operation in operations:
+                kind = operation.get('op')
+                if kind == 'add':
+                    product = products.get(int(operation['product_id']))
+                    if product is None:
+                        raise Http404("Produit introuvable.")
+                    option_ids = [int(option_id) for option_id in operation.get('options', [])]
+                    if any(option_id not in options for option_id in option_ids):
+                        raise ValueError("Options sélectionnées invalides.")
+                    self.add(product, [options[option_id] for option_id in option_ids])
+                elif kind == 'update':
+                    self.update(int(operation['item_id']), int(operation['quantity']))
+                elif kind == 'remove':
+                    self.remove(int(operation['item_id']))
+                else:
+                    raise ValueError(f"Opération inconnue : {kind}")
+
+    def owner_key(self):
+        """
+        Identifie le panier pour le cache du résumé sans requête en base ; None s'il n'existe pas encore.
+        """
+        raise NotImplementedError
+
+    def serialize(self):
+        return serialize_cart(self.get_cart(), self.request)
+
+    def pricing(self):
+        """HT, TVA et TTC du panier, comme sur la page panier et au checkout (voir price_cart)."""
+        return price_cart(get_cart_items(self.get_cart()), self.request.user)
+
+    @property
+    def item_count(self):
+        return self.get_cart().item_count
+
+    @property
+    def total(self):
+        """Sous-total stocké, avant taxes."""
+        return self.get_cart().total_price
+
+    def materialize(self, user):
+        """Transfère le panier vers le panier en base de l'utilisateur à la connexion."""
+        return None
+
+    def update_response(self, response):
+        """Point d'extension pour les stockages qui écrivent dans la réponse (cookies)."""
+        return response
+
+    async def aupdate_response(self, response):
+        """Variante asynchrone de update_response, exécutée sur place : cookies seulement, sans entrée-sortie."""
+        return self.update_response(response)
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """
+    Panier en base : lié à l'utilisateur connecté, sinon à la clé de session.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self._cart = None
+        self._pending_delta = None
+
+    def _apply_delta(self, amount, count=0):
+        """Met à jour les totaux du panier, ou les cumule pendant un lot."""
+        if self._pending_delta is None:
+            self.get_cart().apply_delta(amount, count)
+        else:
+            self._pending_delta[0] += amount
+            self._pending_delta[1] += count
+
+    def owner_key(self):
+        if self.request.user.is_authenticated:
+            return f"user:{self.request.user.pk}"
+        session_key = self.request.session.session_key
+        return f"session:{session_key}" if session_key else None
+
+    @contextmanager
+    def batch(self):
+        cart = self.get_cart()
+        self._pending_delta = [Decimal('0'), 0]
+        try:
+            with transaction.atomic():
+                yield
+                amount, count = self._pending_delta
+                cart.apply_delta(amount, count)
+        finally:
+            self._pending_delta = None
+
+    def get_cart(self):
+        if self._cart is not None:
+            return self._cart
+        request = self.request
+        if request.user.is_authenticated:
+            cart, created = Cart.objects.get_or_create(user=request.user)
+        else:
+            session_key = request.session.session_key
+            if not session_key:
+                request.session.create()
+                session_key = request.session.session_key
+            cart, created = Cart.objects.get_or_create(session_key=session_key)
+            # La clé de session change à la connexion : on garde l'id du panier pour la fusion
+            if request.session.get('cart_id') != cart.id:
+                request.session['cart_id'] = cart.id
+        self._cart = cart
+        return cart
+
+    def materialize(self, user):
+        """
+        Fusionne le panier de session dans le panier de l'utilisateur qui vient de se connecter.
+        """
+        cart_id = self.request.session.pop('cart_id', None)
+        guest_cart = Cart.objects.filter(pk=cart_id, user__isnull=True).first() if cart_id else None
+        if guest_cart is None:
+            return None
+        user_cart = Cart.objects.filter(user=user).first()
+        if user_cart is None:
+            # Pas de panier utilisateur : le panier de session lui est simplement rattaché
+            Cart.objects.filter(pk=guest_cart.pk).update(user=user, session_key=None)
+            bump_cart_version(f"user:{user.pk}")
+            return guest_cart
+        user_cart.merge(guest_cart)
+        return user_cart
+
+    def add(self, product, options):
+        cart = self.get_cart()
+        # Une ligne est identifiée par (panier, produit, signature des options)
+        signature = CartItem.build_option_signature(option.id for option in options)
+
+        with transaction.atomic():
+            cart_item, created = CartItem.objects.get_or_create(
+                cart=cart,
+                product=product,
+                option_signature=signature,
+                defaults={
+                    'quantity': 1,
+                    'unit_price': CartItem(product=product).compute_unit_price(options),
+                },
+            )
+            if created:
+                cart_item.selected_options.set(options)
+                self._apply_delta(cart_item.unit_price, 1)
+            else:
+                CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') + 1)
+                cart_item.refresh_from_db(fields=['quantity'])
+                self._apply_delta(cart_item.unit_price)
+        return cart_item
+
+    def _locked_item(self, item_id):
+        # Ligne relue verrouillée dans la transaction : le delta part de la quantité en
+        # base, pas d'une copie qu'une requête concurrente aurait déjà modifiée
+        return get_object_or_404(CartItem.objects.select_for_update(), id=item_id, cart=self.get_cart())
+
+    def update(self, item_id, quantity):
+        with transaction.atomic():
+            cart_item = self._locked_item(item_id)
+            if quantity > 0:
+                delta = cart_item.unit_price * (quantity - cart_item.quantity)
+                cart_item.quantity = quantity
+                cart_item.save(update_fields=['quantity'])
+                self._apply_delta(delta)
+            else:
+                cart_item.delete()
+                self._apply_delta(-cart_item.total_price, -1)
+        return cart_item
+
+    def remove(self, item_id):
+        with transaction.atomic():
+            cart_item = self._locked_item(item_id)
+            cart_item.delete()
+            self._apply_delta(-cart_item.total_price, -1)
+        return cart_item
+
+
+class GuestList(list):
+    """Liste exposant .all() comme un manager, pour les gabarits et le sérialiseur."""
+
+    def all(self):
+        return self
+
+
+class GuestCartItem:
+    """Ligne d'un panier anonyme, résolue depuis le catalogue."""
+
+    def __init__(self, id, product, options, quantity):
+        self.id = id
+        self.product = product
+        self.selected_options = GuestList(options)
+        self.quantity = quantity
+        self.unit_price = CartItem(product=product).compute_unit_price(options)
+        self.option_signature = CartItem.build_option_signature(option.id for option in options)
+
+    @property
+    def total_price(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.title}"
+
+
+class GuestCart:
+    """Panier anonyme hors base, avec la même interface de lecture que Cart."""
+
+    def __init__(self, items):
+        self.items = GuestList(items)
+        self.item_count = len(items)
+        self.subtotal = sum((item.total_price for item in items), Decimal('0'))
+
+    @property
+    def total_price(self):
+        return self.subtotal
+
+
+class GuestCartStorage(BaseCartStorage):
+    """
+    Base des stockages anonymes hors base de données.
+
+    Le panier est un dictionnaire compact ``{"next": n, "lines": [[id, product_id, [option_ids], quantity], ...]}``
+    que les sous-classes chargent et enregistrent via ``load_data`` et ``store_data``.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cookie_name = getattr(settings, 'CART_COOKIE_NAME', 'cart')
+        self.cookie_age = getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24 * 30)
+        self._data = None
+        self._cart = None
+        self._changed = False
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.load_data() or {'next': 1, 'lines': []}
+        return self._data
+
+    def load_data(self):
+        raise NotImplementedError
+
+    def store_data(self, data, response):
+        raise NotImplementedError
+
+    def _find_line(self, item_id):
+        for line in self.data['lines']:
+            if line[0] == item_id:
+                return line
+        raise Http404("Article introuvable dans le panier.")
+
+    def owner_key(self):
+        # L'empreinte du contenu identifie le panier et change à chaque mutation : le résumé
+        # en cache n'a pas à être invalidé (aucune écriture de version par mutation)
+        if not self.data['lines']:
+            return None
+        payload = json.dumps(self.data, separators=(',', ':'), sort_keys=True)
+        return f"guest:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    def _save(self):
+        self._changed = True
+        self._cart = None
+
+    @contextmanager
+    def batch(self):
+        snapshot = copy.deepcopy(self.data)
+        try:
+            yield
+        except Exception:
+            # Annuler toutes les opérations du lot
+            self._data = snapshot
+            self._cart = None
+            raise
+
+    def get_cart(self):
+        if self._cart is None:
+            self._cart = GuestCart(self.resolve_items())
+        return self._cart
+
+    def resolve_items(self):
+        """Charge produits et options de toutes les lignes en deux requêtes."""
+        lines = self.data['lines']
+        if not lines:
+            return []
+        products = ProductPage.objects.select_related('featured_image').in_bulk(
+            {line[1] for line in lines}
+        )
+        options = VariantOption.objects.select_related('variant').in_bulk(
+            {option_id for line in lines for option_id in line[2]}
+        )
+        items = []
+        for item_id, product_id, option_ids, quantity in lines:
+            product = products.get(product_id)
+            if product is None:
+                # Produit supprimé du catalogue depuis l'ajout au panier
+                continue
+            line_options = [options[option_id] for option_id in option_ids if option_id in options]
+            items.append(GuestCartItem(item_id, product, line_options, quantity))
+        return items
+
+    def serialize(self):
+        cart = self.get_cart()
+        return serialize_cart(cart, self.request, items=list(cart.items))
+
+    def pricing(self):
+        return price_cart(list(self.get_cart().items), self.request.user)
+
+    @property
+    def item_count(self):
+        return len(self.data['lines'])
+
+    def add(self, product, options):
+        option_ids = sorted({option.id for option in options})
+        for line in self.data['lines']:
+            if line[1] == product.id and line[2] == option_ids:
+                line[3] += 1
+                break
+        else:
+            line = [self.data['next'], product.id, option_ids, 1]
+            self.data['lines'].append(line)
+            self.data['next'] += 1
+        self._save()
+        return GuestCartItem(line[0], product, options, line[3])
+
+    def update(self, item_id, quantity):
+        line = self._find_line(item_id)
+        if quantity > 0:
+            line[3] = quantity
+        else:
+            self.data['lines'].remove(line)
+        self._save()
+
+    def remove(self, item_id):
+        line = self._find_line(item_id)
+        self.data['lines'].remove(line)
+        self._save()
+
+    def clear(self):
+        self._data = {'next': 1, 'lines': []}
+        self._save()
+
+    def materialize(self, user):
+        """
+        Transfère le panier anonyme dans le panier en base de l'utilisateur, puis le vide.
+        Appelé à la connexion.
+        """
+        items = self.resolve_items()
+        if not items:
+            return None
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(user=user)
+            existing = {
+                (item.product_id, item.option_signature): item
+                for item in CartItem.objects.filter(cart=cart)
+            }
+            to_update, to_create = [], []
+            for item in items:
+                current = existing.get((item.product.id, item.option_signature))
+                if current:
+                    current.quantity += item.quantity
+                    to_update.append(current)
+                else:
+                    cart_item = CartItem(
+                        cart=cart,
+                        product=item.product,
+                        quantity=item.quantity,
+                        unit_price=item.unit_price,
+                        option_signature=item.option_signature,
+                    )
+                    to_create.append((cart_item, item.selected_options))
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+            CartItem.objects.bulk_create([cart_item for cart_item, options in to_create])
+            Through = CartItem.selected_options.through
+            Through.objects.bulk_create([
+                Through(cartitem_id=cart_item.id, variantoption_id=option.id)
+                for cart_item, options in to_create
+                for option in options
+            ])
+            cart.recalculate_totals()
+        self.clear()
+        return cart
+
+    def update_response(self, response):
+        if self._changed:
+            self.store_data(self.data, response)
+        return response
+
+
+class SignedCookieCartStorage(GuestCartStorage):
+    """
+    Panier anonyme stocké intégralement dans un cookie signé (aucune écriture serveur).
+    """
+    salt = 'cart.storage.SignedCookieCartStorage'
+
+    def load_data(self):
+        value = self.request.get_signed_cookie(self.cookie_name, default=None, salt=self.salt)
+        if not value:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def store_data(self, data, response):
+        if not data['lines']:
+            response.delete_cookie(self.cookie_name)
+            return
+        response.set_signed_cookie(
+            self.cookie_name,
+            json.dumps(data, separators=(',', ':')),
+            salt=self.salt,
+            max_age=self.cookie_age,
+            httponly=True,
+            samesite='Lax',
+        )
+
+
+class CacheCartStorage(GuestCartStorage):
+    """
+    Panier anonyme stocké dans le cache partagé par les workers (voir CACHES) ; le cookie
+    signé ne contient qu'un jeton aléatoire.
+    """
+    salt = 'cart.storage.CacheCartStorage'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.token = request.get_signed_cookie(self.cookie_name, default=None, salt=self.salt)
+
+    def cache_key(self):
+        return f'cart:guest:{self.token}'
+
+    async def aupdate_response(self, response):
+        # Écriture dans le cache partagé : dans un thread, pour ne pas bloquer la boucle d'événements
+        return await sync_to_async(self.update_response)(response)
+
+    def load_data(self):
+        if not self.token:
+            return None
+        return cache.get(self.cache_key())
+
+    def store_data(self, data, response):
+        if not data['lines']:
+            if self.token:
+                cache.delete(self.cache_key())
+                response.delete_cookie(self.cookie_name)
+            return
+        if not self.token:
+            self.token = secrets.token_hex(16)
+        cache.set(self.cache_key(), data, self.cookie_age)
+        response.set_signed_cookie(
+            self.cookie_name,
+            self.token,
+            salt=self.salt,
+            max_age=self.cookie_age,
+            httponly=True,
+            samesite='Lax',
+        )
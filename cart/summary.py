@@ -0,0 +1,124 @@
+"""
+Résumé du panier (nombre de lignes et total TTC) servi depuis le cache.
+
+Chaque panier est identifié par une clé de propriétaire (``user:<id>``, ``session:<clé>``)
+associée à un numéro de version remplacé à chaque mutation. Un panier anonyme hors base
+est identifié par l'empreinte de son contenu (``guest:<empreinte>``) : une mutation
+change la clé elle-même, sans écrire de version.
+Le résumé mis en cache porte la version avec laquelle il a été calculé : il n'est
+servi que si elle est encore la version courante, sinon il est recalculé.
+
+Versions et résumés sont dans le cache partagé par les workers (voir CACHES) : une
+mutation traitée par un worker invalide le résumé pour tous. Une mutation faite dans
+une transaction change encore la version au commit, pour qu'un résumé recalculé
+entre-temps depuis l'ancien contenu ne soit pas servi. Les versions expirent au bout
+de VERSION_TIMEOUT : une version disparue est recréée, le résumé recalculé.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+SUMMARY_TIMEOUT = 300
+VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(owner):
+    return f'cart:version:{owner}'
+
+
+def _summary_key(owner):
+    return f'cart:summary:{owner}'
+
+
+def _set_new_version(owner):
+    # Nouvelle valeur plutôt qu'incr : une version expirée puis recréée ne reprend pas une valeur déjà vue
+    cache.set(_version_key(owner), time.time_ns(), VERSION_TIMEOUT)
+
+
+def bump_cart_version(owner):
+    """Invalide le résumé du panier de `owner` en changeant sa version (et de nouveau au commit)."""
+    if owner is None:
+        return
+    _set_new_version(owner)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _set_new_version(owner))
+
+
+def get_cart_version(owner):
+    if owner is None:
+        return 0
+    version = cache.get(_version_key(owner))
+    if version is None:
+        version = time.time_ns()
+        cache.add(_version_key(owner), version, VERSION_TIMEOUT)
+        version = cache.get(_version_key(owner), version)
+    return version
+
+
+async def aget_cart_version(owner):
+    if owner is None:
+        return 0
+    version = await cache.aget(_version_key(owner))
+    if version is None:
+        version = time.time_ns()
+        await cache.aadd(_version_key(owner), version, VERSION_TIMEOUT)
+        version = await cache.aget(_version_key(owner), version)
+    return version
+
+
+def _format_etag(owner, version):
+    owner_hash = hashlib.md5(str(owner).encode()).hexdigest()[:12]
+    return f'"{owner_hash}-{version}"'
+
+
+def get_cart_etag(owner):
+    return _format_etag(owner, get_cart_version(owner))
+
+
+async def aget_cart_etag(owner):
+    return _format_etag(owner, await aget_cart_version(owner))
+
+
+def get_cart_summary(storage):
+    """
+    Renvoie le résumé du panier du stockage, depuis le cache si sa version est à jour.
+    """
+    owner = storage.owner_key()
+    if owner is None:
+        return {'version': 0, 'cart_item_count': 0, 'cart_total': 0.0}
+    version = get_cart_version(owner)
+    summary = cache.get(_summary_key(owner))
+    if summary is not None and summary['version'] == version:
+        return summary
+    summary = _compute_summary(storage, version)
+    cache.set(_summary_key(owner), summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def _compute_summary(storage, version):
+    # Même total TTC que la page panier, /cart/data/ et le checkout
+    return {
+        'version': version,
+        'cart_item_count': storage.item_count,
+        'cart_total': float(storage.pricing().ttc),
+    }
+
+
+async def aget_cart_summary(storage):
+    """
+    Variante asynchrone de get_cart_summary : seul un résumé périmé touche la base,
+    dans un thread via sync_to_async.
+    """
+    owner = storage.owner_key()
+    if owner is None:
+        return {'version': 0, 'cart_item_count': 0, 'cart_total': 0.0}
+    version = await aget_cart_version(owner)
+    summary = await cache.aget(_summary_key(owner))
+    if summary is not None and summary['version'] == version:
+        return summary
+    summary = await sync_to_async(_compute_summary)(storage, version)
+    await cache.aset(_summary_key(owner), summary, SUMMARY_TIMEOUT)
+    return summary
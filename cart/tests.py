@@ -1,3 +1,815 @@
-from django.test import TestCase
+"""
+Tests for the cart app.
+"""
 
-# Create your tests here.
+import importlib
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.urls import include, path
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from wagtail.models import Page
+
+from cart import async_views
+from cart.models import Cart, CartItem
+from cart.serializers import serialize_cart
+from cart.storage import DatabaseCartStorage, SignedCookieCartStorage
+from product.models import ProductPage, ProductVariant, VariantOption
+
+
+def create_product(title, price):
+    """Create a live ProductPage under the root page."""
+    product = ProductPage(title=title, slug=title.lower().replace(' ', '-'), price=Decimal(price))
+    Page.get_first_root_node().add_child(instance=product)
+    return product
+
+
+# Pages rendered in tests: no collectstatic manifest
+STATIC_STORAGES = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class CartSerializerTest(TestCase):
+    """Test the single-pass cart serializer."""
+
+    def setUp(self):
+        self.request = RequestFactory().get('/cart/data/')
+        self.variant = ProductVariant.objects.create(name="Taille")
+        self.cart = Cart.objects.create(session_key="serializer")
+
+    def add_lines(self, count):
+        """Add `count` lines, each with its own product and option."""
+        start = self.cart.items.count()
+        for index in range(start, start + count):
+            product = create_product(f"Produit {index}", "10.00")
+            option = VariantOption.objects.create(
+                variant=self.variant, name=f"Option {index}", additional_price=Decimal("1.50")
+            )
+            item = CartItem.objects.create(
+                cart=self.cart,
+                product=product,
+                quantity=2,
+                unit_price=Decimal("11.50"),
+                option_signature=str(option.id),
+            )
+            item.selected_options.add(option)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            serialize_cart(self.cart, self.request)
+        return len(context.captured_queries)
+
+    def test_serialized_values(self):
+        """Test items, count and total are computed in the same pass."""
+        self.add_lines(2)
+        data = serialize_cart(self.cart, self.request)
+        self.assertEqual(data['cart_item_count'], 2)
+        self.assertEqual(data['cart_total'], 46.0)
+        first = data['items'][0]
+        self.assertEqual(first['product_title'], "Produit 0")
+        self.assertEqual(first['unit_price'], 10.0)
+        self.assertEqual(first['total_price'], 23.0)
+        self.assertEqual(first['selected_options'], ["Taille: Option 0"])
+
+    def test_query_count_is_constant(self):
+        """Test the number of queries does not grow with the cart."""
+        self.add_lines(1)
+        self.count_queries()  # Warm the site root paths cache
+        small = self.count_queries()
+        self.add_lines(9)
+        large = self.count_queries()
+        self.assertEqual(small, large)
+
+
+class GuestCartStorageTest(TestCase):
+    """Test the signed-cookie storage used for anonymous carts."""
+
+    def setUp(self):
+        self.product = create_product("Produit", "10.00")
+        self.variant = ProductVariant.objects.create(name="Taille")
+        self.option = VariantOption.objects.create(
+            variant=self.variant, name="Grand", additional_price=Decimal("2.00")
+        )
+
+    def add(self, **data):
+        return self.client.post(f"/cart/add/{self.product.id}/", data).json()
+
+    def test_anonymous_cart_stays_out_of_database(self):
+        """Test anonymous cart mutations write no Cart or CartItem rows."""
+        self.add(variant_1=str(self.option.id))
+        data = self.add(variant_1=str(self.option.id))
+        self.assertEqual(data['cart_item_count'], 1)
+        self.assertEqual(data['cart_total'], 24.0)
+        self.assertEqual(Cart.objects.count(), 0)
+        self.assertEqual(CartItem.objects.count(), 0)
+
+        cart_data = self.client.get("/cart/data/").json()
+        self.assertEqual(cart_data['items'][0]['quantity'], 2)
+        self.assertEqual(cart_data['items'][0]['selected_options'], ["Taille: Grand"])
+
+    def test_update_and_remove(self):
+        """Test quantity updates and removals on the cookie cart."""
+        self.add()
+        item_id = self.client.get("/cart/data/").json()['items'][0]['id']
+        data = self.client.post(f"/cart/update/{item_id}/", {'quantity': '3'}).json()
+        self.assertEqual(data['cart_total'], 30.0)
+        data = self.client.post(f"/cart/remove/{item_id}/").json()
+        self.assertEqual(data['cart_item_count'], 0)
+
+    def test_summary_keyed_on_cart_content(self):
+        """Test guest mutations change the summary key instead of writing a cart version."""
+        with mock.patch('cart.summary._set_new_version') as set_new_version:
+            self.add()
+            first = self.client.get("/cart/summary/")
+            self.add()
+            second = self.client.get("/cart/summary/")
+        set_new_version.assert_not_called()
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual((first.json()['cart_total'], second.json()['cart_total']), (10.0, 20.0))
+
+    def test_login_materializes_cart(self):
+        """Test the guest cart becomes database rows for the user at login."""
+        from django.contrib.auth import get_user_model
+        user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        self.add(variant_1=str(self.option.id))
+        self.add()
+        self.client.post("/accounts/connexion/", {'username': "client", 'password': "motdepasse"})
+
+        cart = Cart.objects.get(user=user)
+        self.assertEqual(cart.item_count, 2)
+        self.assertEqual(cart.subtotal, Decimal("22.00"))
+        line = cart.items.get(option_signature=str(self.option.id))
+        self.assertEqual(list(line.selected_options.all()), [self.option])
+
+
+@override_settings(CART_GUEST_STORAGE='cart.storage.CacheCartStorage')
+class CacheCartStorageTest(GuestCartStorageTest):
+    """Run the guest storage tests against the cache backend."""
+
+
+@override_settings(CART_GUEST_STORAGE='cart.storage.DatabaseCartStorage')
+class DatabaseGuestCartStorageTest(TestCase):
+    """Test the historical database backend stays selectable."""
+
+    def test_anonymous_cart_in_database(self):
+        """Test anonymous carts are stored as session Cart rows."""
+        product = create_product("Produit", "10.00")
+        data = self.client.post(f"/cart/add/{product.id}/").json()
+        self.assertEqual(data['cart_total'], 10.0)
+        cart = Cart.objects.get()
+        self.assertEqual(cart.session_key, self.client.session.session_key)
+        self.assertEqual(cart.item_count, 1)
+
+    def test_login_merges_session_cart(self):
+        """Test the session cart is merged into the existing user cart at login."""
+        from django.contrib.auth import get_user_model
+        user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        shared = create_product("Commun", "10.00")
+        guest_only = create_product("Invite", "5.00")
+        user_cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=user_cart, product=shared, quantity=1, unit_price=Decimal("10.00"))
+        user_cart.recalculate_totals()
+
+        self.client.post(f"/cart/add/{shared.id}/")
+        self.client.post(f"/cart/add/{guest_only.id}/")
+        self.client.post("/accounts/connexion/", {'username': "client", 'password': "motdepasse"})
+
+        self.assertEqual(Cart.objects.count(), 1)
+        user_cart.refresh_from_db()
+        self.assertEqual(user_cart.item_count, 2)
+        self.assertEqual(user_cart.subtotal, Decimal("25.00"))
+        self.assertEqual(user_cart.items.get(product=shared).quantity, 2)
+
+
+class CartMergeTest(TestCase):
+    """Test the set-based merge of two database carts."""
+
+    def setUp(self):
+        self.products = [create_product(f"Produit {index}", "10.00") for index in range(20)]
+
+    def build_carts(self, size):
+        """Two carts sharing half of their `size` lines."""
+        target = Cart.objects.create(session_key=f"target-{size}")
+        source = Cart.objects.create(session_key=f"source-{size}")
+        for product in self.products[:size]:
+            CartItem.objects.create(cart=target, product=product, unit_price=product.price)
+        for product in self.products[size // 2:size + size // 2]:
+            CartItem.objects.create(cart=source, product=product, quantity=2, unit_price=product.price)
+        return target, source
+
+    def merge_queries(self, size):
+        target, source = self.build_carts(size)
+        with CaptureQueriesContext(connection) as context:
+            target.merge(source)
+        return target, len(context.captured_queries)
+
+    def test_merge_result(self):
+        """Test quantities are summed for matching lines and other lines are moved."""
+        target, queries = self.merge_queries(4)
+        self.assertFalse(Cart.objects.filter(session_key="source-4").exists())
+        quantities = sorted(target.items.values_list('quantity', flat=True))
+        self.assertEqual(quantities, [1, 1, 2, 2, 3, 3])
+        self.assertEqual(target.item_count, 6)
+        self.assertEqual(target.subtotal, Decimal("120.00"))
+
+    def test_merge_query_count_is_constant(self):
+        """Test the merge cost does not depend on the number of lines."""
+        small = self.merge_queries(2)[1]
+        large = self.merge_queries(12)[1]
+        self.assertEqual(small, large)
+
+
+class CartTotalsTest(TestCase):
+    """Test the stored cart totals and the prices frozen on the lines."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(username="client", email="client@example.com")
+        self.product = create_product("Produit", "10.00")
+        self.option = VariantOption.objects.create(
+            variant=ProductVariant.objects.create(name="Taille"), name="Grand", additional_price=Decimal("2.50")
+        )
+
+    def storage(self):
+        request = RequestFactory().post("/")
+        request.user = self.user
+        return DatabaseCartStorage(request)
+
+    def test_apply_delta_from_stale_instances(self):
+        """Test deltas applied through two stale instances both reach the stored totals."""
+        cart = Cart.objects.create(user=self.user)
+        other = Cart.objects.get(pk=cart.pk)
+        cart.apply_delta(Decimal("10.00"), 1)
+        other.apply_delta(Decimal("5.00"), 1)
+        self.assertEqual((other.subtotal, other.item_count), (Decimal("15.00"), 2))
+        cart.refresh_from_db()
+        self.assertEqual((cart.subtotal, cart.item_count), (Decimal("15.00"), 2))
+
+    def test_unit_price_captured_with_options(self):
+        """Test the line stores the product price plus its option supplements when added."""
+        storage = self.storage()
+        item = storage.add(self.product, [self.option])
+        storage.add(self.product, [self.option])
+        item.refresh_from_db()
+        self.assertEqual(item.unit_price, Decimal("12.50"))
+        self.assertEqual(item.quantity, 2)
+        self.assertEqual(storage.get_cart().subtotal, Decimal("25.00"))
+
+    def test_catalogue_change_keeps_cart_price(self):
+        """Test a catalogue price change does not reach lines already in a cart."""
+        storage = self.storage()
+        item = storage.add(self.product, [])
+        ProductPage.objects.filter(pk=self.product.pk).update(price=Decimal("15.00"))
+        storage.update(item.id, 2)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.items.get().unit_price, Decimal("10.00"))
+        self.assertEqual(cart.subtotal, Decimal("20.00"))
+
+    def test_update_uses_stored_quantity(self):
+        """Test an update computes its delta from the quantity in the database."""
+        storage = self.storage()
+        item = storage.add(self.product, [])
+        # Another request changed the line since it was read
+        CartItem.objects.filter(pk=item.pk).update(quantity=3)
+        Cart.objects.filter(pk=item.cart_id).update(subtotal=Decimal("30.00"))
+        storage.update(item.id, 5)
+        cart = Cart.objects.get(pk=item.cart_id)
+        self.assertEqual(cart.subtotal, Decimal("50.00"))
+        storage.remove(item.id)
+        cart.refresh_from_db()
+        self.assertEqual((cart.subtotal, cart.item_count), (Decimal("0.00"), 0))
+
+    def test_recalculate_totals(self):
+        """Test totals are rebuilt from the lines, with catalogue prices when repricing."""
+        storage = self.storage()
+        storage.add(self.product, [self.option])
+        storage.add(self.product, [])
+        cart = storage.get_cart()
+        Cart.objects.filter(pk=cart.pk).update(subtotal=Decimal("99.00"), item_count=7)
+        cart.recalculate_totals()
+        self.assertEqual((cart.subtotal, cart.item_count), (Decimal("22.50"), 2))
+        ProductPage.objects.filter(pk=self.product.pk).update(price=Decimal("20.00"))
+        cart.recalculate_totals()
+        self.assertEqual(cart.subtotal, Decimal("22.50"))
+        cart.recalculate_totals(reprice=True)
+        self.assertEqual(cart.subtotal, Decimal("42.50"))
+        self.assertEqual(
+            sorted(cart.items.values_list('unit_price', flat=True)), [Decimal("20.00"), Decimal("22.50")]
+        )
+
+    def test_reconcile_carts_command(self):
+        """Test reconcile_carts fixes drifted totals and only reprices with --reprice."""
+        storage = self.storage()
+        storage.add(self.product, [])
+        cart = storage.get_cart()
+        Cart.objects.create(session_key="vide")
+        Cart.objects.filter(pk=cart.pk).update(subtotal=Decimal("3.00"))
+        ProductPage.objects.filter(pk=self.product.pk).update(price=Decimal("12.00"))
+
+        out = StringIO()
+        call_command('reconcile_carts', stdout=out)
+        self.assertIn("Paniers réconciliés : 1 corrigé(s).", out.getvalue())
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, Decimal("10.00"))
+
+        out = StringIO()
+        call_command('reconcile_carts', '--reprice', stdout=out)
+        self.assertIn("Paniers réconciliés : 1 corrigé(s).", out.getvalue())
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, Decimal("12.00"))
+        self.assertEqual(cart.items.get().unit_price, Decimal("12.00"))
+
+
+class CartUpdateConcurrencyTest(TransactionTestCase):
+    """Test a quantity update racing another one on the same line leaves consistent totals."""
+
+    serialized_rollback = True
+
+    def test_update_between_read_and_write(self):
+        from django.contrib.auth import get_user_model
+        from cart import storage as storage_module
+        user = get_user_model().objects.create_user(username="client", email="client@example.com")
+        product = create_product("Produit", "10.00")
+        cart = Cart.objects.create(user=user, subtotal=Decimal("10.00"), item_count=1)
+        item = CartItem.objects.create(cart=cart, product=product, unit_price=product.price)
+
+        line_read, other_tried = threading.Event(), threading.Event()
+        original_get = storage_module.get_object_or_404
+
+        def get_then_pause(*args, **kwargs):
+            line = original_get(*args, **kwargs)
+            if threading.current_thread().name == "first":
+                line_read.set()
+                other_tried.wait(5)
+            return line
+
+        def update(quantity):
+            try:
+                request = RequestFactory().post("/")
+                request.user = user
+                if threading.current_thread().name == "second":
+                    line_read.wait(5)
+                for attempt in range(100):
+                    try:
+                        DatabaseCartStorage(request).update(item.id, quantity)
+                        return
+                    except OperationalError:
+                        # SQLite locks the whole database: let the first update finish, then retry
+                        other_tried.set()
+                        time.sleep(0.01)
+            finally:
+                other_tried.set()
+                connection.close()
+
+        storage_module.get_object_or_404 = get_then_pause
+        self.addCleanup(setattr, storage_module, 'get_object_or_404', original_get)
+        threads = [
+            threading.Thread(target=update, args=(3,), name="first"),
+            threading.Thread(target=update, args=(5,), name="second"),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        item.refresh_from_db()
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, item.unit_price * item.quantity)
+
+
+class CartItemUniquenessTest(TestCase):
+    """Test one line per (cart, product, options) is enforced by the database."""
+
+    def test_duplicate_line_rejected(self):
+        product = create_product("Produit", "10.00")
+        cart = Cart.objects.create(session_key="unique")
+        CartItem.objects.create(cart=cart, product=product, option_signature="1,2")
+        CartItem.objects.create(cart=cart, product=product, option_signature="1")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(cart=cart, product=product, option_signature="1,2")
+        self.assertEqual(cart.items.count(), 2)
+
+
+class OptionSignatureMigrationTest(TransactionTestCase):
+    """Test migration 0004 merges existing duplicate lines before 0005 adds the constraint."""
+
+    serialized_rollback = True
+
+    def test_duplicates_merged(self):
+        from django.db.migrations.executor import MigrationExecutor
+        product = create_product("Produit", "10.00")
+        variant = ProductVariant.objects.create(name="Taille")
+        small = VariantOption.objects.create(variant=variant, name="Petit")
+        large = VariantOption.objects.create(variant=variant, name="Grand")
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([('cart', '0003_cart_totals')])
+        old_apps = executor.loader.project_state([('cart', '0003_cart_totals')]).apps
+        OldCart, OldCartItem = old_apps.get_model('cart', 'Cart'), old_apps.get_model('cart', 'CartItem')
+        cart = OldCart.objects.create(session_key="doublons", item_count=4, subtotal=Decimal("60.00"))
+        lines = [(2, [small, large]), (1, [large, small]), (1, [small]), (2, [])]
+        for quantity, options in lines:
+            item = OldCartItem.objects.create(
+                cart=cart, product_id=product.pk, quantity=quantity, unit_price=Decimal("10.00")
+            )
+            item.selected_options.set([option.pk for option in options])
+
+        # Small batches: the signatures are computed over several pk ranges
+        backfill = importlib.import_module('cart.migrations.0004_cartitem_option_signature')
+        executor = MigrationExecutor(connection)
+        with mock.patch.object(backfill, 'BATCH_SIZE', 2):
+            executor.migrate(executor.loader.graph.leaf_nodes())
+
+        cart = Cart.objects.get(session_key="doublons")
+        signatures = dict(cart.items.values_list('option_signature', 'quantity'))
+        self.assertEqual(signatures, {f"{small.pk},{large.pk}": 3, f"{small.pk}": 1, "": 2})
+        self.assertEqual(cart.item_count, 3)
+        self.assertEqual(cart.subtotal, Decimal("60.00"))
+
+
+class ConcurrentAddTest(TransactionTestCase):
+    """Test two requests adding the same product at once end with a single line."""
+
+    serialized_rollback = True
+
+    def test_double_add_single_line(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.query import QuerySet
+        user = get_user_model().objects.create_user(username="client", email="client@example.com")
+        product = create_product("Produit", "10.00")
+        Cart.objects.create(user=user)
+
+        # Both requests get past get_or_create's lookup before either creates the line
+        barrier = threading.Barrier(2)
+        original_create = QuerySet.create
+
+        def create_after_both_looked_up(queryset, **kwargs):
+            if queryset.model is CartItem and not barrier.broken:
+                try:
+                    barrier.wait(5)
+                except threading.BrokenBarrierError:
+                    pass
+            return original_create(queryset, **kwargs)
+
+        def add():
+            try:
+                request = RequestFactory().post("/")
+                request.user = user
+                for attempt in range(100):
+                    try:
+                        DatabaseCartStorage(request).add(product, [])
+                        return
+                    except OperationalError:
+                        # SQLite locks the whole database: retry
+                        barrier.abort()
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        QuerySet.create = create_after_both_looked_up
+        self.addCleanup(setattr, QuerySet, 'create', original_create)
+        threads = [threading.Thread(target=add) for index in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        cart = Cart.objects.get(user=user)
+        self.assertEqual(list(cart.items.values_list('quantity', flat=True)), [2])
+        self.assertEqual((cart.item_count, cart.subtotal), (1, Decimal("20.00")))
+
+
+class PurgeCartsCommandTest(TestCase):
+    """Test the purge_carts management command."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        product = create_product("Produit", "10.00")
+        option = VariantOption.objects.create(variant=ProductVariant.objects.create(name="Taille"), name="Grand")
+        old = timezone.now() - timedelta(days=60)
+        user = get_user_model().objects.create_user(username="client", email="client@example.com")
+        self.carts = {
+            'old': Cart.objects.create(session_key="old", created_at=old),
+            'recent': Cart.objects.create(session_key="recent"),
+            'user': Cart.objects.create(user=user, created_at=old),
+        }
+        for cart in self.carts.values():
+            item = CartItem.objects.create(cart=cart, product=product, unit_price=product.price)
+            item.selected_options.add(option)
+
+    def test_dry_run_deletes_nothing(self):
+        """Test the dry-run mode only reports counts."""
+        out = StringIO()
+        call_command('purge_carts', '--dry-run', stdout=out)
+        self.assertIn("1 panier(s), 1 ligne(s) et 1 option(s)", out.getvalue())
+        self.assertEqual(Cart.objects.count(), 3)
+
+    def test_purge_old_anonymous_carts(self):
+        """Test old anonymous carts are deleted with their lines and options, in batches."""
+        for index in range(5):
+            Cart.objects.create(session_key=f"old-{index}", created_at=timezone.now() - timedelta(days=45))
+        call_command('purge_carts', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(
+            set(Cart.objects.values_list('session_key', flat=True)),
+            {'recent', None},
+        )
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(CartItem.selected_options.through.objects.count(), 2)
+
+
+class BatchUpdateCartTest(TestCase):
+    """Test the batched cart mutation endpoint."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        self.products = [create_product(f"Produit {index}", "10.00") for index in range(3)]
+        self.option = VariantOption.objects.create(
+            variant=ProductVariant.objects.create(name="Taille"), name="Grand", additional_price=Decimal("1.00")
+        )
+
+    def batch(self, operations):
+        import json
+        return self.client.post(
+            "/cart/batch/", json.dumps({'operations': operations}), content_type='application/json'
+        )
+
+    def test_operations_applied_in_one_request(self):
+        """Test adds, updates and removes are applied with a single totals update."""
+        self.client.force_login(self.user)
+        response = self.batch([
+            {'op': 'add', 'product_id': self.products[0].id, 'options': [self.option.id]},
+            {'op': 'add', 'product_id': self.products[1].id},
+            {'op': 'add', 'product_id': self.products[2].id},
+        ])
+        self.assertEqual(response.json()['cart_total'], 31.0)
+        cart = Cart.objects.get(user=self.user)
+        first, second, third = cart.items.order_by('id')
+        data = self.batch([
+            {'op': 'update', 'item_id': first.id, 'quantity': 3},
+            {'op': 'remove', 'item_id': second.id},
+            {'op': 'add', 'product_id': self.products[2].id},
+        ]).json()
+        self.assertEqual(data['cart_item_count'], 2)
+        self.assertEqual(data['cart_total'], 53.0)
+        cart.recalculate_totals()
+        self.assertEqual(cart.subtotal, Decimal("53.00"))
+
+    def test_failed_operation_rolls_back_batch(self):
+        """Test a missing line cancels every operation of the batch."""
+        self.client.force_login(self.user)
+        self.batch([{'op': 'add', 'product_id': self.products[0].id}])
+        response = self.batch([
+            {'op': 'add', 'product_id': self.products[1].id},
+            {'op': 'remove', 'item_id': 999999},
+        ])
+        self.assertEqual(response.status_code, 404)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.subtotal), (1, Decimal("10.00")))
+        self.assertEqual(cart.items.count(), 1)
+
+    def test_failed_guest_remove_keeps_line(self):
+        """Test a failing batch answers an error and leaves the removed line for the page to reload."""
+        self.batch([{'op': 'add', 'product_id': self.products[0].id}, {'op': 'add', 'product_id': self.products[1].id}])
+        first = self.client.get("/cart/data/").json()['items'][0]['id']
+        response = self.batch([{'op': 'remove', 'item_id': first}, {'op': 'remove', 'item_id': 999999}])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.json()['success'])
+        data = self.client.get("/cart/data/").json()
+        self.assertIn(first, [item['id'] for item in data['items']])
+        self.assertEqual((data['cart_item_count'], data['cart_total']), (2, 20.0))
+
+    def test_guest_batch_and_invalid_payload(self):
+        """Test the guest storage and payload validation."""
+        data = self.batch([
+            {'op': 'add', 'product_id': self.products[0].id},
+            {'op': 'add', 'product_id': self.products[0].id},
+        ]).json()
+        self.assertEqual((data['cart_item_count'], data['cart_total']), (1, 20.0))
+        self.assertEqual(self.batch([{'op': 'explode'}]).status_code, 400)
+        self.assertEqual(self.client.post("/cart/batch/", "[]", content_type='application/json').status_code, 400)
+
+
+class CartSummaryTest(TestCase):
+    """Test the cached cart badge summary."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        self.product = create_product("Produit", "10.00")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_summary_served_from_cache(self):
+        """Test a repeated summary request is answered without any query."""
+        self.client.post(f"/cart/add/{self.product.id}/")
+        self.assertEqual(self.client.get("/cart/summary/").json()['cart_total'], 10.0)
+        with self.assertNumQueries(0):
+            data = self.client.get("/cart/summary/").json()
+        self.assertEqual((data['cart_item_count'], data['cart_total']), (1, 10.0))
+        # Signed in, only the session and the user are loaded
+        self.client.force_login(self.user)
+        self.client.post(f"/cart/add/{self.product.id}/")
+        self.client.get("/cart/summary/")
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get("/cart/summary/").json()
+        self.assertEqual((data['cart_item_count'], data['cart_total']), (1, 10.0))
+        self.assertEqual(len(queries), 2)
+        self.assertFalse([query for query in queries if 'cart_' in query['sql']])
+
+    def test_mutation_invalidates_summary(self):
+        """Test adds and cart deletion bump the version."""
+        self.client.force_login(self.user)
+        self.client.post(f"/cart/add/{self.product.id}/")
+        first = self.client.get("/cart/summary/")
+        self.client.post(f"/cart/add/{self.product.id}/")
+        second = self.client.get("/cart/summary/")
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(second.json()['cart_total'], 20.0)
+        Cart.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get("/cart/summary/").json()['cart_item_count'], 0)
+
+    def test_version_bumped_again_on_commit(self):
+        """Test a summary computed before the mutation commits is not served afterwards."""
+        from django.db import transaction
+        from cart.summary import bump_cart_version, get_cart_version
+        owner = f"user:{self.user.pk}"
+        before = get_cart_version(owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                bump_cart_version(owner)
+                during = get_cart_version(owner)
+        self.assertNotIn(get_cart_version(owner), (before, during))
+
+    def test_versions_expire(self):
+        """Test version keys carry a timeout and a lost version only forces a recompute."""
+        from django.core.cache import cache
+        from cart.summary import _version_key
+        self.client.force_login(self.user)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set, \
+                mock.patch.object(cache, 'add', wraps=cache.add) as cache_add:
+            self.client.post(f"/cart/add/{self.product.id}/")
+            first = self.client.get("/cart/summary/")
+        timeouts = [
+            args[2] for args, kwargs in cache_set.call_args_list + cache_add.call_args_list
+            if args[0] == _version_key(f"user:{self.user.pk}")
+        ]
+        self.assertTrue(timeouts)
+        self.assertNotIn(None, timeouts)
+        cache.delete(_version_key(f"user:{self.user.pk}"))
+        second = self.client.get("/cart/summary/", HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['cart_total'], 10.0)
+
+    def test_etag_revalidation(self):
+        """Test an unchanged cart answers 304, a changed one 200."""
+        response = self.client.get("/cart/summary/")
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.client.get("/cart/summary/", HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.client.post(f"/cart/add/{self.product.id}/")
+        response = self.client.get("/cart/summary/")
+        self.assertEqual(response.json()['cart_item_count'], 1)
+        self.assertEqual(self.client.get("/cart/summary/", HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.client.post(f"/cart/add/{self.product.id}/")
+        self.assertEqual(self.client.get("/cart/summary/", HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+
+@override_settings(STORAGES=STATIC_STORAGES)
+class CartTaxTotalsTest(TestCase):
+    """Test every cart endpoint reports the same TTC total as the cart page and checkout."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from taxes.models import TaxMatrice, TaxProduct, TaxUser
+        cache.clear()
+        tax_product = TaxProduct.objects.create(tax_name="Normal")
+        tax_user = TaxUser.objects.create(tax_name="Particulier")
+        TaxMatrice.objects.create(tax_product=tax_product, tax_user=tax_user, tax_rate=Decimal("20.00"), tax_account="445710")
+        self.user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse", tax_user=tax_user,
+        )
+        self.product = create_product("Produit", "10.00")
+        self.product.tax_product = tax_product
+        self.product.save()
+
+    def totals(self):
+        item = CartItem.objects.filter(cart__user=self.user).first()
+        return [
+            self.client.post(f"/cart/add/{self.product.id}/").json()['cart_total'],
+            self.client.get("/cart/summary/").json()['cart_total'],
+            self.client.get("/cart/data/").json()['cart_total'],
+            self.client.post(f"/cart/update/{item.id}/", {'quantity': 1}).json()['cart_total'],
+            self.client.post("/cart/batch/", {'operations': []}, content_type='application/json').json()['cart_total'],
+            float(self.client.get("/cart/").context['pricing'].ttc),
+        ]
+
+    def test_totals_include_tax(self):
+        """Test mutations, summary, data and the cart page agree on the taxed total."""
+        self.client.force_login(self.user)
+        self.client.post(f"/cart/add/{self.product.id}/")
+        self.assertEqual(self.totals(), [24.0, 24.0, 24.0, 12.0, 12.0, 12.0])
+
+    def test_default_rate_without_tax_user(self):
+        """Test guests and customers without TaxUser get the store default rate."""
+        from checkout.models import CheckoutSettings
+        CheckoutSettings.objects.create(tax_rate_default=Decimal("5.50"))
+        self.user.tax_user = None
+        self.user.save()
+        self.client.force_login(self.user)
+        self.client.post(f"/cart/add/{self.product.id}/")
+        self.assertEqual(self.totals(), [21.1, 21.1, 21.1, 10.55, 10.55, 10.55])
+        self.client.logout()
+        response = self.client.post(f"/cart/add/{self.product.id}/")
+        self.assertEqual(response.json()['cart_total'], 10.55)
+        self.assertEqual(self.client.get("/cart/data/").json()['cart_total'], 10.55)
+
+
+# Routes of the async views, used through ROOT_URLCONF by AsyncCartViewsTest
+urlpatterns = [
+    path('cart/', include([
+        path('add/<int:product_id>/', async_views.add_to_cart),
+        path('update/<int:item_id>/', async_views.update_cart),
+        path('remove/<int:item_id>/', async_views.remove_from_cart),
+        path('batch/', async_views.batch_update_cart),
+        path('data/', async_views.get_cart_data),
+        path('summary/', async_views.cart_summary),
+    ])),
+]
+
+
+@override_settings(ROOT_URLCONF='cart.tests')
+class AsyncCartViewsTest(TestCase):
+    """Test the async cart views behave like the sync ones."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        self.product = create_product("Produit", "10.00")
+
+    async def test_user_cart_mutations(self):
+        """Test add, update, batch and remove through the async views."""
+        await self.async_client.aforce_login(self.user)
+        data = (await self.async_client.post(f"/cart/add/{self.product.id}/")).json()
+        self.assertEqual((data['cart_item_count'], data['cart_total']), (1, 10.0))
+        item = await CartItem.objects.aget(cart__user=self.user)
+        data = (await self.async_client.post(f"/cart/update/{item.id}/", {'quantity': 3})).json()
+        self.assertEqual(data['cart_total'], 30.0)
+        response = await self.async_client.post(
+            "/cart/batch/", {'operations': [{'op': 'remove', 'item_id': 999999}]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 404)
+        data = (await self.async_client.get("/cart/data/")).json()
+        self.assertEqual([line['quantity'] for line in data['items']], [3])
+        data = (await self.async_client.post(f"/cart/remove/{item.id}/")).json()
+        self.assertEqual((data['cart_item_count'], data['cart_total']), (0, 0.0))
+
+    async def test_guest_summary_and_etag(self):
+        """Test the guest cookie cart and summary revalidation."""
+        response = await self.async_client.post(f"/cart/add/{self.product.id}/")
+        self.assertEqual(response.json()['cart_item_count'], 1)
+        response = await self.async_client.get("/cart/summary/")
+        self.assertEqual(response.json()['cart_total'], 10.0)
+        response = await self.async_client.get("/cart/summary/", headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(f"/cart/add/{self.product.id}/")
+        self.assertEqual(response.status_code, 405)
+
+    async def test_middleware_stays_in_event_loop(self):
+        """Test the guest cookie is written to the response without switching to a thread."""
+        threads = []
+        update_response = SignedCookieCartStorage.update_response
+
+        def record(storage, response):
+            threads.append(threading.get_ident())
+            return update_response(storage, response)
+
+        with mock.patch.object(SignedCookieCartStorage, 'update_response', record):
+            response = await self.async_client.post(f"/cart/add/{self.product.id}/")
+        self.assertEqual(threads, [threading.get_ident()])
+        self.assertIn(getattr(settings, 'CART_COOKIE_NAME', 'cart'), response.cookies)
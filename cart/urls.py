@@ -1,13 +1,19 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Sous ASGI, les points d'accès JSON peuvent être servis par leurs variantes asynchrones
+json_views = async_views if getattr(settings, 'CART_ASYNC_VIEWS', False) else views
 
 app_name = 'cart'
 
 urlpatterns = [
     path('', views.cart_detail, name='cart_detail'),
-    path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
-    path('remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
-    path('update/<int:item_id>/', views.update_cart, name='update_cart'),
-    path('data/', views.get_cart_data, name='get_cart_data'),
+    path('add/<int:product_id>/', json_views.add_to_cart, name='add_to_cart'),
+    path('remove/<int:item_id>/', json_views.remove_from_cart, name='remove_from_cart'),
+    path('update/<int:item_id>/', json_views.update_cart, name='update_cart'),
+    path('batch/', json_views.batch_update_cart, name='batch_update_cart'),
+    path('data/', json_views.get_cart_data, name='get_cart_data'),
+    path('summary/', json_views.cart_summary, name='cart_summary'),
     path('proceed-to-checkout/', views.redirect_to_checkout, name='proceed_to_checkout'),
 ]
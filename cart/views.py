@@ -1,40 +1,41 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
-from .models import Cart, CartItem
+from django.http import JsonResponse, Http404
+from .models import Cart
+from .serializers import get_cart_items, price_cart
+from .storage import get_cart_storage
+from .summary import get_cart_etag, get_cart_summary
 from product.models import ProductPage, VariantOption
 from checkout.models import Order
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_GET, etag
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 def get_cart(request):
     """
-    Récupère le panier associé à l'utilisateur authentifié ou à la session.
-    """
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        logger.debug(f"Cart fetched for user {request.user.username}: {cart}")
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-            logger.debug(f"Session created with session_key: {session_key}")
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-        logger.debug(f"Cart fetched for session {session_key}: {cart}")
+    Récupère le panier associé à l'utilisateur authentifié ou au visiteur anonyme.
+    Selon CART_GUEST_STORAGE, le panier anonyme peut ne pas être en base (voir cart.storage).
+    """
+    cart = get_cart_storage(request).get_cart()
+    logger.debug(f"Cart fetched: {cart}")
     return cart
 
+def _totals(storage):
+    """Nombre de lignes et total TTC après une mutation, repris du résumé mis en cache."""
+    summary = get_cart_summary(storage)
+    return {'cart_item_count': summary['cart_item_count'], 'cart_total': summary['cart_total']}
+
 @require_POST
 def add_to_cart(request, product_id):
     """
     Ajoute un produit au panier avec les options sélectionnées.
     """
     try:
-        cart = get_cart(request)
+        storage = get_cart_storage(request)
         product = get_object_or_404(ProductPage, id=product_id)
 
         # Récupérer les options sélectionnées depuis le formulaire
@@ -44,40 +45,23 @@ def add_to_cart(request, product_id):
                 selected_option_ids.append(int(value))
 
         # Filtrer les options valides
-        selected_options = VariantOption.objects.filter(id__in=selected_option_ids)
+        selected_options = list(VariantOption.objects.filter(id__in=selected_option_ids))
 
-        if selected_option_ids and not selected_options.exists():
+        if selected_option_ids and not selected_options:
             logger.error(f"Options sélectionnées invalides pour le produit {product_id}.")
             return JsonResponse({
                 'success': False,
                 'message': 'Options sélectionnées invalides.',
             }, status=400)
 
-        # Vérifier si un CartItem avec le même produit et les mêmes options existe déjà
-        cart_items = CartItem.objects.filter(cart=cart, product=product).prefetch_related('selected_options')
-
-        cart_item = None
-        selected_option_ids_set = set(selected_options.values_list('id', flat=True))
-        for item in cart_items:
-            item_option_ids = set(item.selected_options.values_list('id', flat=True))
-            if item_option_ids == selected_option_ids_set:
-                item.quantity += 1
-                item.save()
-                cart_item = item
-                break
-
-        if not cart_item:
-            # Aucun CartItem correspondant trouvé, en créer un nouveau
-            cart_item = CartItem.objects.create(cart=cart, product=product, quantity=1)
-            cart_item.selected_options.set(selected_options)
+        cart_item = storage.add(product, selected_options)
 
         logger.debug(f"Product added to cart: {product.title}, Quantity: {cart_item.quantity}")
 
         return JsonResponse({
             'success': True,
             'message': 'Produit ajouté au panier avec succès !',
-            'cart_item_count': cart.items.count(),
-            'cart_total': float(cart.total_price),
+            **_totals(storage),
         })
     except Exception as e:
         logger.error(f"Erreur lors de l'ajout au panier: {e}", exc_info=True)
@@ -91,7 +75,11 @@ def cart_detail(request):
     Affiche le détail du panier.
     """
     cart = get_cart(request)
-    return render(request, 'cart/cart_detail.html', {'cart': cart})
+    items = get_cart_items(cart) if isinstance(cart, Cart) else list(cart.items)
+    return render(request, 'cart/cart_detail.html', {
+        'cart': cart,
+        'pricing': price_cart(items, request.user),
+    })
 
 @require_POST
 def remove_from_cart(request, item_id):
@@ -99,15 +87,13 @@ def remove_from_cart(request, item_id):
     Supprime un article du panier.
     """
     try:
-        cart = get_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        cart_item.delete()
-        logger.debug(f"Product removed from cart: {cart_item.product.title}")
+        storage = get_cart_storage(request)
+        storage.remove(item_id)
+        logger.debug(f"Item removed from cart: {item_id}")
         return JsonResponse({
             'success': True,
             'message': 'Produit supprimé du panier.',
-            'cart_item_count': cart.items.count(),
-            'cart_total': float(cart.total_price),
+            **_totals(storage),
         })
     except Exception as e:
         logger.error(f"Erreur lors de la suppression du produit: {e}", exc_info=True)
@@ -122,20 +108,14 @@ def update_cart(request, item_id):
     Met à jour la quantité d'un article dans le panier.
     """
     try:
-        cart = get_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        storage = get_cart_storage(request)
         quantity = int(request.POST.get('quantity', 1))
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-        else:
-            cart_item.delete()
-        logger.debug(f"Cart item updated: {cart_item.product.title}, New Quantity: {cart_item.quantity}")
+        storage.update(item_id, quantity)
+        logger.debug(f"Cart item updated: {item_id}, New Quantity: {quantity}")
         return JsonResponse({
             'success': True,
             'message': 'Quantité mise à jour.',
-            'cart_item_count': cart.items.count(),
-            'cart_total': float(cart.total_price),
+            **_totals(storage),
         })
     except Exception as e:
         logger.error(f"Erreur lors de la mise à jour du panier: {e}", exc_info=True)
@@ -144,62 +124,79 @@ def update_cart(request, item_id):
             'message': 'Erreur lors de la mise à jour du panier.',
         }, status=500)
 
+@require_POST
+def batch_update_cart(request):
+    """
+    Applique en une seule requête une liste d'ajouts, mises à jour et suppressions.
+    Corps JSON attendu : {"operations": [{"op": "add", "product_id": 1, "options": [3]},
+    {"op": "update", "item_id": 5, "quantity": 2}, {"op": "remove", "item_id": 7}]}
+    """
+    try:
+        operations = json.loads(request.body).get('operations')
+        if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+            raise ValueError("Liste d'opérations invalide.")
+        storage = get_cart_storage(request)
+        storage.apply_operations(operations)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.error(f"Lot d'opérations invalide: {e}")
+        return JsonResponse({
+            'success': False,
+            'message': 'Opérations sur le panier invalides.',
+        }, status=400)
+    except Http404:
+        return JsonResponse({
+            'success': False,
+            'message': 'Produit ou article introuvable.',
+        }, status=404)
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour groupée du panier: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de la mise à jour du panier.',
+        }, status=500)
+    logger.debug(f"Cart batch applied: {len(operations)} operations")
+    return JsonResponse({
+        'success': True,
+        'message': 'Panier mis à jour.',
+        **_totals(storage),
+    })
+
+def _cart_summary_etag(request):
+    return get_cart_etag(get_cart_storage(request).owner_key())
+
+@require_GET
+@etag(_cart_summary_etag)
+def cart_summary(request):
+    """
+    Renvoie le nombre d'articles et le total du panier pour le badge de l'en-tête.
+    Servi depuis le cache tant que la version du panier n'a pas changé ; un ETag
+    permet au navigateur de revalider sans retélécharger (304).
+    """
+    try:
+        summary = get_cart_summary(get_cart_storage(request))
+    except Exception as e:
+        logger.error(f"Erreur dans cart_summary: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Erreur lors de la récupération du résumé du panier.',
+        }, status=500)
+    response = JsonResponse({
+        'success': True,
+        'cart_item_count': summary['cart_item_count'],
+        'cart_total': summary['cart_total'],
+    })
+    # Le résumé dépend du visiteur : jamais dans un cache partagé, toujours revalidé
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 def get_cart_data(request):
     """
     Renvoie les données du panier au format JSON.
     """
     try:
-        cart = get_cart(request)
-        items = []
-        for item in cart.items.all():
-            try:
-                options = [f"{option.variant.name}: {option.name}" for option in item.selected_options.all()]
-            except Exception as e:
-                logger.error(f"Erreur lors de la récupération des options pour l'article {item.id}: {e}")
-                options = []
-            
-            try:
-                product_url = item.product.url
-            except Exception as e:
-                logger.error(f"Erreur lors de la récupération de l'URL du produit {item.product.id}: {e}")
-                product_url = '#'
-
-            try:
-                # Utilisez 'file.url' au lieu de 'url'
-                product_image = item.product.featured_image.file.url if item.product.featured_image else ''
-            except Exception as e:
-                logger.error(f"Erreur lors de la récupération de l'image du produit {item.product.id}: {e}")
-                product_image = ''
-
-            try:
-                unit_price = float(item.product.price)
-            except Exception as e:
-                logger.error(f"Erreur lors de la récupération du prix du produit {item.product.id}: {e}")
-                unit_price = 0.0
-
-            try:
-                total_price = float(item.total_price)
-            except Exception as e:
-                logger.error(f"Erreur lors de la récupération du prix total de l'article {item.id}: {e}")
-                total_price = 0.0
-
-            items.append({
-                'id': item.id,
-                'product_title': item.product.title,
-                'product_url': product_url,
-                'product_image': product_image,
-                'unit_price': unit_price,
-                'selected_options': options,
-                'quantity': item.quantity,
-                'total_price': total_price,
-            })
-        logger.debug(f"Cart Data: {cart.items.count()} items, Total: {cart.total_price}")
-        return JsonResponse({
-            'success': True,
-            'cart_item_count': cart.items.count(),
-            'cart_total': float(cart.total_price),
-            'items': items,
-        })
+        data = get_cart_storage(request).serialize()
+        logger.debug(f"Cart Data: {data['cart_item_count']} items, Total: {data['cart_total']}")
+        return JsonResponse({'success': True, **data})
     except Exception as e:
         logger.error(f"Erreur dans get_cart_data: {e}", exc_info=True)
         return JsonResponse({
@@ -212,4 +209,4 @@ def redirect_to_checkout(request):
     cart = get_cart(request)
     if not cart or not cart.items.exists():
         return redirect('cart:cart_detail')
-    return redirect('checkout:checkout')
\ No newline at end of file
+    return redirect('checkout:checkout')
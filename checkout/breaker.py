@@ -0,0 +1,117 @@
+"""
+Disjoncteur (circuit breaker) des appels au prestataire de paiement.
+
+Après ``failure_threshold`` échecs consécutifs (délai dépassé, prestataire injoignable
+ou en erreur 5xx), le disjoncteur s'ouvre : pendant ``reset_timeout`` secondes les
+appels échouent immédiatement au lieu d'immobiliser un worker jusqu'au délai maximal.
+Ensuite, un seul appel d'essai est laissé passer (demi-ouvert) : s'il réussit le
+disjoncteur se referme, sinon il se rouvre pour une nouvelle période.
+
+L'état et les compteurs sont dans le cache Django, partagé par les workers et les
+commandes de gestion (voir CACHES) : tous les workers voient le même disjoncteur et
+la commande ``payment_gateway_status`` affiche son état réel. Les compteurs utilisent
+l'incrément atomique du cache (INCR de Redis) : deux échecs simultanés comptent deux fois.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ['successes', 'failures', 'rejections']
+
+
+class CircuitOpenError(Exception):
+    """Appel refusé sans être tenté : le disjoncteur est ouvert."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def _key(self, suffix):
+        return f'breaker:{self.name}:{suffix}'
+
+    def _incr(self, suffix):
+        key = self._key(suffix)
+        if cache.add(key, 1, None):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Clé expirée ou évincée entre add et incr
+            cache.set(key, 1, None)
+            return 1
+
+    def state(self, now=None):
+        """'closed', 'open' ou 'half_open'."""
+        opened_until = cache.get(self._key('opened_until'))
+        if opened_until is None:
+            return 'closed'
+        return 'open' if (now or time.time()) < opened_until else 'half_open'
+
+    def allow(self):
+        """Le prochain appel peut-il être tenté ? Compte un refus sinon."""
+        state = self.state()
+        # Demi-ouvert : un seul appel d'essai à la fois (add est atomique)
+        if state == 'closed' or (state == 'half_open' and cache.add(self._key('trial'), 1, self.reset_timeout)):
+            return True
+        self._incr('rejections')
+        return False
+
+    def record_success(self):
+        self._incr('successes')
+        if cache.get(self._key('opened_until')) is not None:
+            logger.info(f"Disjoncteur {self.name} refermé")
+        cache.delete_many([self._key('consecutive'), self._key('opened_until'), self._key('trial')])
+
+    def record_failure(self):
+        self._incr('failures')
+        consecutive = self._incr('consecutive')
+        if consecutive >= self.failure_threshold or self.state() != 'closed':
+            cache.set(self._key('opened_until'), time.time() + self.reset_timeout, None)
+            cache.delete(self._key('trial'))
+            logger.warning(
+                f"Disjoncteur {self.name} ouvert pour {self.reset_timeout} s après {consecutive} échec(s) consécutif(s)"
+            )
+
+    def call(self, func, *args, failure_exceptions=(Exception,), **kwargs):
+        """
+        Appelle `func` si le disjoncteur le permet, sinon lève CircuitOpenError.
+        Seules les exceptions `failure_exceptions` comptent comme des pannes du prestataire.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Disjoncteur {self.name} ouvert")
+        try:
+            result = func(*args, **kwargs)
+        except failure_exceptions:
+            self.record_failure()
+            raise
+        except Exception:
+            # Erreur du client (carte refusée, requête invalide) : le prestataire répond
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def metrics(self):
+        """État et compteurs cumulés, pour la supervision."""
+        values = cache.get_many([self._key(name) for name in [*COUNTERS, 'consecutive', 'opened_until']])
+        opened_until = values.get(self._key('opened_until'))
+        metrics = {
+            'name': self.name,
+            'state': self.state(),
+            'consecutive_failures': values.get(self._key('consecutive'), 0),
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout': self.reset_timeout,
+            'retry_in': max(0.0, opened_until - time.time()) if opened_until else 0.0,
+        }
+        metrics.update({name: values.get(self._key(name), 0) for name in COUNTERS})
+        return metrics
+
+    def reset(self):
+        cache.delete_many([self._key(name) for name in [*COUNTERS, 'consecutive', 'opened_until', 'trial']])
@@ -0,0 +1,258 @@
+"""
+Rendu et envoi des emails de commande depuis la boîte d'envoi (OrderEmail).
+
+Les vues ne font qu'appeler ``OrderEmail.enqueue`` ; le rendu MJML, le déchiffrement
+des identifiants SMTP et l'envoi se font hors requête, dans ``send_order_emails``.
+
+Les modèles MJML sont compilés en HTML une seule fois, balises Django comprises
+(commande ``compile_email_templates`` au déploiement, sinon à la première utilisation).
+Le HTML compilé est conservé dans MJML_CACHE_DIR sous l'empreinte SHA-256 de la source :
+chaque email ne coûte plus qu'un rendu de gabarit Django.
+"""
+import hashlib
+import logging
+import os
+import re
+import smtplib
+import subprocess
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.template import engines
+from django.template.loader import get_template
+from django.utils import timezone
+
+from site_settings.provider import get_settings
+from smtp.models import SMTPSettings
+from .models import CheckoutSettings, OrderEmail
+
+logger = logging.getLogger(__name__)
+
+# Délai avant la nouvelle tentative : BASE × 2^(tentatives - 1), plafonné
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 60 * 60
+# Durée pendant laquelle un lot réservé par un worker est ignoré par les autres
+CLAIM_LEASE = 10 * 60
+
+ORDER_CONFIRMATION_TEMPLATE = 'checkout/order_confirmation_email.mjml'
+DJANGO_TAG_RE = re.compile(r'{{.*?}}|{%.*?%}', re.DOTALL)
+
+
+class EmailRenderError(Exception):
+    """L'email ne peut pas être construit (configuration manquante, MJML invalide)."""
+
+
+def compile_mjml(mjml_content):
+    """Compile MJML en HTML via la commande mjml"""
+    try:
+        result = subprocess.run(
+            ['mjml', '-'],  # MJML prend l'entrée standard
+            input=mjml_content,  # Envoie le MJML en entrée
+            text=True,  # Assure que l'entrée est traitée comme du texte
+            capture_output=True,  # Capture la sortie standard
+            check=True  # Lève une exception si la commande échoue
+        )
+        return result.stdout  # Retourne le HTML compilé
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.error(f"Erreur lors de la conversion MJML en HTML : {getattr(e, 'stderr', e)}")
+        return None
+
+
+def _cache_dir():
+    return getattr(settings, 'MJML_CACHE_DIR', os.path.join(settings.BASE_DIR, 'mjml_cache'))
+
+
+def compile_template(template_name):
+    """
+    Compile la source MJML du gabarit en HTML sans la rendre : les balises Django
+    restent intactes. Le résultat est lu depuis MJML_CACHE_DIR s'il y est déjà.
+    Renvoie (empreinte de la source, HTML compilé).
+    """
+    with open(get_template(template_name).origin.name, 'rb') as source_file:
+        source = source_file.read()
+    digest = hashlib.sha256(source).hexdigest()
+    cached_path = os.path.join(_cache_dir(), f'{digest}.html')
+    try:
+        with open(cached_path, encoding='utf-8') as cached_file:
+            return digest, cached_file.read()
+    except FileNotFoundError:
+        pass
+
+    source = source.decode('utf-8')
+    html_content = compile_mjml(source)
+    if not html_content:
+        raise EmailRenderError(f"Erreur lors de la compilation du MJML « {template_name} ».")
+    if DJANGO_TAG_RE.findall(html_content) != DJANGO_TAG_RE.findall(source):
+        raise EmailRenderError(f"La compilation MJML de « {template_name} » a altéré les balises Django.")
+
+    # Écriture atomique : plusieurs workers peuvent compiler en même temps
+    os.makedirs(_cache_dir(), exist_ok=True)
+    temporary_path = f'{cached_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as cached_file:
+        cached_file.write(html_content)
+    os.replace(temporary_path, cached_path)
+    return digest, html_content
+
+
+_compiled_templates = {}
+
+
+def get_compiled_template(template_name):
+    """
+    Renvoie le gabarit Django du HTML compilé, gardé en mémoire du processus.
+    Il est recompilé (ou relu du cache disque) si le fichier source a changé.
+    """
+    cached = _compiled_templates.get(template_name)
+    path = cached[0] if cached else get_template(template_name).origin.name
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if cached is None or cached[1] != stamp:
+        digest, html_content = compile_template(template_name)
+        cached = (path, stamp, engines['django'].from_string(html_content))
+        _compiled_templates[template_name] = cached
+    return cached[2]
+
+
+def build_order_email(order, settings_instance, organisation_settings, from_email):
+    """Construit l'email de confirmation de commande depuis le gabarit MJML précompilé."""
+    if not organisation_settings:
+        raise EmailRenderError("Les informations de l'organisation ne sont pas configurées.")
+    if not order.email:
+        raise EmailRenderError("La commande n'a pas d'adresse email.")
+
+    # Préparer les données de contexte pour le modèle MJML
+    context = {
+        'store_name': settings_instance.store_name,
+        'order_id': order.id,
+        'total': order.total_amount,
+        'currency': settings_instance.currency,
+        'payment_method': order.payment_method,
+        'delivery_option': order.delivery_option,
+        'delivery_address': order.delivery_address or '',  # Adresse de livraison
+        'user_name': order.user.username if order.user else '',
+        'order_date': order.date_created.strftime('%d/%m/%Y à %H:%M'),
+        'organisation_nom': organisation_settings.nom_entreprise,
+        'organisation_adresse_rue': organisation_settings.adresse_rue,
+        'organisation_adresse_code_postal': organisation_settings.adresse_code_postal,
+        'organisation_adresse_ville': organisation_settings.adresse_ville,
+        'organisation_adresse_pays': organisation_settings.adresse_pays,
+    }
+
+    html_content = get_compiled_template(ORDER_CONFIRMATION_TEMPLATE).render(context)
+
+    email = EmailMessage(
+        subject=settings_instance.email_subject,
+        body=html_content,
+        from_email=from_email,
+        to=[order.email],
+    )
+    email.content_subtype = "html"
+    email.encoding = 'utf-8'
+    return email
+
+
+def get_smtp_connection(smtp_settings):
+    """Connexion SMTP configurée depuis SMTPSettings (mot de passe déchiffré une fois)."""
+    return get_connection(
+        backend='django.core.mail.backends.smtp.EmailBackend',
+        host=smtp_settings.email_host,
+        port=smtp_settings.email_port,
+        username=smtp_settings.email_host_user,
+        password=smtp_settings.decrypt_password(),
+        use_tls=smtp_settings.use_tls,
+        use_ssl=smtp_settings.use_ssl,
+        fail_silently=False,
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Réserve jusqu'à `batch_size` emails dus en repoussant leur prochaine tentative
+    de CLAIM_LEASE : un autre worker ne les reprendra pas, et un worker arrêté
+    en cours de lot les laisse repartir après l'expiration du bail.
+    """
+    now = now or timezone.now()
+    due = Q(status='pending', next_attempt_at__lte=now)
+    candidates = list(
+        OrderEmail.objects.filter(due).order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:batch_size]
+    )
+    if not candidates:
+        return []
+    lease = now + timedelta(seconds=CLAIM_LEASE)
+    OrderEmail.objects.filter(due, pk__in=candidates).update(next_attempt_at=lease)
+    return list(
+        OrderEmail.objects.filter(pk__in=candidates, status='pending', next_attempt_at=lease)
+        .select_related('order', 'order__user')
+        .order_by('pk')
+    )
+
+
+def _record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'dead'
+        logger.error(f"Email {email} abandonné après {email.attempts} tentatives : {error}")
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+        logger.warning(f"Échec de l'email {email} (tentative {email.attempts}) : {error}")
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def send_pending_emails(batch_size=50, max_attempts=5):
+    """
+    Envoie un lot d'emails dus sur une seule connexion SMTP.
+    Renvoie (envoyés, en échec) ; (0, 0) si rien n'est dû.
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    from site_settings.models import OrganisationSettings
+    checkout_settings = get_settings(CheckoutSettings)
+    smtp_settings = get_settings(SMTPSettings)
+    organisation_settings = get_settings(OrganisationSettings)
+
+    if not checkout_settings or not smtp_settings:
+        error = "Les paramètres SMTP ou du checkout ne sont pas configurés."
+        for email in batch:
+            _record_failure(email, error, max_attempts)
+        return 0, len(batch)
+
+    sent = failed = 0
+    connection = get_smtp_connection(smtp_settings)
+    try:
+        for email in batch:
+            try:
+                message = build_order_email(
+                    email.order, checkout_settings, organisation_settings, smtp_settings.email_host_user
+                )
+                # Ouverte une fois puis réutilisée : send_messages ne la ferme pas
+                connection.open()
+                message.connection = connection
+                if not message.send(fail_silently=False):
+                    raise smtplib.SMTPException("L'email n'a pas été accepté par le serveur SMTP.")
+            except (smtplib.SMTPException, OSError) as e:
+                # Connexion peut-être rompue : elle sera rouverte au prochain envoi
+                connection.close()
+                _record_failure(email, e, max_attempts)
+                failed += 1
+            except Exception as e:
+                _record_failure(email, e, max_attempts)
+                failed += 1
+            else:
+                email.status = 'sent'
+                email.attempts += 1
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,166 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from checkout.models import CheckoutSettings, Order
+from checkout.payments import FakeGateway
+from checkout.schedule import get_schedule
+from checkout.webhooks import process_payment_events
+from product.models import ProductPage
+
+STEPS = ['ajout au panier', 'checkout', 'webhook', 'application des paiements']
+
+
+class Command(BaseCommand):
+    help = (
+        "Fait passer N acheteurs simulés et simultanés par l'ajout au panier, le checkout "
+        "Stripe et la confirmation par webhook, avec la passerelle de paiement FakeGateway "
+        "(aucun appel réseau). Affiche le débit en commandes/s et, par étape, la latence "
+        "p50/p95/p99 et le nombre de requêtes SQL. À lancer sur une base de développement : "
+        "les acheteurs créés sont supprimés à la fin, mais le stock du produit est consommé."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product-id', type=int, required=True, help="Produit ajouté au panier")
+        parser.add_argument('--shoppers', type=int, default=50, help="Nombre d'acheteurs simulés")
+        parser.add_argument('--concurrency', type=int, default=4, help="Nombre d'acheteurs simultanés")
+        parser.add_argument(
+            '--latency', type=float, default=0.2,
+            help="Latence simulée du prestataire de paiement (secondes)",
+        )
+        parser.add_argument('--batch-size', type=int, default=100, help="Taille des lots de process_payment_events")
+        parser.add_argument('--keep', action='store_true', help="Conserver les acheteurs et commandes créés")
+
+    def handle(self, *args, **options):
+        if options['shoppers'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--shoppers et --concurrency doivent être positifs.")
+        if not ProductPage.objects.filter(pk=options['product_id']).exists():
+            raise CommandError(f"Le produit {options['product_id']} n'existe pas.")
+        settings_instance = CheckoutSettings.objects.first()
+        if not settings_instance or not settings_instance.enable_stripe:
+            raise CommandError("Le paiement Stripe doit être activé dans les paramètres du checkout.")
+        if not get_schedule(settings_instance).is_open():
+            raise CommandError("Le magasin est fermé : le checkout refuserait les commandes.")
+
+        prefix = f"benchmark-{uuid.uuid4().hex[:8]}"
+        User = get_user_model()
+        User.objects.bulk_create([
+            User(username=f"{prefix}-{index}", email=f"{prefix}-{index}@example.com")
+            for index in range(options['shoppers'])
+        ])
+        users = list(User.objects.filter(username__startswith=f"{prefix}-"))
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                CHECKOUT_PAYMENT_GATEWAY='checkout.payments.FakeGateway',
+                CHECKOUT_FAKE_GATEWAY_LATENCY=options['latency'],
+            ):
+                results, errors, elapsed = self.run(users, options)
+            paid = Order.objects.filter(user__in=users, status='paid').count()
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=f"{prefix}-").delete()
+
+        self.stdout.write(
+            f"Acheteurs : {len(users)}, concurrence {options['concurrency']}, "
+            f"latence du prestataire {options['latency'] * 1000:.0f} ms"
+        )
+        for step in STEPS:
+            latencies, queries = results[step]
+            if not latencies:
+                self.stdout.write(f"{step} : aucune mesure ({errors[step]} erreur(s))")
+                continue
+            latencies.sort()
+            self.stdout.write(
+                f"{step} : p50 {self.percentile(latencies, 0.50) * 1000:.1f} ms, "
+                f"p95 {self.percentile(latencies, 0.95) * 1000:.1f} ms, "
+                f"p99 {self.percentile(latencies, 0.99) * 1000:.1f} ms, "
+                f"{statistics.mean(queries):.1f} requêtes SQL en moyenne, {errors[step]} erreur(s)"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{paid} commande(s) payée(s) en {elapsed:.2f} s : {paid / elapsed:.1f} commandes/s"
+        ))
+
+    @staticmethod
+    def percentile(values, fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    def run(self, users, options):
+        results = {step: ([], []) for step in STEPS}
+        errors = dict.fromkeys(STEPS, 0)
+        lock = threading.Lock()
+        remaining = iter(users)
+
+        def measure(step, call):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                try:
+                    ok = call()
+                except Exception:
+                    ok = False
+                latency = time.perf_counter() - start
+            with lock:
+                if ok:
+                    results[step][0].append(latency)
+                    results[step][1].append(len(captured))
+                else:
+                    errors[step] += 1
+            return ok
+
+        def shopper(user):
+            client = Client()
+            client.force_login(user)
+            if not measure(STEPS[0], lambda: client.post(f"/cart/add/{options['product_id']}/").status_code == 200):
+                return
+            if not measure(STEPS[1], lambda: self.checkout(client, user)):
+                return
+            intent_id = Order.objects.filter(user=user).values_list('stripe_payment_intent_id', flat=True).first()
+            measure(STEPS[2], lambda: client.post(
+                '/checkout/webhooks/stripe/', FakeGateway.build_event(intent_id), content_type='application/json',
+            ).status_code == 200)
+
+        def worker():
+            try:
+                for user in remaining:
+                    shopper(user)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(min(options['concurrency'], len(users)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Application des événements reçus, comme le ferait process_payment_events en continu
+        applied = None
+
+        def apply_batch():
+            nonlocal applied
+            applied = process_payment_events(options['batch_size'])
+            return True
+
+        while applied != 0:
+            if not measure(STEPS[3], apply_batch):
+                break
+        return results, errors, time.perf_counter() - start
+
+    @staticmethod
+    def checkout(client, user):
+        response = client.post('/checkout/checkout/', {
+            'phone_number': "0102030405",
+            'email': user.email,
+            'payment_method': 'Stripe',
+            'delivery_option': 'pickup',
+        })
+        # La page de paiement n'est rendue qu'avec l'intention créée par la passerelle
+        return response.status_code == 200 and b'pi_fake_' in response.content
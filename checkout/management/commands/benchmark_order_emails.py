@@ -0,0 +1,54 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from checkout.emails import ORDER_CONFIRMATION_TEMPLATE, compile_mjml, get_compiled_template
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le nombre d'emails de commande rendus par seconde : compilation MJML "
+        "à chaque email (ancien chemin) contre gabarit précompilé"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help="Nombre d'emails rendus par chemin")
+
+    def handle(self, *args, **options):
+        count = options['count']
+        if count < 1:
+            raise CommandError("--count doit être positif.")
+        context = {
+            'store_name': "Mon Magasin",
+            'order_id': 1234,
+            'total': Decimal("42.50"),
+            'currency': "EUR",
+            'payment_method': "COD",
+            'delivery_option': "pickup",
+            'delivery_address': "",
+            'user_name': "client",
+            'order_date': "01/01/2025 à 12:00",
+            'organisation_nom': "Boutique",
+            'organisation_adresse_rue': "1 rue de la Paix",
+            'organisation_adresse_code_postal': "75001",
+            'organisation_adresse_ville': "Paris",
+            'organisation_adresse_pays': "France",
+        }
+
+        def per_email_compilation():
+            if not compile_mjml(render_to_string(ORDER_CONFIRMATION_TEMPLATE, context)):
+                raise CommandError("La commande mjml est introuvable ou a échoué.")
+
+        # Compilation unique hors mesure, comme au déploiement
+        get_compiled_template(ORDER_CONFIRMATION_TEMPLATE)
+
+        def precompiled():
+            get_compiled_template(ORDER_CONFIRMATION_TEMPLATE).render(context)
+
+        for label, render in (("Compilation à chaque email", per_email_compilation), ("Gabarit précompilé", precompiled)):
+            start = time.perf_counter()
+            for _ in range(count):
+                render()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{label} : {count / elapsed:.1f} emails/s ({elapsed / count * 1000:.2f} ms par email)")
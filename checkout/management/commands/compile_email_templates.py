@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from checkout.emails import ORDER_CONFIRMATION_TEMPLATE, EmailRenderError, compile_template
+
+
+class Command(BaseCommand):
+    help = "Compile les gabarits MJML des emails en HTML (à lancer au déploiement)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('templates', nargs='*', default=[ORDER_CONFIRMATION_TEMPLATE])
+
+    def handle(self, *args, **options):
+        for template_name in options['templates']:
+            try:
+                digest, html_content = compile_template(template_name)
+            except EmailRenderError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"{template_name} compilé ({digest[:12]})."))
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+from checkout.payments import get_payment_gateway
+
+
+class Command(BaseCommand):
+    help = (
+        "Affiche l'état du disjoncteur de la passerelle de paiement (fermé, ouvert, "
+        "demi-ouvert) et ses compteurs, cumulés sur tous les workers (cache partagé)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Sortie JSON (supervision)")
+        parser.add_argument('--reset', action='store_true', help="Refermer le disjoncteur et remettre les compteurs à zéro")
+
+    def handle(self, *args, **options):
+        breaker = get_payment_gateway().breaker
+        if options['reset']:
+            breaker.reset()
+        metrics = breaker.metrics()
+        if options['json']:
+            self.stdout.write(json.dumps(metrics))
+            return
+
+        labels = {'closed': "fermé", 'open': "ouvert", 'half_open': "demi-ouvert"}
+        style = self.style.SUCCESS if metrics['state'] == 'closed' else self.style.WARNING
+        self.stdout.write(style(f"Disjoncteur {metrics['name']} : {labels[metrics['state']]}"))
+        if metrics['state'] == 'open':
+            self.stdout.write(f"Appel d'essai dans {metrics['retry_in']:.0f} s")
+        self.stdout.write(
+            f"Échecs consécutifs : {metrics['consecutive_failures']}/{metrics['failure_threshold']}, "
+            f"succès : {metrics['successes']}, échecs : {metrics['failures']}, refus immédiats : {metrics['rejections']}"
+        )
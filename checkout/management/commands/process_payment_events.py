@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from checkout.webhooks import process_payment_events
+
+
+class Command(BaseCommand):
+    help = "Applique par lots les événements de paiement reçus (webhooks) aux commandes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Nombre d'événements par lot")
+        parser.add_argument('--loop', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--interval', type=float, default=2, help="Pause quand il n'y a rien à traiter (secondes)")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_payment_events(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} événement(s) de paiement traité(s)."))
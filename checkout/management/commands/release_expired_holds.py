@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from checkout.stock import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Libère les réservations de stock expirées et restitue le stock en bloc"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Nombre de réservations par lot")
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{released} réservation(s) expirée(s) libérée(s)."))
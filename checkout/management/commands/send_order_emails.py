@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from checkout.emails import send_pending_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "Vide la boîte d'envoi des emails de commande par lots sur une seule connexion SMTP, "
+        "avec nouvelles tentatives espacées et abandon après --max-attempts échecs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Nombre d'emails par lot")
+        parser.add_argument('--max-attempts', type=int, default=5, help="Tentatives avant abandon")
+        parser.add_argument('--loop', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--interval', type=float, default=5, help="Pause quand la boîte est vide (secondes)")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_pending_emails(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Lot traité : {sent} envoyé(s), {failed} en échec.")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_sent} email(s) envoyé(s), {total_failed} échec(s)."
+        ))
@@ -0,0 +1,97 @@
+# Generated by Django 5.0.9 on 2026-10-17 02:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0006_checkoutsettings_daily_exchange_rate"),
+        ("product", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="checkoutsettings",
+            name="enable_stock_reservation",
+            field=models.BooleanField(
+                default=False,
+                help_text="Réserver le stock des produits et options au passage de la commande",
+            ),
+        ),
+        migrations.AddField(
+            model_name="checkoutsettings",
+            name="stock_hold_minutes",
+            field=models.PositiveIntegerField(
+                default=15,
+                help_text="Durée de réservation du stock en attente de paiement (minutes)",
+            ),
+        ),
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("held", "Réservé"),
+                            ("committed", "Confirmé"),
+                            ("released", "Libéré"),
+                        ],
+                        default="held",
+                        max_length=10,
+                    ),
+                ),
+                ("expires_at", models.DateTimeField()),
+                ("released_at", models.DateTimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_reservations",
+                        to="checkout.order",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_reservations",
+                        to="product.productpage",
+                    ),
+                ),
+                (
+                    "variant_option",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_reservations",
+                        to="product.variantoption",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "expires_at"],
+                        name="checkout_st_status_0ed37a_idx",
+                    )
+                ],
+            },
+        ),
+    ]
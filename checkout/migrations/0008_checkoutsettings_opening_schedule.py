@@ -0,0 +1,97 @@
+# Generated by Django 5.0.9 on 2026-10-17 02:50
+
+from datetime import time
+
+from django.db import migrations, models
+
+# Copie figée de checkout.schedule.compile_opening_hours au moment de la migration :
+# la migration ne doit pas dépendre du code courant de l'application
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+
+def _time(value):
+    if not value:
+        return None
+    return time.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _seconds(value):
+    value = _time(value)
+    return None if value is None else value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _format(value):
+    value = _time(value)
+    return None if value is None else value.strftime("%H:%M")
+
+
+def compile_opening_hours(rows):
+    intervals = []
+    days = []
+    for row in rows:
+        day = row.get("day")
+        if day not in DAYS:
+            continue
+        closed = bool(row.get("closed"))
+        days.append({
+            "day": day,
+            "is_closed": closed,
+            "open_time": _format(row.get("open_time")),
+            "close_time": _format(row.get("close_time")),
+            "second_open_time": _format(row.get("second_open_time")),
+            "second_close_time": _format(row.get("second_close_time")),
+        })
+        if closed:
+            continue
+        offset = DAYS.index(day) * DAY_SECONDS
+        for open_key, close_key in (("open_time", "close_time"), ("second_open_time", "second_close_time")):
+            start, end = _seconds(row.get(open_key)), _seconds(row.get(close_key))
+            if start is None or end is None or start == end:
+                continue
+            if end < start:
+                end += DAY_SECONDS
+            start, end = offset + start, offset + end
+            if end > WEEK_SECONDS:
+                intervals.append([0, end - WEEK_SECONDS])
+                end = WEEK_SECONDS
+            intervals.append([start, end])
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return {"intervals": merged, "days": days}
+
+
+def compile_existing_schedules(apps, schema_editor):
+    CheckoutSettings = apps.get_model("checkout", "CheckoutSettings")
+    for settings in CheckoutSettings.objects.all():
+        rows = [block["value"] for block in settings.opening_hours.raw_data]
+        settings.opening_schedule = compile_opening_hours(rows)
+        settings.opening_hours_version = 1
+        settings.save(update_fields=["opening_schedule", "opening_hours_version"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0007_stock_reservation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="checkoutsettings",
+            name="opening_hours_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="checkoutsettings",
+            name="opening_schedule",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(compile_existing_schedules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.0.9 on 2026-10-17 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0009_order_email"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="checkoutsettings",
+            name="stripe_webhook_secret",
+            field=models.CharField(
+                blank=True,
+                help_text="Secret de signature des webhooks Stripe (whsec_...)",
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="PaymentEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider", models.CharField(default="stripe", max_length=20)),
+                ("event_id", models.CharField(max_length=255)),
+                ("event_type", models.CharField(max_length=100)),
+                ("target_status", models.CharField(blank=True, max_length=20)),
+                ("payment_intent_id", models.CharField(blank=True, max_length=255)),
+                ("payload", models.JSONField(blank=True, default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("received", "Reçu"),
+                            ("processed", "Traité"),
+                            ("ignored", "Ignoré"),
+                            ("failed", "En échec"),
+                        ],
+                        default="received",
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="payment_events",
+                        to="checkout.order",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "id"], name="checkout_pa_status_694123_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="paymentevent",
+            constraint=models.UniqueConstraint(
+                fields=("provider", "event_id"), name="payment_event_unique_provider_id"
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.0.9 on 2026-10-17 03:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0010_payment_event"),
+        ("product", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product_title", models.CharField(max_length=255)),
+                (
+                    "options_label",
+                    models.CharField(
+                        blank=True,
+                        help_text="Options choisies, ex : « Taille : Grand »",
+                        max_length=255,
+                    ),
+                ),
+                ("unit_price", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("quantity", models.PositiveIntegerField(default=1)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="checkout.order",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="order_items",
+                        to="product.productpage",
+                    ),
+                ),
+                (
+                    "selected_options",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="order_items",
+                        to="product.variantoption",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.9 on 2026-10-17 03:14
+
+from django.db import migrations, models
+
+# Figés ici : la migration ne doit pas dépendre du code courant de checkout.sequences
+ORDER_SEQUENCE = "order"
+ORDER_REFERENCE_FORMAT = "C{:08d}"
+
+
+def number_existing_orders(apps, schema_editor):
+    Order = apps.get_model("checkout", "Order")
+    Sequence = apps.get_model("checkout", "Sequence")
+    orders = list(Order.objects.only("pk"))
+    for order in orders:
+        order.reference = ORDER_REFERENCE_FORMAT.format(order.pk)
+    Order.objects.bulk_update(orders, ["reference"], batch_size=500)
+    # Les nouvelles références reprennent après le plus grand identifiant existant
+    Sequence.objects.create(name=ORDER_SEQUENCE, last_value=max((order.pk for order in orders), default=0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0011_order_item"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Sequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("last_value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="reference",
+            field=models.CharField(
+                blank=True, editable=False, max_length=20, null=True, unique=True
+            ),
+        ),
+        migrations.RunPython(number_existing_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.9 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0012_sequence_order_reference"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="stock_shortage",
+            field=models.BooleanField(
+                default=False,
+                help_text="Une partie du stock n'a pas pu être confirmée au paiement : à traiter manuellement",
+                verbose_name="Stock insuffisant",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.9 on 2026-10-17 04:33
+
+from django.db import migrations, models
+
+
+def backfill_order_currency(apps, schema_editor):
+    # Les commandes existantes ont été passées dans la devise actuelle de la boutique
+    CheckoutSettings = apps.get_model("checkout", "CheckoutSettings")
+    Order = apps.get_model("checkout", "Order")
+    settings_instance = CheckoutSettings.objects.first()
+    if settings_instance:
+        Order.objects.update(currency=settings_instance.currency)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0013_order_stock_shortage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="currency",
+            field=models.CharField(
+                blank=True, editable=False, max_length=10, verbose_name="Devise"
+            ),
+        ),
+        migrations.RunPython(backfill_order_currency, migrations.RunPython.noop),
+    ]
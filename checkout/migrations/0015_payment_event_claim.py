@@ -0,0 +1,33 @@
+# Generated by Django 5.0.9 on 2026-10-17 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0014_order_currency"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentevent",
+            name="claimed_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="paymentevent",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("received", "Reçu"),
+                    ("processing", "En cours"),
+                    ("processed", "Traité"),
+                    ("ignored", "Ignoré"),
+                    ("failed", "En échec"),
+                ],
+                default="received",
+                max_length=10,
+            ),
+        ),
+    ]
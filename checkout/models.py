@@ -7,12 +7,15 @@ from wagtail.fields import RichTextField
 from wagtail.contrib.settings.models import BaseGenericSetting, register_setting
 from wagtail.admin.forms import WagtailAdminModelForm
 from django.conf import settings
+from django.utils import timezone
 from wagtail import blocks
 from wagtail.fields import StreamField
 from streams.blocks import OpeningHoursBlock
+from site_settings.provider import CachedSettingMixin
+from .schedule import compile_opening_hours
 
 @register_setting
-class CheckoutSettings(BaseGenericSetting):
+class CheckoutSettings(CachedSettingMixin, BaseGenericSetting):
     store_name = models.CharField(max_length=255, default="Mon Magasin")
     currency = models.CharField(max_length=10, default="EUR", help_text="Devise (ex : EUR, USD)")
     daily_exchange_rate = models.BooleanField(default=True, help_text="Activer la conversion quotidienne. Mensuel par défault.")
@@ -23,6 +26,9 @@ class CheckoutSettings(BaseGenericSetting):
     enable_cod = models.BooleanField(default=True, help_text="Activer Paiement à la livraison (COD)")
     stripe_api_key = models.CharField(max_length=255, blank=True, null=True, help_text="Clé API secrète de Stripe")
     stripe_publishable_key = models.CharField(max_length=255, blank=True, null=True, help_text="Clé publique de Stripe")
+    stripe_webhook_secret = models.CharField(max_length=255, blank=True, null=True, help_text="Secret de signature des webhooks Stripe (whsec_...)")
+    enable_stock_reservation = models.BooleanField(default=False, help_text="Réserver le stock des produits et options au passage de la commande")
+    stock_hold_minutes = models.PositiveIntegerField(default=15, help_text="Durée de réservation du stock en attente de paiement (minutes)")
     enable_email_notifications = models.BooleanField(default=False, help_text="Activer les notifications par email")
     email_subject = models.CharField(max_length=255, default="Confirmation de commande", help_text="Sujet de l'email de confirmation")
     email_body_template = RichTextField(
@@ -33,6 +39,9 @@ class CheckoutSettings(BaseGenericSetting):
     opening_hours = StreamField([
         ('opening_hours', OpeningHoursBlock())
     ], blank=True, use_json_field=True)
+    # Horaires compilés à l'enregistrement (voir checkout.schedule)
+    opening_schedule = models.JSONField(default=dict, blank=True, editable=False)
+    opening_hours_version = models.PositiveIntegerField(default=0, editable=False)
 
     panels = [
         MultiFieldPanel([
@@ -45,10 +54,16 @@ class CheckoutSettings(BaseGenericSetting):
             FieldPanel("enable_stripe"),
             FieldPanel("stripe_api_key"),
             FieldPanel("stripe_publishable_key"),
+            FieldPanel("stripe_webhook_secret"),
             FieldPanel("enable_cod"),
             FieldPanel("opening_hours"),
         ], heading="Configuration du magasin"),
 
+        MultiFieldPanel([
+            FieldPanel("enable_stock_reservation"),
+            FieldPanel("stock_hold_minutes"),
+        ], heading="Gestion du stock"),
+
         MultiFieldPanel([
             FieldPanel("email_subject"),
             FieldPanel("email_body_template"),
@@ -59,6 +74,22 @@ class CheckoutSettings(BaseGenericSetting):
     def __str__(self):
         return self.store_name
 
+    def save(self, *args, **kwargs):
+        self.opening_schedule = compile_opening_hours(block.value for block in self.opening_hours)
+        self.opening_hours_version += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'opening_schedule', 'opening_hours_version'}
+        super().save(*args, **kwargs)
+
+
+def store_currency():
+    """Devise actuelle de la boutique (réglage CheckoutSettings), chaîne vide sans réglage."""
+    from site_settings.provider import get_settings
+    settings_instance = get_settings(CheckoutSettings)
+    return settings_instance.currency if settings_instance else ''
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('ordered', 'Commandé'),
@@ -76,6 +107,8 @@ class Order(models.Model):
         blank=True
     )
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Devise de total_amount : celle de la boutique à la création de la commande
+    currency = models.CharField(max_length=10, blank=True, editable=False, verbose_name="Devise")
     payment_method = models.CharField(
         max_length=50,
         choices=[
@@ -99,13 +132,20 @@ class Order(models.Model):
         default='ordered'
     )
     date_created = models.DateTimeField(auto_now_add=True)
+    # Attribuée à la création depuis la séquence par blocs (voir checkout.sequences)
+    reference = models.CharField(max_length=20, unique=True, null=True, blank=True, editable=False)
     stripe_payment_intent_id = models.CharField(
         max_length=255,
         blank=True,
         null=True,
         help_text="ID du PaymentIntent Stripe"
     )
-
+    # Payée alors qu'une réservation expirée n'a pas pu être redécrémentée (voir commit_reservations)
+    stock_shortage = models.BooleanField(
+        default=False,
+        verbose_name="Stock insuffisant",
+        help_text="Une partie du stock n'a pas pu être confirmée au paiement : à traiter manuellement",
+    )
 
     panels = [
         FieldPanel('user'),
@@ -116,14 +156,210 @@ class Order(models.Model):
         FieldPanel('phone_number'),
         FieldPanel('email'),
         FieldPanel('status'),
+        FieldPanel('stock_shortage'),
     ]
 
     class Meta:
         ordering = ['-date_created']  # Tri par date de création décroissante
 
     def __str__(self):
-        return f"Commande #{self.id} - {self.get_status_display()} - Total: {self.total_amount}€"
+        return f"Commande #{self.id} - {self.get_status_display()} - Total: {self.total_amount} {self.currency}"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.reference:
+            from .sequences import next_order_reference
+            self.reference = next_order_reference()
+        if self._state.adding and not self.currency:
+            self.currency = store_currency()
+        super().save(*args, **kwargs)
 
     def update_status(self, new_status):
         self.status = new_status
-        self.save()
\ No newline at end of file
+        self.save()
+
+
+class OrderItem(models.Model):
+    """
+    Ligne de commande figée au checkout : titre, prix et options tels qu'au moment
+    de la commande, indépendamment des modifications ultérieures du catalogue.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(
+        'product.ProductPage', on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items'
+    )
+    product_title = models.CharField(max_length=255)
+    selected_options = models.ManyToManyField('product.VariantOption', blank=True, related_name='order_items')
+    options_label = models.CharField(max_length=255, blank=True, help_text="Options choisies, ex : « Taille : Grand »")
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_title}"
+
+    @property
+    def total_price(self):
+        return self.unit_price * self.quantity
+
+    @classmethod
+    def snapshot(cls, order, cart_items):
+        """
+        Copie les lignes de panier (chargées par get_cart_items) dans la commande :
+        un bulk_create pour les lignes et un pour les options, quel que soit le panier.
+        """
+        lines = []
+        options = []
+        for item in cart_items:
+            item_options = list(item.selected_options.all())
+            lines.append(cls(
+                order=order,
+                product=item.product,
+                product_title=item.product.title,
+                options_label=", ".join(f"{option.variant.name} : {option.name}" for option in item_options)[:255],
+                unit_price=item.unit_price,
+                quantity=item.quantity,
+            ))
+            options.append(item_options)
+        cls.objects.bulk_create(lines)
+        through = cls.selected_options.through
+        through.objects.bulk_create([
+            through(orderitem_id=line.pk, variantoption_id=option.pk)
+            for line, item_options in zip(lines, options)
+            for option in item_options
+        ])
+        return lines
+
+
+class StockReservation(models.Model):
+    """
+    Réservation de stock créée au checkout pour un produit ou une option de variante.
+
+    Le stock est décrémenté dès la réservation ; une réservation expirée ou annulée
+    le restitue, une réservation confirmée (paiement reçu) le garde définitivement.
+    """
+    STATUS_CHOICES = [
+        ('held', 'Réservé'),
+        ('committed', 'Confirmé'),
+        ('released', 'Libéré'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(
+        'product.ProductPage', on_delete=models.CASCADE, null=True, blank=True, related_name='stock_reservations'
+    )
+    variant_option = models.ForeignKey(
+        'product.VariantOption', on_delete=models.CASCADE, null=True, blank=True, related_name='stock_reservations'
+    )
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    released_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        target = self.product or self.variant_option
+        return f"{self.quantity} x {target} ({self.get_status_display()})"
+
+
+class OrderEmail(models.Model):
+    """
+    Boîte d'envoi des emails de commande.
+
+    Les événements de commande y insèrent une ligne dans leur propre transaction ;
+    la commande ``send_order_emails`` la vide par lots, avec nouvelles tentatives
+    espacées et abandon (« dead ») après trop d'échecs.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('sent', 'Envoyé'),
+        ('dead', 'Abandonné'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='emails')
+    kind = models.CharField(max_length=50, default='order_confirmation')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Un seul email de chaque type par commande, même si l'événement se répète
+            models.UniqueConstraint(fields=['order', 'kind'], name='order_email_unique_kind'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.order_id} ({self.get_status_display()})"
+
+    @classmethod
+    def enqueue(cls, order, kind='order_confirmation'):
+        """Ajoute l'email à la boîte d'envoi, sans doublon ; renvoie la ligne."""
+        email, created = cls.objects.get_or_create(order=order, kind=kind)
+        return email
+
+
+class PaymentEvent(models.Model):
+    """
+    Événement de paiement reçu d'un prestataire (webhook), identifié par son id d'événement.
+
+    Le point d'accès se contente de l'insérer : un événement rejoué se heurte à la
+    contrainte d'unicité et n'est pas réinséré. La commande ``process_payment_events``
+    applique ensuite les changements de statut par lots.
+    """
+    STATUS_CHOICES = [
+        ('received', 'Reçu'),
+        ('processing', 'En cours'),
+        ('processed', 'Traité'),
+        ('ignored', 'Ignoré'),
+        ('failed', 'En échec'),
+    ]
+
+    provider = models.CharField(max_length=20, default='stripe')
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100)
+    # Statut de commande visé ('paid', 'canceled'), déduit du type à la réception
+    target_status = models.CharField(max_length=20, blank=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='payment_events')
+    payment_intent_id = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='received')
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Fin du bail du worker qui traite l'événement (voir webhooks.claim_events)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='payment_event_unique_provider_id'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_id} ({self.get_status_display()})"
+
+
+class Sequence(models.Model):
+    """
+    Compteur nommé en base (références de commande).
+    Voir checkout.sequences pour l'allocation par blocs.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} : {self.last_value}"
@@ -0,0 +1,214 @@
+"""
+Passerelles de paiement.
+
+Les vues du checkout ne parlent jamais directement à Stripe : elles passent par la
+passerelle choisie par le réglage CHECKOUT_PAYMENT_GATEWAY (chemin pointé d'une classe).
+
+- ``StripeGateway`` (par défaut) appelle l'API Stripe ;
+- ``FakeGateway`` répond en mémoire, après une latence configurable
+  (CHECKOUT_FAKE_GATEWAY_LATENCY, en secondes) et avec un taux d'erreurs injectées
+  (CHECKOUT_FAKE_GATEWAY_FAILURE_RATE), pour le développement hors ligne
+  et le banc d'essai ``benchmark_checkout``.
+
+La création d'une intention de paiement est bornée dans le temps (CHECKOUT_PAYMENT_TIMEOUT,
+CHECKOUT_PAYMENT_CONNECT_TIMEOUT) et passe par un disjoncteur (voir checkout.breaker) :
+quand le prestataire est lent ou en panne, les checkouts échouent vite au lieu
+d'occuper tous les workers.
+"""
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .breaker import CircuitBreaker, CircuitOpenError
+
+DEFAULT_PAYMENT_GATEWAY = 'checkout.payments.StripeGateway'
+
+
+class PaymentError(Exception):
+    """Le prestataire a refusé l'opération ou n'a pas pu être joint."""
+
+
+class PaymentUnavailable(PaymentError):
+    """Le prestataire est injoignable, trop lent ou en erreur : compte pour le disjoncteur."""
+
+
+class WebhookError(ValueError):
+    """Le corps ou la signature d'un webhook est invalide."""
+
+
+@dataclass
+class PaymentIntent:
+    id: str
+    client_secret: str
+
+
+def get_breaker(provider):
+    return CircuitBreaker(
+        f'payments:{provider}',
+        failure_threshold=getattr(settings, 'CHECKOUT_PAYMENT_BREAKER_THRESHOLD', 5),
+        reset_timeout=getattr(settings, 'CHECKOUT_PAYMENT_BREAKER_RESET', 30),
+    )
+
+
+def get_timeouts():
+    """(connexion, lecture) en secondes pour les appels au prestataire."""
+    return (
+        getattr(settings, 'CHECKOUT_PAYMENT_CONNECT_TIMEOUT', 2),
+        getattr(settings, 'CHECKOUT_PAYMENT_TIMEOUT', 5),
+    )
+
+
+class PaymentGateway:
+    """Interface commune des passerelles de paiement."""
+
+    provider = ''
+    # Les webhooks ne sont acceptés que signés avec le secret de CheckoutSettings
+    requires_webhook_secret = True
+
+    @property
+    def breaker(self):
+        return get_breaker(self.provider)
+
+    def create_payment_intent(self, amount, currency, receipt_email, settings_instance):
+        """
+        Crée une intention de paiement de `amount` (Decimal, unité monétaire) à travers
+        le disjoncteur. Lève PaymentUnavailable si le prestataire est en panne, PaymentError sinon.
+        """
+        try:
+            return self.breaker.call(
+                self._create_payment_intent, amount, currency, receipt_email, settings_instance,
+                failure_exceptions=(PaymentUnavailable,),
+            )
+        except CircuitOpenError:
+            raise PaymentUnavailable(
+                "Le paiement par carte est momentanément indisponible. Veuillez réessayer dans quelques instants."
+            )
+
+    def _create_payment_intent(self, amount, currency, receipt_email, settings_instance):
+        raise NotImplementedError
+
+    def parse_webhook(self, payload, signature, secret):
+        """Vérifie la signature avec `secret` puis décode un événement de webhook. Lève WebhookError."""
+        raise NotImplementedError
+
+
+def _decode_event(payload):
+    try:
+        event = json.loads(payload)
+    except (TypeError, ValueError) as e:
+        raise WebhookError(str(e))
+    if not isinstance(event, dict) or 'id' not in event or 'type' not in event:
+        raise WebhookError("Événement sans identifiant ni type.")
+    return event
+
+
+_stripe_clients = {}
+_stripe_http_clients = {}
+
+
+def get_stripe_client(api_key):
+    """
+    Client Stripe du processus pour `api_key`. Tous les clients partagent un même client
+    HTTP requests : chaque thread réutilise sa session, donc ses connexions keep-alive.
+    Pas de nouvelle tentative réseau : le délai maximal d'un checkout reste celui d'un appel.
+    CHECKOUT_STRIPE_API_BASE remplace l'adresse de l'API (bouchon local, tests).
+    """
+    import stripe
+    api_base = getattr(settings, 'CHECKOUT_STRIPE_API_BASE', None)
+    timeouts = get_timeouts()
+    key = (api_key, api_base, timeouts)
+    if key not in _stripe_clients:
+        if timeouts not in _stripe_http_clients:
+            _stripe_http_clients[timeouts] = stripe.RequestsClient(timeout=timeouts)
+        _stripe_clients[key] = stripe.StripeClient(
+            api_key,
+            http_client=_stripe_http_clients[timeouts],
+            max_network_retries=0,
+            base_addresses={'api': api_base} if api_base else {},
+        )
+    return _stripe_clients[key]
+
+
+class StripeGateway(PaymentGateway):
+    provider = 'stripe'
+
+    def _create_payment_intent(self, amount, currency, receipt_email, settings_instance):
+        import stripe
+        try:
+            payment_intent = get_stripe_client(settings_instance.stripe_api_key).payment_intents.create(params={
+                'amount': int(amount * 100),
+                'currency': currency.lower(),
+                'payment_method_types': ['card'],
+                'receipt_email': receipt_email,
+            })
+        except (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError) as e:
+            # Délai dépassé, connexion impossible, prestataire saturé ou en erreur 5xx
+            raise PaymentUnavailable(str(e)) from e
+        except stripe.error.StripeError as e:
+            raise PaymentError(str(e)) from e
+        return PaymentIntent(id=payment_intent['id'], client_secret=payment_intent['client_secret'])
+
+    def parse_webhook(self, payload, signature, secret):
+        import stripe
+        if not secret:
+            # Sans secret, n'importe qui pourrait marquer une commande payée
+            raise WebhookError("Secret de webhook Stripe non configuré.")
+        try:
+            stripe.Webhook.construct_event(payload, signature or '', secret)
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            raise WebhookError(str(e)) from e
+        return _decode_event(payload)
+
+
+class FakeGateway(PaymentGateway):
+    """
+    Passerelle en mémoire : chaque appel attend `latency` secondes puis réussit, sauf
+    pour une proportion `failure_rate` d'erreurs injectées. Une latence supérieure
+    au délai de lecture se comporte comme un délai dépassé.
+    Les événements construits par ``build_event`` ont le format des webhooks Stripe
+    et sont acceptés sans signature.
+    """
+
+    provider = 'stripe'
+    requires_webhook_secret = False
+
+    def __init__(self, latency=None, failure_rate=None):
+        if latency is None:
+            latency = getattr(settings, 'CHECKOUT_FAKE_GATEWAY_LATENCY', 0)
+        if failure_rate is None:
+            failure_rate = getattr(settings, 'CHECKOUT_FAKE_GATEWAY_FAILURE_RATE', 0)
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def _create_payment_intent(self, amount, currency, receipt_email, settings_instance):
+        timeout = get_timeouts()[1]
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        if self.latency > timeout:
+            raise PaymentUnavailable(f"Délai de {timeout} s dépassé (simulé)")
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise PaymentUnavailable("Erreur du prestataire (simulée)")
+        intent_id = f'pi_fake_{uuid.uuid4().hex}'
+        return PaymentIntent(id=intent_id, client_secret=f'{intent_id}_secret')
+
+    def parse_webhook(self, payload, signature, secret):
+        return _decode_event(payload)
+
+    @staticmethod
+    def build_event(intent_id, event_type='payment_intent.succeeded'):
+        """Corps JSON d'un webhook Stripe pour l'intention `intent_id`."""
+        return json.dumps({
+            'id': f'evt_fake_{uuid.uuid4().hex}',
+            'type': event_type,
+            'data': {'object': {'id': intent_id, 'object': 'payment_intent'}},
+        })
+
+
+def get_payment_gateway():
+    """Instancie la passerelle désignée par CHECKOUT_PAYMENT_GATEWAY."""
+    return import_string(getattr(settings, 'CHECKOUT_PAYMENT_GATEWAY', DEFAULT_PAYMENT_GATEWAY))()
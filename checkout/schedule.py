@@ -0,0 +1,149 @@
+"""
+Horaires d'ouverture compilés du magasin.
+
+Le StreamField ``CheckoutSettings.opening_hours`` est compilé à l'enregistrement
+(voir ``CheckoutSettings.save``) en une liste triée d'intervalles ``[début, fin[``
+exprimés en secondes depuis le lundi 00:00. Un créneau qui passe minuit déborde
+sur le jour suivant (et sur le lundi pour le dimanche soir). Un créneau est ouvert
+de son heure d'ouverture incluse à son heure de fermeture exclue.
+
+``get_schedule`` garde en mémoire du processus le planning de la version courante
+des réglages : il n'est reconstruit que lorsque ``opening_hours_version`` change.
+``is_open`` et ``next_opening`` répondent en O(log n) par recherche dichotomique.
+"""
+from bisect import bisect_right
+from datetime import time, timedelta
+
+from django.utils import timezone
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+
+def _seconds(value):
+    """Secondes depuis minuit d'une heure (objet time ou chaîne « HH:MM[:SS] »)."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _format(value):
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.strftime('%H:%M')
+
+
+def compile_opening_hours(rows):
+    """
+    Compile les valeurs des blocs OpeningHoursBlock (dictionnaires avec heures en objets
+    time ou en chaînes) en ``{"intervals": [[début, fin], ...], "days": [...]}``.
+    ``days`` conserve l'affichage jour par jour utilisé par la page « magasin fermé ».
+    """
+    intervals = []
+    days = []
+    for row in rows:
+        day = row.get('day')
+        if day not in DAYS:
+            continue
+        closed = bool(row.get('closed'))
+        days.append({
+            'day': day,
+            'is_closed': closed,
+            'open_time': _format(row.get('open_time')),
+            'close_time': _format(row.get('close_time')),
+            'second_open_time': _format(row.get('second_open_time')),
+            'second_close_time': _format(row.get('second_close_time')),
+        })
+        if closed:
+            continue
+        offset = DAYS.index(day) * DAY_SECONDS
+        for open_key, close_key in (('open_time', 'close_time'), ('second_open_time', 'second_close_time')):
+            start, end = _seconds(row.get(open_key)), _seconds(row.get(close_key))
+            if start is None or end is None or start == end:
+                continue
+            if end < start:
+                end += DAY_SECONDS
+            start, end = offset + start, offset + end
+            if end > WEEK_SECONDS:
+                # Dimanche soir après minuit : la fin retombe en début de semaine
+                intervals.append([0, end - WEEK_SECONDS])
+                end = WEEK_SECONDS
+            intervals.append([start, end])
+
+    # Fusion des créneaux qui se chevauchent ou se touchent
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return {'intervals': merged, 'days': days}
+
+
+class OpeningSchedule:
+    """Planning hebdomadaire compilé, interrogé par recherche dichotomique."""
+
+    def __init__(self, compiled):
+        compiled = compiled or {}
+        intervals = compiled.get('intervals', [])
+        self.starts = [start for start, end in intervals]
+        self.ends = [end for start, end in intervals]
+        self.days = compiled.get('days', [])
+
+    @staticmethod
+    def _week_seconds(at):
+        return at.weekday() * DAY_SECONDS + at.hour * 3600 + at.minute * 60 + at.second
+
+    def _local(self, at):
+        at = at or timezone.now()
+        return timezone.localtime(at) if timezone.is_aware(at) else at
+
+    def is_open(self, at=None):
+        """
+        Le magasin est-il ouvert à `at` (maintenant par défaut) ? L'heure d'ouverture est
+        incluse, l'heure de fermeture exclue : à 18:00 pile, un créneau 09:00-18:00 est fermé.
+        """
+        seconds = self._week_seconds(self._local(at))
+        index = bisect_right(self.starts, seconds) - 1
+        return index >= 0 and seconds < self.ends[index]
+
+    def next_opening(self, at=None):
+        """
+        Renvoie le datetime local de la prochaine ouverture après `at`,
+        `at` lui-même si le magasin est ouvert, ou None s'il n'ouvre jamais.
+        """
+        if not self.starts:
+            return None
+        at = self._local(at)
+        if self.is_open(at):
+            return at
+        seconds = self._week_seconds(at)
+        index = bisect_right(self.starts, seconds)
+        if index < len(self.starts):
+            delay = self.starts[index] - seconds
+        else:
+            delay = WEEK_SECONDS - seconds + self.starts[0]
+        return (at + timedelta(seconds=delay)).replace(microsecond=0)
+
+
+_cache = {}
+
+
+def get_schedule(settings_instance):
+    """
+    Renvoie le planning compilé des réglages, mis en cache dans le processus
+    tant que leur version d'horaires ne change pas.
+    """
+    if settings_instance is None:
+        return OpeningSchedule(None)
+    version = (settings_instance.pk, settings_instance.opening_hours_version)
+    cached = _cache.get(settings_instance.pk)
+    if cached is None or cached[0] != version:
+        cached = (version, OpeningSchedule(settings_instance.opening_schedule))
+        _cache[settings_instance.pk] = cached
+    return cached[1]
@@ -0,0 +1,91 @@
+"""
+Séquences de numérotation (modèle ``Sequence``).
+
+Références de commande (``next_order_reference``) : chaque processus réserve un bloc
+de CHECKOUT_ORDER_SEQUENCE_BLOCK numéros en une seule écriture, puis les distribue
+en mémoire. Les références sont uniques et croissantes par processus, mais pas
+contiguës (un bloc entamé est perdu à l'arrêt du worker).
+
+L'UPDATE passe en premier : c'est lui qui prend le verrou, et la valeur lue ensuite
+dans la même transaction est la nôtre. Les numéros de facture, qui doivent être
+continus, ont leur propre compteur (voir factures.models.next_invoice_number).
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+ORDER_SEQUENCE = 'order'
+ORDER_REFERENCE_FORMAT = 'C{:08d}'
+
+
+def allocate(name, count=1):
+    """Réserve `count` valeurs consécutives de la séquence `name` ; renvoie leur range."""
+    with transaction.atomic():
+        updated = Sequence.objects.filter(name=name).update(last_value=F('last_value') + count)
+        if not updated:
+            Sequence.objects.bulk_create([Sequence(name=name)], ignore_conflicts=True)
+            Sequence.objects.filter(name=name).update(last_value=F('last_value') + count)
+        last_value = Sequence.objects.filter(name=name).values_list('last_value', flat=True).get()
+    return range(last_value - count + 1, last_value + 1)
+
+
+class BlockSequence:
+    """Distribue les valeurs d'une séquence par blocs réservés pour le processus."""
+
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+
+    def _take(self):
+        # Après un fork (gunicorn --preload), le bloc du parent n'appartient pas à l'enfant
+        if self._pid == os.getpid() and self._next < self._end:
+            value = self._next
+            self._next += 1
+            return value
+        return None
+
+    def _store(self, values):
+        with self._lock:
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._pid, self._next, self._end = os.getpid(), values.start, values.stop
+
+    def next_value(self):
+        with self._lock:
+            value = self._take()
+        if value is not None:
+            return value
+
+        values = allocate(self.name, self.block_size)
+        if connection.in_atomic_block:
+            # Le bloc n'existe qu'une fois la transaction de l'appelant validée : il
+            # n'est mis à disposition qu'au commit, sinon un rollback le redistribuerait.
+            # Pour ne pas garder le compteur verrouillé pendant toute la transaction,
+            # réserver la référence avant (voir la vue checkout).
+            transaction.on_commit(lambda: self._store(values[1:]))
+        else:
+            self._store(values[1:])
+        return values.start
+
+
+_order_sequence = None
+
+
+def get_order_sequence():
+    global _order_sequence
+    block_size = getattr(settings, 'CHECKOUT_ORDER_SEQUENCE_BLOCK', 50)
+    if _order_sequence is None or _order_sequence.block_size != block_size:
+        _order_sequence = BlockSequence(ORDER_SEQUENCE, block_size)
+    return _order_sequence
+
+
+def next_order_reference():
+    """Référence de la prochaine commande, par exemple « C00000042 »."""
+    return ORDER_REFERENCE_FORMAT.format(get_order_sequence().next_value())
@@ -0,0 +1,141 @@
+"""
+Réservation atomique du stock des produits et des options de variante.
+
+Le stock est décrémenté au checkout par des UPDATE conditionnels
+(``stock_quantity >= quantité``), ce qui empêche toute survente même sous forte
+concurrence. La réservation reste « held » jusqu'au paiement :
+
+- ``commit_reservations`` la confirme (la décrémentation devient définitive) ;
+- ``release_reservations`` / ``release_expired_reservations`` la libèrent et
+  restituent le stock en bloc.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from product.models import ProductPage, VariantOption
+from .models import StockReservation
+
+
+class InsufficientStock(Exception):
+    """Le stock disponible ne couvre pas la quantité demandée."""
+
+    def __init__(self, target):
+        self.target = target
+        super().__init__(f"Stock insuffisant pour « {target} ».")
+
+
+def _decrement(model, pk, quantity):
+    """Décrémente le stock seulement s'il est suffisant ; renvoie False sinon."""
+    return bool(
+        model.objects.filter(pk=pk, stock_quantity__gte=quantity)
+        .update(stock_quantity=F('stock_quantity') - quantity)
+    )
+
+
+def reserve_stock(order, items, minutes):
+    """
+    Réserve le stock des lignes `items` (lignes de panier avec options préchargées) pour `order`.
+    Tout ou rien : lève InsufficientStock et annule toutes les décrémentations si un stock manque.
+    """
+    products = defaultdict(int)
+    options = defaultdict(int)
+    targets = {}
+    for item in items:
+        products[item.product.pk] += item.quantity
+        targets[(ProductPage, item.product.pk)] = item.product
+        for option in item.selected_options.all():
+            options[option.pk] += item.quantity
+            targets[(VariantOption, option.pk)] = option
+
+    expires_at = timezone.now() + timedelta(minutes=minutes)
+    reservations = []
+    with transaction.atomic():
+        # Ordre stable des verrous pour éviter les interblocages entre deux checkouts
+        for model, quantities, field in (
+            (ProductPage, products, 'product_id'),
+            (VariantOption, options, 'variant_option_id'),
+        ):
+            for pk in sorted(quantities):
+                if not _decrement(model, pk, quantities[pk]):
+                    raise InsufficientStock(targets[(model, pk)])
+                reservations.append(StockReservation(
+                    order=order, quantity=quantities[pk], expires_at=expires_at, **{field: pk}
+                ))
+        StockReservation.objects.bulk_create(reservations)
+    return reservations
+
+
+def _restore(reservations):
+    """Restitue en une requête par modèle le stock des réservations données."""
+    for model, field in ((ProductPage, 'product'), (VariantOption, 'variant_option')):
+        totals = (
+            reservations.filter(**{field: OuterRef('pk')})
+            .values(field)
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        model.objects.filter(pk__in=reservations.values(field)).update(
+            stock_quantity=F('stock_quantity') + Subquery(totals)
+        )
+
+
+def _release(queryset):
+    """
+    Libère les réservations encore « held » du queryset et restitue leur stock.
+    Seules les lignes dont ce passage a changé le statut sont restituées.
+    """
+    marker = timezone.now()
+    with transaction.atomic():
+        released = queryset.filter(status='held').update(status='released', released_at=marker)
+        if released:
+            _restore(StockReservation.objects.filter(
+                pk__in=queryset.values('pk'), status='released', released_at=marker
+            ))
+    return released
+
+
+def release_reservations(order):
+    """Libère immédiatement les réservations d'une commande annulée."""
+    return _release(StockReservation.objects.filter(order=order))
+
+
+def release_expired_reservations(now=None, batch_size=1000):
+    """
+    Libère les réservations expirées par lots de `batch_size`, renvoie le nombre libéré.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        batch = list(
+            StockReservation.objects.filter(status='held', expires_at__lte=now)
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return total
+        total += _release(StockReservation.objects.filter(pk__in=batch))
+
+
+def commit_reservations(order):
+    """
+    Confirme les réservations d'une commande payée : la décrémentation devient définitive.
+    Une réservation déjà libérée par expiration est redécrémentée si le stock le permet ;
+    renvoie la liste de celles qui n'ont pas pu l'être.
+    """
+    missing = []
+    with transaction.atomic():
+        StockReservation.objects.filter(order=order, status='held').update(status='committed')
+        for reservation in StockReservation.objects.filter(order=order, status='released'):
+            if reservation.product_id:
+                model, pk = ProductPage, reservation.product_id
+            else:
+                model, pk = VariantOption, reservation.variant_option_id
+            if _decrement(model, pk, reservation.quantity):
+                reservation.status = 'committed'
+                reservation.save(update_fields=['status'])
+            else:
+                missing.append(reservation)
+    return missing
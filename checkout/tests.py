@@ -1,3 +1,988 @@
-from django.test import TestCase
+"""
+Tests for the checkout app.
+"""
 
-# Create your tests here.
+import hashlib
+import hmac
+import http.server
+import json
+import socketserver
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from wagtail.models import Page
+
+from cart.models import Cart, CartItem
+from cart.serializers import get_cart_items
+from checkout import emails
+from checkout.emails import ORDER_CONFIRMATION_TEMPLATE, get_compiled_template, send_pending_emails
+from checkout.models import (
+    CheckoutSettings,
+    Order,
+    OrderEmail,
+    OrderItem,
+    PaymentEvent,
+    Sequence,
+    StockReservation,
+)
+from checkout.payments import (
+    FakeGateway,
+    PaymentError,
+    PaymentUnavailable,
+    get_breaker,
+    get_payment_gateway,
+)
+from checkout.breaker import CircuitBreaker
+from checkout.webhooks import CLAIM_LEASE, claim_events, process_payment_events, record_event
+from checkout.schedule import OpeningSchedule, compile_opening_hours, get_schedule
+from checkout.sequences import BlockSequence, allocate
+from checkout.stock import (
+    InsufficientStock,
+    commit_reservations,
+    release_expired_reservations,
+    release_reservations,
+    reserve_stock,
+)
+from product.models import ProductPage, ProductVariant, VariantOption
+
+
+def create_product(title, price="10.00", stock=0):
+    """Create a ProductPage under the root page."""
+    product = ProductPage(
+        title=title, slug=title.lower().replace(' ', '-'), price=Decimal(price), stock_quantity=stock
+    )
+    Page.get_first_root_node().add_child(instance=product)
+    return product
+
+
+# Pages rendered in tests: no collectstatic manifest
+STATIC_STORAGES = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def create_order():
+    return Order.objects.create(total_amount=Decimal("10.00"), payment_method='Stripe', delivery_option='pickup')
+
+
+class StockReservationTest(TestCase):
+    """Test stock holds, commits and releases."""
+
+    def setUp(self):
+        self.product = create_product("Produit", stock=5)
+        self.option = VariantOption.objects.create(
+            variant=ProductVariant.objects.create(name="Taille"), name="Grand", stock_quantity=3
+        )
+        self.cart = Cart.objects.create(session_key="stock")
+        item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=2, unit_price=Decimal("10.00"))
+        item.selected_options.add(self.option)
+
+    def assertStock(self, product, option):
+        self.product.refresh_from_db()
+        self.option.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.option.stock_quantity), (product, option))
+
+    def test_reserve_decrements_stock(self):
+        """Test a reservation decrements product and option stock."""
+        reserve_stock(create_order(), get_cart_items(self.cart), 15)
+        self.assertStock(3, 1)
+        self.assertEqual(StockReservation.objects.filter(status='held').count(), 2)
+
+    def test_insufficient_stock_rolls_back(self):
+        """Test a missing option stock cancels the whole reservation."""
+        self.option.stock_quantity = 1
+        self.option.save()
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(create_order(), get_cart_items(self.cart), 15)
+        self.assertStock(5, 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_restores_stock(self):
+        """Test cancelled orders give their stock back."""
+        order = create_order()
+        reserve_stock(order, get_cart_items(self.cart), 15)
+        self.assertEqual(release_reservations(order), 2)
+        self.assertStock(5, 3)
+        self.assertEqual(release_reservations(order), 0)
+        self.assertStock(5, 3)
+
+    def test_expired_holds_are_released_in_bulk(self):
+        """Test the sweeper releases only expired holds."""
+        self.option.stock_quantity = 4
+        self.option.save()
+        expired, active = create_order(), create_order()
+        reserve_stock(expired, get_cart_items(self.cart), 15)
+        reserve_stock(active, get_cart_items(self.cart), 15)
+        StockReservation.objects.filter(order=expired).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(release_expired_reservations(batch_size=1), 2)
+        self.assertStock(3, 2)
+
+    def test_commit_keeps_stock(self):
+        """Test committed holds are not released by the sweeper."""
+        order = create_order()
+        reserve_stock(order, get_cart_items(self.cart), 15)
+        self.assertEqual(commit_reservations(order), [])
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(release_expired_reservations(), 0)
+        self.assertStock(3, 1)
+
+    def test_commit_after_expiry_decrements_again(self):
+        """Test a payment received after expiry takes the stock again."""
+        order = create_order()
+        reserve_stock(order, get_cart_items(self.cart), 15)
+        release_reservations(order)
+        self.assertEqual(commit_reservations(order), [])
+        self.assertStock(3, 1)
+
+
+class StockConcurrencyTest(TransactionTestCase):
+    """Test no overselling happens when many shoppers buy the last unit."""
+
+    serialized_rollback = True
+
+    def test_last_unit_sold_once(self):
+        product = create_product("Dernier", stock=1)
+        carts = []
+        for index in range(10):
+            cart = Cart.objects.create(session_key=f"concurrent-{index}")
+            CartItem.objects.create(cart=cart, product=product, unit_price=Decimal("10.00"))
+            carts.append(cart)
+        orders = [create_order() for cart in carts]
+
+        barrier = threading.Barrier(len(carts))
+        results = []
+
+        def buy(cart, order):
+            try:
+                items = get_cart_items(cart)
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        reserve_stock(order, items, 15)
+                        results.append(True)
+                        return
+                    except InsufficientStock:
+                        results.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite locks the whole database: retry
+                        time.sleep(0.01)
+                results.append(None)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=pair) for pair in zip(carts, orders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(results.count(False), len(carts) - 1)
+        self.assertEqual(product.stock_quantity, 0)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+
+def at(day, hour, minute=0):
+    """Aware datetime on the given day of the week of 2024-01-01 (a Monday)."""
+    return timezone.make_aware(datetime(2024, 1, 1 + day, hour, minute))
+
+
+class OpeningScheduleTest(TestCase):
+    """Test the compiled opening hours."""
+
+    def setUp(self):
+        self.schedule = OpeningSchedule(compile_opening_hours([
+            {'day': 'monday', 'open_time': '09:00', 'close_time': '12:00',
+             'second_open_time': '14:00', 'second_close_time': '18:00'},
+            {'day': 'tuesday', 'closed': True, 'open_time': '09:00', 'close_time': '18:00'},
+            {'day': 'sunday', 'open_time': '20:00', 'close_time': '02:00'},
+        ]))
+
+    def test_is_open(self):
+        """Test both slots, lunch break, closed days and overnight slots."""
+        self.assertTrue(self.schedule.is_open(at(0, 10)))
+        self.assertFalse(self.schedule.is_open(at(0, 13)))
+        self.assertTrue(self.schedule.is_open(at(0, 17, 59)))
+        self.assertFalse(self.schedule.is_open(at(0, 18)))
+        self.assertFalse(self.schedule.is_open(at(1, 10)))
+        self.assertTrue(self.schedule.is_open(at(6, 23)))
+        self.assertTrue(self.schedule.is_open(at(0, 1)))
+
+    def test_slot_boundaries(self):
+        """Test slots are half-open: open at the opening time, closed at the closing time."""
+        self.assertFalse(self.schedule.is_open(at(0, 8, 59)))
+        self.assertTrue(self.schedule.is_open(at(0, 9)))
+        self.assertTrue(self.schedule.is_open(at(0, 11, 59) + timedelta(seconds=59)))
+        self.assertFalse(self.schedule.is_open(at(0, 12)))
+        self.assertTrue(self.schedule.is_open(at(0, 14)))
+        self.assertFalse(self.schedule.is_open(at(0, 18)))
+        # Overnight slot: Sunday 20:00 included, Monday 02:00 excluded
+        self.assertTrue(self.schedule.is_open(at(6, 20)))
+        self.assertTrue(self.schedule.is_open(at(0, 1, 59)))
+        self.assertFalse(self.schedule.is_open(at(0, 2)))
+        self.assertEqual(self.schedule.next_opening(at(0, 12)), at(0, 14))
+        # Touching slots merge: no closed instant between them
+        schedule = OpeningSchedule(compile_opening_hours([
+            {'day': 'monday', 'open_time': '09:00', 'close_time': '12:00',
+             'second_open_time': '12:00', 'second_close_time': '14:00'},
+        ]))
+        self.assertTrue(schedule.is_open(at(0, 12)))
+        self.assertFalse(schedule.is_open(at(0, 14)))
+
+    def test_next_opening(self):
+        """Test the next opening, wrapping to the following week."""
+        self.assertEqual(self.schedule.next_opening(at(0, 10)), at(0, 10))
+        self.assertEqual(self.schedule.next_opening(at(0, 12, 30)), at(0, 14))
+        self.assertEqual(self.schedule.next_opening(at(1, 10)), at(6, 20))
+        schedule = OpeningSchedule(compile_opening_hours([{'day': 'monday', 'open_time': '09:00', 'close_time': '12:00'}]))
+        self.assertEqual(schedule.next_opening(at(0, 13)), at(7, 9))
+        self.assertIsNone(OpeningSchedule(None).next_opening(at(0, 13)))
+
+    def test_schedule_recompiled_on_save(self):
+        """Test saving the settings invalidates the in-process schedule."""
+        settings_instance = CheckoutSettings.objects.create()
+        self.assertFalse(get_schedule(settings_instance).is_open(at(2, 10)))
+        settings_instance.opening_hours = [
+            ('opening_hours', {'day': 'wednesday', 'open_time': datetime(2024, 1, 1, 9).time(),
+                               'close_time': datetime(2024, 1, 1, 18).time()}),
+        ]
+        settings_instance.save()
+        settings_instance = CheckoutSettings.objects.get()
+        self.assertTrue(get_schedule(settings_instance).is_open(at(2, 10)))
+        self.assertIs(get_schedule(settings_instance), get_schedule(CheckoutSettings.objects.get()))
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue recording accepted messages on the server."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stub ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply("250-stub")
+                self.reply("250 AUTH PLAIN")
+            elif command == 'AUTH':
+                self.reply("235 Authentication successful")
+            elif command == 'MAIL':
+                recipients = []
+                self.reply("250 OK")
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip('<> ')
+                if address in server.rejected:
+                    self.reply("550 Mailbox unavailable")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline().decode().rstrip('\r\n') != '.':
+                    pass
+                server.messages.extend(recipients)
+                self.reply("250 OK")
+            elif command == 'RSET':
+                self.reply("250 OK")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPStubHandler)
+        self.messages = []
+        self.rejected = set()
+        self.connections = 0
+
+
+class CompiledEmailTemplateTestMixin:
+    """Compile MJML into a temporary cache directory with a fake compiler."""
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(MJML_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.compile_mjml = mock.Mock(side_effect=lambda content: f"<html>{content}</html>")
+        patcher = mock.patch('checkout.emails.compile_mjml', self.compile_mjml)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        emails._compiled_templates.clear()
+        self.addCleanup(emails._compiled_templates.clear)
+        super().setUp()
+
+
+class CompiledEmailTemplateTest(CompiledEmailTemplateTestMixin, TestCase):
+    """Test the precompiled MJML email templates."""
+
+    def test_compiled_once_and_rendered_per_email(self):
+        """Test the MJML compiler runs once and Django variables survive compilation."""
+        for order_id in (1, 2, 3):
+            html = get_compiled_template(ORDER_CONFIRMATION_TEMPLATE).render({
+                'order_id': order_id, 'delivery_option': 'delivery', 'delivery_address': '1 rue <b>',
+            })
+            self.assertIn(f"commande #{order_id}.", html)
+            self.assertIn("1 rue &lt;b&gt;", html)
+        self.assertEqual(self.compile_mjml.call_count, 1)
+        self.assertNotIn("{{", html)
+
+    def test_disk_cache_keyed_by_source_hash(self):
+        """Test a new process reuses the compiled HTML stored under the source hash."""
+        digest, html = emails.compile_template(ORDER_CONFIRMATION_TEMPLATE)
+        emails._compiled_templates.clear()
+        self.assertEqual(emails.compile_template(ORDER_CONFIRMATION_TEMPLATE), (digest, html))
+        get_compiled_template(ORDER_CONFIRMATION_TEMPLATE)
+        self.assertEqual(self.compile_mjml.call_count, 1)
+
+    def test_altered_django_tags_rejected(self):
+        """Test a compiler mangling template tags is refused."""
+        self.compile_mjml.side_effect = lambda content: content.replace("{{order_id}}", "{ {order_id} }")
+        with self.assertRaises(emails.EmailRenderError):
+            get_compiled_template(ORDER_CONFIRMATION_TEMPLATE)
+
+
+class OrderEmailOutboxTest(CompiledEmailTemplateTestMixin, TestCase):
+    """Test the order email outbox against a local SMTP stub."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        from site_settings.models import OrganisationSettings
+        from smtp.models import SMTPSettings
+        from wagtail.models import Site
+
+        self.smtp = SMTPStub()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+
+        SMTPSettings.objects.create(
+            site=Site.objects.get(is_default_site=True), email_host='127.0.0.1',
+            email_port=self.smtp.server_address[1], email_host_user='shop@example.com',
+            email_host_password='secret', use_tls=False,
+        )
+        OrganisationSettings.objects.create(
+            nom_entreprise="Boutique", numero_siret="12345678900011", adresse_rue="1 rue",
+            adresse_code_postal="75001", adresse_ville="Paris", adresse_pays="France",
+        )
+        CheckoutSettings.objects.create(enable_email_notifications=True)
+
+    def create_order(self, email):
+        return Order.objects.create(
+            total_amount=Decimal("10.00"), payment_method='COD', delivery_option='pickup', email=email
+        )
+
+    def test_batch_sent_over_one_connection(self):
+        """Test pending emails are drained over a single SMTP connection."""
+        for index in range(3):
+            OrderEmail.enqueue(self.create_order(f"client{index}@example.com"))
+        out = StringIO()
+        call_command('send_order_emails', stdout=out)
+        self.assertIn("3 email(s) envoyé(s)", out.getvalue())
+        self.assertEqual(sorted(self.smtp.messages), [f"client{index}@example.com" for index in range(3)])
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(OrderEmail.objects.filter(status='sent').count(), 3)
+
+    def test_enqueue_is_idempotent(self):
+        """Test a repeated event queues a single email."""
+        order = self.create_order("client@example.com")
+        OrderEmail.enqueue(order)
+        OrderEmail.enqueue(order)
+        self.assertEqual(order.emails.count(), 1)
+
+    def test_retry_with_backoff_then_dead_letter(self):
+        """Test a rejected email is retried later, then dead-lettered."""
+        self.smtp.rejected.add("refused@example.com")
+        email = OrderEmail.enqueue(self.create_order("refused@example.com"))
+        OrderEmail.enqueue(self.create_order("ok@example.com"))
+        self.assertEqual(send_pending_emails(max_attempts=2), (1, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(send_pending_emails(max_attempts=2), (0, 0))
+
+        OrderEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_pending_emails(max_attempts=2), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('dead', 2))
+        self.assertIn("550", email.last_error)
+        self.assertEqual(self.smtp.messages, ["ok@example.com"])
+
+    def test_unreachable_server_keeps_email_pending(self):
+        """Test a down SMTP server schedules a retry instead of losing the email."""
+        from smtp.models import SMTPSettings
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        SMTPSettings.objects.update(email_port=1)
+        email = OrderEmail.enqueue(self.create_order("client@example.com"))
+        self.assertEqual(send_pending_emails(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+
+
+def stripe_signature(payload, secret, timestamp=None):
+    """Stripe-Signature header for `payload`, as Stripe computes it."""
+    timestamp = int(timestamp or time.time())
+    digest = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+class PaymentWebhookTest(TestCase):
+    """Test idempotent payment event ingestion and batched processing."""
+
+    secret = "whsec_test"
+
+    def setUp(self):
+        cache.clear()
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        CheckoutSettings.objects.create(enable_email_notifications=True, stripe_webhook_secret=self.secret)
+        self.product = create_product("Produit", stock=5)
+
+    def create_paid_order(self, intent):
+        order = Order.objects.create(
+            user=self.user, total_amount=Decimal("10.00"), payment_method='Stripe',
+            delivery_option='pickup', stripe_payment_intent_id=intent,
+        )
+        cart, created = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.get_or_create(cart=cart, product=self.product, defaults={
+            'quantity': 1, 'unit_price': Decimal("10.00"),
+        })
+        reserve_stock(order, get_cart_items(cart), 15)
+        return order
+
+    def post_event(self, event_id, event_type, intent, secret=secret):
+        payload = json.dumps({'id': event_id, 'type': event_type, 'data': {'object': {'id': intent}}})
+        headers = {'Stripe-Signature': stripe_signature(payload, secret)} if secret else {}
+        return self.client.post(
+            "/checkout/webhooks/stripe/", payload, content_type='application/json', headers=headers,
+        )
+
+    def test_replayed_events_are_noops(self):
+        """Test retries are acknowledged with a constant, cheap insert."""
+        order = self.create_paid_order("pi_1")
+        self.assertEqual(self.post_event("evt_1", "payment_intent.succeeded", "pi_1").status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                self.assertEqual(self.post_event("evt_1", "payment_intent.succeeded", "pi_1").status_code, 200)
+        self.assertLessEqual(len(queries), 10)
+        self.assertFalse([query for query in queries if 'checkout_order' in query['sql']])
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+        self.assertEqual(process_payment_events(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertFalse(order.stock_shortage)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        self.assertEqual(order.emails.count(), 1)
+        self.assertEqual(StockReservation.objects.filter(order=order, status='committed').count(), 1)
+
+        # A new event for an order already paid changes nothing
+        self.post_event("evt_2", "payment_intent.succeeded", "pi_1")
+        self.post_event("evt_3", "payment_intent.payment_failed", "pi_1")
+        self.assertEqual(process_payment_events(), 2)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertEqual(process_payment_events(), 0)
+
+    def test_batch_processing(self):
+        """Test a batch mixes payments, failures and unknown orders."""
+        paid = self.create_paid_order("pi_paid")
+        failed = self.create_paid_order("pi_failed")
+        self.post_event("evt_paid", "payment_intent.succeeded", "pi_paid")
+        self.post_event("evt_failed", "payment_intent.payment_failed", "pi_failed")
+        self.post_event("evt_unknown", "payment_intent.succeeded", "pi_unknown")
+        self.post_event("evt_other", "charge.refunded", "pi_paid")
+        out = StringIO()
+        call_command('process_payment_events', '--batch-size', '2', stdout=out)
+        self.assertIn("4 événement(s)", out.getvalue())
+        paid.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((paid.status, failed.status), ('paid', 'canceled'))
+        self.assertEqual(
+            dict(PaymentEvent.objects.values_list('event_id', 'status')),
+            {'evt_paid': 'processed', 'evt_failed': 'processed', 'evt_unknown': 'ignored', 'evt_other': 'ignored'},
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 4)
+
+    def test_payment_after_stock_lost_flags_order(self):
+        """Test a payment whose expired hold cannot be taken again flags the order."""
+        order = self.create_paid_order("pi_late")
+        release_reservations(order)
+        ProductPage.objects.filter(pk=self.product.pk).update(stock_quantity=0)
+        self.post_event("evt_late", "payment_intent.succeeded", "pi_late")
+        with self.assertLogs('checkout.webhooks', 'WARNING') as logs:
+            self.assertEqual(process_payment_events(), 1)
+        self.assertIn(order.reference, logs.output[0])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertTrue(order.stock_shortage)
+        self.assertEqual(PaymentEvent.objects.get().status, 'processed')
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'released')
+
+    def test_site_confirmation_is_notify_only(self):
+        """Test the unauthenticated payment page callback cannot mark an order paid."""
+        order = self.create_paid_order("pi_site")
+        response = self.client.post(
+            f"/checkout/update_order_status/{order.id}/", {'status': 'paid'}, content_type='application/json'
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertFalse(PaymentEvent.objects.exists())
+        # A site event recorded before this change is ignored
+        record_event('site', f"order-{order.id}-paid", 'order.paid', target_status='paid', order_id=order.id)
+        self.assertEqual(process_payment_events(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'ordered')
+        self.assertEqual(PaymentEvent.objects.get().status, 'ignored')
+        self.assertTrue(Cart.objects.filter(user=self.user).exists())
+        self.assertFalse(order.emails.exists())
+
+    def test_claimed_events_not_processed_twice(self):
+        """Test a batch claimed by one worker is skipped by another until its lease expires."""
+        order = self.create_paid_order("pi_claim")
+        self.post_event("evt_claim", "payment_intent.succeeded", "pi_claim")
+        claimed = claim_events(10)
+        self.assertEqual([event.event_id for event in claimed], ["evt_claim"])
+        self.assertEqual(claim_events(10), [])
+        self.assertEqual(process_payment_events(), 0)
+        # A worker that stopped mid-batch: its events are taken again after the lease
+        later = timezone.now() + timedelta(seconds=CLAIM_LEASE + 1)
+        self.assertEqual(len(claim_events(10, now=later)), 1)
+        PaymentEvent.objects.update(claimed_until=timezone.now())
+        self.assertEqual(process_payment_events(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+
+    def test_transition_reads_current_order_status(self):
+        """Test an order paid by another worker during the batch is not paid again."""
+        from checkout import webhooks
+        order = self.create_paid_order("pi_twice")
+        self.post_event("evt_twice", "payment_intent.succeeded", "pi_twice")
+        real_get_settings = webhooks.get_settings
+
+        def paid_meanwhile(model):
+            # Another worker pays the order after this batch resolved it
+            webhooks.mark_order_paid(Order.objects.get(pk=order.pk), notify=True)
+            return real_get_settings(model)
+
+        with mock.patch('checkout.webhooks.get_settings', paid_meanwhile), \
+                mock.patch('checkout.webhooks.commit_reservations', wraps=webhooks.commit_reservations) as commit:
+            self.assertEqual(process_payment_events(), 1)
+        self.assertEqual(commit.call_count, 1)
+        self.assertEqual(order.emails.count(), 1)
+        self.assertEqual(StockReservation.objects.filter(order=order, status='committed').count(), 1)
+
+    def test_unsigned_or_forged_events_rejected(self):
+        """Test events are only recorded with a valid signature from the configured secret."""
+        order = self.create_paid_order("pi_forged")
+        self.assertEqual(self.post_event("evt_unsigned", "payment_intent.succeeded", "pi_forged", None).status_code, 400)
+        self.assertEqual(self.post_event("evt_forged", "payment_intent.succeeded", "pi_forged", "whsec_other").status_code, 400)
+        # No secret configured: refused until it is, Stripe retries later
+        settings_instance = CheckoutSettings.objects.get()
+        settings_instance.stripe_webhook_secret = ""
+        with self.captureOnCommitCallbacks(execute=True):
+            settings_instance.save()
+        with self.assertLogs('checkout.views', 'ERROR'):
+            response = self.post_event("evt_no_secret", "payment_intent.succeeded", "pi_forged", None)
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(PaymentEvent.objects.exists())
+        self.assertEqual(process_payment_events(), 0)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'ordered')
+
+
+class OrderItemSnapshotTest(TestCase):
+    """Test cart lines are copied into order lines at checkout."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        variant = ProductVariant.objects.create(name="Taille")
+        self.options = [
+            VariantOption.objects.create(variant=variant, name=name, additional_price=Decimal("1.00"))
+            for name in ("Grand", "Petit")
+        ]
+        self.cart = Cart.objects.create(user=self.user)
+        for index, option in enumerate(self.options):
+            item = CartItem.objects.create(
+                cart=self.cart, product=create_product(f"Produit {index}"), quantity=index + 1,
+                unit_price=Decimal("11.00"), option_signature=str(option.pk),
+            )
+            item.selected_options.add(option)
+        self.cart.recalculate_totals()
+
+    def test_snapshot_uses_constant_queries(self):
+        """Test lines and option rows are inserted with one bulk_create each."""
+        order = create_order()
+        items = get_cart_items(self.cart)
+        with CaptureQueriesContext(connection) as queries:
+            OrderItem.snapshot(order, items)
+        self.assertEqual(len(queries), 2)
+        lines = list(order.items.prefetch_related('selected_options'))
+        self.assertEqual([(line.product_title, line.quantity) for line in lines], [("Produit 0", 1), ("Produit 1", 2)])
+        self.assertEqual([list(line.selected_options.all()) for line in lines], [[self.options[0]], [self.options[1]]])
+        self.assertEqual(lines[1].options_label, "Taille : Petit")
+        self.assertEqual(sum(line.total_price for line in lines), Decimal("33.00"))
+
+    @mock.patch('checkout.schedule.OpeningSchedule.is_open', return_value=True)
+    def test_cod_checkout_keeps_contents(self, is_open):
+        """Test order contents survive the cart deletion after a COD checkout."""
+        CheckoutSettings.objects.create()
+        self.client.force_login(self.user)
+        response = self.client.post("/checkout/checkout/", {
+            'phone_number': "0102030405", 'email': "client@example.com",
+            'payment_method': 'COD', 'delivery_option': 'pickup',
+        })
+        order = Order.objects.get()
+        self.assertRedirects(response, f"/checkout/order_confirmation/{order.id}/", fetch_redirect_response=False)
+        self.assertFalse(Cart.objects.filter(pk=self.cart.pk).exists())
+        # No TaxUser: the store default rate (20%) applies
+        self.assertEqual(order.total_amount, Decimal("39.60"))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(OrderItem.selected_options.through.objects.filter(orderitem__order=order).count(), 2)
+
+
+@override_settings(
+    CHECKOUT_PAYMENT_GATEWAY='checkout.payments.FakeGateway', CHECKOUT_FAKE_GATEWAY_LATENCY=0, STORAGES=STATIC_STORAGES,
+)
+@mock.patch('checkout.schedule.OpeningSchedule.is_open', return_value=True)
+class PaymentGatewayTest(TestCase):
+    """Test checkout through the pluggable payment gateway."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(
+            username="client", email="client@example.com", password="motdepasse"
+        )
+        CheckoutSettings.objects.create()
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=create_product("Produit"), unit_price=Decimal("10.00"))
+        cart.recalculate_totals()
+        self.client.force_login(self.user)
+
+    def post_checkout(self):
+        return self.client.post("/checkout/checkout/", {
+            'phone_number': "0102030405", 'email': "client@example.com",
+            'payment_method': 'Stripe', 'delivery_option': 'pickup',
+        })
+
+    def test_fake_gateway_end_to_end(self, is_open):
+        """Test a Stripe checkout and its webhook confirmation run offline."""
+        response = self.post_checkout()
+        order = Order.objects.get()
+        self.assertTrue(order.stripe_payment_intent_id.startswith("pi_fake_"))
+        self.assertContains(response, f"{order.stripe_payment_intent_id}_secret")
+
+        response = self.client.post(
+            "/checkout/webhooks/stripe/", FakeGateway.build_event(order.stripe_payment_intent_id),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(process_payment_events(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+
+    def test_order_total_includes_taxes(self, is_open):
+        """Test the order total is the pricing engine's TTC for the customer's tax category."""
+        from taxes.models import TaxMatrice, TaxProduct, TaxUser
+        tax_user = TaxUser.objects.create(tax_name="Particulier")
+        tax_product = TaxProduct.objects.create(tax_name="Normal")
+        TaxMatrice.objects.create(tax_product=tax_product, tax_user=tax_user, tax_rate=Decimal("20.00"), tax_account="445710")
+        self.user.tax_user = tax_user
+        self.user.save()
+        ProductPage.objects.update(tax_product=tax_product)
+        with mock.patch.object(FakeGateway, '_create_payment_intent', wraps=FakeGateway()._create_payment_intent) as create:
+            self.post_checkout()
+        self.assertEqual(Order.objects.get().total_amount, Decimal("12.00"))
+        self.assertEqual(create.call_args.args[0], Decimal("12.00"))
+
+    def test_gateway_error_cancels_order(self, is_open):
+        """Test a refused payment intent cancels the order."""
+        with mock.patch.object(FakeGateway, 'create_payment_intent', side_effect=PaymentError("Refusé")):
+            response = self.post_checkout()
+        self.assertContains(response, "Refusé")
+        self.assertEqual(Order.objects.get().status, 'canceled')
+
+
+@override_settings(STORAGES=STATIC_STORAGES)
+@mock.patch('checkout.schedule.OpeningSchedule.is_open', return_value=True)
+class CheckoutBenchmarkTest(TransactionTestCase):
+    """Test the end-to-end checkout benchmark command."""
+
+    # The Wagtail root page created by migrations is needed by create_product
+    serialized_rollback = True
+
+    def test_benchmark_reports_each_step(self, is_open):
+        from django.contrib.auth import get_user_model
+        CheckoutSettings.objects.create()
+        product = create_product("Produit", stock=10)
+        out = StringIO()
+        call_command(
+            'benchmark_checkout', '--product-id', str(product.pk), '--shoppers', '3',
+            '--concurrency', '1', '--latency', '0', stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn("3 commande(s) payée(s)", output)
+        for step in ("ajout au panier", "checkout", "webhook", "application des paiements"):
+            self.assertIn(f"{step} : p50", output)
+        self.assertFalse(get_user_model().objects.filter(username__startswith="benchmark-").exists())
+        self.assertFalse(Order.objects.exists())
+
+
+class FakeStripeHandler(http.server.BaseHTTPRequestHandler):
+    """Minimal Stripe API: answers payment intent creation after `delay` with `status`."""
+
+    protocol_version = 'HTTP/1.1'
+    delay = 0
+    status = 200
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        if self.server.status == 200:
+            body = {'id': f"pi_{self.server.requests}", 'object': 'payment_intent',
+                    'client_secret': f"pi_{self.server.requests}_secret"}
+        else:
+            body = {'error': {'type': 'card_error' if self.server.status == 402 else 'api_error',
+                              'code': 'card_declined', 'message': "Erreur simulée"}}
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(self.server.status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            # The client gave up (timeout)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(
+    CHECKOUT_PAYMENT_GATEWAY='checkout.payments.StripeGateway',
+    CHECKOUT_PAYMENT_CONNECT_TIMEOUT=0.5,
+    CHECKOUT_PAYMENT_TIMEOUT=0.2,
+    CHECKOUT_PAYMENT_BREAKER_THRESHOLD=2,
+    CHECKOUT_PAYMENT_BREAKER_RESET=0.3,
+)
+class PaymentCircuitBreakerTest(TestCase):
+    """Test timeouts and the circuit breaker against a local fake Stripe."""
+
+    def setUp(self):
+        cache.clear()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeStripeHandler)
+        self.server.daemon_threads = True
+        self.server.delay, self.server.status = 0, 200
+        self.server.requests = self.server.connections = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        api_base = override_settings(CHECKOUT_STRIPE_API_BASE=f"http://127.0.0.1:{self.server.server_port}")
+        api_base.enable()
+        self.addCleanup(api_base.disable)
+        self.settings_instance = CheckoutSettings(stripe_api_key="sk_test")
+
+    def create_intent(self):
+        return get_payment_gateway().create_payment_intent(
+            Decimal("10.00"), "EUR", "client@example.com", self.settings_instance
+        )
+
+    def test_success_reuses_connection(self):
+        """Test intents are created over one kept-alive connection."""
+        self.assertEqual(self.create_intent().client_secret, "pi_1_secret")
+        self.assertEqual(self.create_intent().id, "pi_2")
+        self.assertEqual((self.server.requests, self.server.connections), (2, 1))
+        self.assertEqual(get_breaker('stripe').metrics()['successes'], 2)
+
+    def test_slow_provider_opens_breaker(self):
+        """Test timeouts are bounded and the breaker then fails fast."""
+        self.server.delay = 1
+        for _ in range(2):
+            start = time.monotonic()
+            with self.assertRaises(PaymentUnavailable):
+                self.create_intent()
+            self.assertLess(time.monotonic() - start, 0.8)
+        requests = self.server.requests
+
+        start = time.monotonic()
+        with self.assertRaises(PaymentUnavailable):
+            self.create_intent()
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(self.server.requests, requests)
+        metrics = get_breaker('stripe').metrics()
+        self.assertEqual((metrics['state'], metrics['failures'], metrics['rejections']), ('open', 2, 1))
+
+        out = StringIO()
+        call_command('payment_gateway_status', stdout=out)
+        self.assertIn("ouvert", out.getvalue())
+
+        # After the reset timeout a single trial call closes the breaker again
+        self.server.delay = 0
+        time.sleep(0.35)
+        self.assertEqual(get_breaker('stripe').state(), 'half_open')
+        self.create_intent()
+        self.assertEqual(get_breaker('stripe').state(), 'closed')
+
+    def test_state_kept_in_shared_cache(self):
+        """Test the breaker state lives in the cache, where another process's breaker reads it."""
+        breaker = get_breaker('stripe')
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            for _ in range(2):
+                breaker.record_failure()
+        other = CircuitBreaker(breaker.name, breaker.failure_threshold, breaker.reset_timeout)
+        self.assertEqual(other.state(), 'open')
+        self.assertEqual((other.metrics()['failures'], other.metrics()['consecutive_failures']), (2, 2))
+        # Counters are created without a timeout: they never expire
+        self.assertTrue(add.call_args_list)
+        self.assertTrue(all(args[2] is None for args, kwargs in add.call_args_list))
+
+    def test_failed_trial_reopens(self):
+        """Test a failing half-open trial reopens the breaker at once."""
+        self.server.status = 500
+        for _ in range(2):
+            with self.assertRaises(PaymentUnavailable):
+                self.create_intent()
+        time.sleep(0.35)
+        with self.assertRaises(PaymentUnavailable):
+            self.create_intent()
+        self.assertEqual(get_breaker('stripe').state(), 'open')
+
+    def test_card_errors_do_not_trip(self):
+        """Test client errors are not counted as provider failures."""
+        self.server.status = 402
+        for _ in range(3):
+            with self.assertRaises(PaymentError) as raised:
+                self.create_intent()
+            self.assertNotIsInstance(raised.exception, PaymentUnavailable)
+        self.assertEqual(get_breaker('stripe').state(), 'closed')
+
+    @override_settings(CHECKOUT_PAYMENT_GATEWAY='checkout.payments.FakeGateway', CHECKOUT_FAKE_GATEWAY_FAILURE_RATE=1)
+    def test_fake_gateway_injected_errors(self):
+        """Test the fake gateway's injected errors trip the breaker too."""
+        for _ in range(3):
+            with self.assertRaises(PaymentUnavailable):
+                self.create_intent()
+        out = StringIO()
+        call_command('payment_gateway_status', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['rejections'], 1)
+        call_command('payment_gateway_status', '--reset', stdout=StringIO())
+        self.assertEqual(get_breaker('stripe').state(), 'closed')
+
+
+class SequenceTest(TestCase):
+    """Test order references and block allocation."""
+
+    def test_order_references(self):
+        """Test orders get increasing references from the block sequence."""
+        first, second = create_order(), create_order()
+        self.assertRegex(first.reference, r"^C\d{8}$")
+        self.assertLess(first.reference, second.reference)
+
+    def test_block_served_from_memory(self):
+        """Test a committed block is handed out without queries."""
+        sequence = BlockSequence("test-block", 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = sequence.next_value()
+        with CaptureQueriesContext(connection) as queries:
+            values = [sequence.next_value() for _ in range(9)]
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(values, list(range(first + 1, first + 10)))
+        self.assertEqual(allocate("test-block").start, first + 10)
+
+    def test_uncommitted_block_is_not_reused(self):
+        """Test a block allocated in a rolled back transaction is never handed out."""
+        sequence = BlockSequence("test-rollback", 10)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                sequence.next_value()
+                raise ValueError("rollback")
+        self.assertEqual(sequence.next_value(), 1)
+
+
+class SequenceConcurrencyTest(TransactionTestCase):
+    """Test many threads allocating numbers at once."""
+
+    serialized_rollback = True
+    threads = 8
+    per_thread = 25
+
+    def run_threads(self, allocate_one):
+        barrier = threading.Barrier(self.threads)
+        results, errors = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.per_thread):
+                    for attempt in range(200):
+                        try:
+                            results.append(allocate_one())
+                            break
+                        except OperationalError:
+                            # SQLite locks the whole database: retry
+                            time.sleep(0.005)
+                    else:
+                        errors.append("locked")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_block_sequence_is_unique(self):
+        sequence = BlockSequence("concurrent-orders", 10)
+        values = self.run_threads(sequence.next_value)
+        self.assertEqual(len(values), self.threads * self.per_thread)
+        self.assertEqual(len(set(values)), len(values))
+        # One write per block, not per value
+        self.assertLessEqual(Sequence.objects.get(name="concurrent-orders").last_value, len(values) + 10 * self.threads)
@@ -1,7 +1,7 @@
 # urls.py
 
 from django.urls import path
-from .views import checkout, update_order_status,order_confirmation
+from .views import checkout, update_order_status, order_confirmation, stripe_webhook
 
 app_name = 'checkout'
 
@@ -9,4 +9,5 @@ urlpatterns = [
     path('checkout/', checkout, name='checkout'),
     path('update_order_status/<int:order_id>/', update_order_status, name='update_order_status'),
     path('order_confirmation/<int:order_id>/', order_confirmation, name='order_confirmation'),
+    path('webhooks/stripe/', stripe_webhook, name='stripe_webhook'),
 ]
@@ -0,0 +1,160 @@
+"""
+Ingestion idempotente des événements de paiement.
+
+Les points d'accès n'appellent que ``record_event`` : un INSERT qui ignore les conflits
+sur (prestataire, id d'événement), sans charger la commande ni toucher au panier.
+Un événement rejoué par le prestataire est donc un no-op et la latence reste constante
+pendant une rafale de tentatives.
+
+``process_payment_events`` applique ensuite les changements de statut par lots. Chaque
+lot est réservé par un bail (``claim_events``) : deux workers ne traitent pas les mêmes
+événements. Les transitions relisent la commande verrouillée et vérifient son statut
+courant : un second événement « payé » pour une commande déjà payée ne refait rien.
+
+Seuls les événements des prestataires, à la signature vérifiée, changent le statut
+d'une commande : la confirmation envoyée par la page de paiement n'est qu'indicative.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from cart.models import Cart
+from site_settings.provider import get_settings
+from .models import CheckoutSettings, Order, OrderEmail, PaymentEvent
+from .stock import commit_reservations, release_reservations
+
+logger = logging.getLogger(__name__)
+
+# Types d'événements Stripe et statut de commande correspondant
+STRIPE_EVENT_STATUSES = {
+    'payment_intent.succeeded': 'paid',
+    'payment_intent.payment_failed': 'canceled',
+    'payment_intent.canceled': 'canceled',
+}
+
+PAID_STATUSES = {'paid', 'ready', 'shipped', 'delivered'}
+
+# Événements enregistrés sans signature : jamais appliqués
+UNVERIFIED_PROVIDERS = {'site'}
+
+# Durée de réservation d'un lot ; passé ce délai, un lot non terminé est repris
+CLAIM_LEASE = 5 * 60
+
+
+def record_event(provider, event_id, event_type, target_status='', order_id=None, payment_intent_id='', payload=None):
+    """Enregistre l'événement s'il n'a pas déjà été reçu (sans erreur sinon)."""
+    PaymentEvent.objects.bulk_create([
+        PaymentEvent(
+            provider=provider,
+            event_id=event_id,
+            event_type=event_type,
+            target_status=target_status,
+            order_id=order_id,
+            payment_intent_id=payment_intent_id or '',
+            payload=payload or {},
+        )
+    ], ignore_conflicts=True)
+
+
+def mark_order_paid(order, notify):
+    """
+    Commande payée : stock confirmé, panier supprimé, email mis en file. False si déjà payée.
+    Si du stock libéré entre-temps n'a pas pu être repris, la commande est signalée (stock_shortage).
+    """
+    if order.status in PAID_STATUSES:
+        return False
+    order.update_status('paid')
+    missing = commit_reservations(order)
+    if missing:
+        logger.warning(
+            f"Commande {order.reference or order.pk} payée sans stock suffisant, "
+            f"réservations non confirmées : {[reservation.pk for reservation in missing]}"
+        )
+        order.stock_shortage = True
+        order.save(update_fields=['stock_shortage'])
+    cart = Cart.objects.filter(user=order.user).first() if order.user_id else None
+    if cart:
+        cart.delete()
+    if notify:
+        OrderEmail.enqueue(order)
+    return True
+
+
+def mark_order_canceled(order, notify):
+    """Paiement échoué : la commande en attente est annulée et son stock restitué."""
+    if order.status != 'ordered':
+        return False
+    order.update_status('canceled')
+    release_reservations(order)
+    return True
+
+
+TRANSITIONS = {
+    'paid': mark_order_paid,
+    'canceled': mark_order_canceled,
+}
+
+
+def claim_events(batch_size, now=None):
+    """
+    Réserve jusqu'à `batch_size` événements à traiter (reçus, ou dont le bail a expiré)
+    en les passant « en cours » jusqu'à la fin du bail CLAIM_LEASE.
+    """
+    now = now or timezone.now()
+    claimable = Q(status='received') | Q(status='processing', claimed_until__lte=now)
+    candidates = list(PaymentEvent.objects.filter(claimable).order_by('pk').values_list('pk', flat=True)[:batch_size])
+    if not candidates:
+        return []
+    lease = now + timedelta(seconds=CLAIM_LEASE)
+    PaymentEvent.objects.filter(claimable, pk__in=candidates).update(status='processing', claimed_until=lease)
+    return list(PaymentEvent.objects.filter(pk__in=candidates, status='processing', claimed_until=lease).order_by('pk'))
+
+
+def process_payment_events(batch_size=100):
+    """
+    Applique un lot d'événements reçus, dans l'ordre de réception.
+    Renvoie le nombre d'événements traités (0 quand il n'y a plus rien à faire).
+    """
+    events = claim_events(batch_size)
+    if not events:
+        return 0
+
+    # Résolution des commandes du lot en deux requêtes ; chacune est relue verrouillée à son tour
+    intent_ids = {event.payment_intent_id for event in events if not event.order_id and event.payment_intent_id}
+    if intent_ids:
+        order_ids = dict(
+            Order.objects.filter(stripe_payment_intent_id__in=intent_ids).values_list('stripe_payment_intent_id', 'pk')
+        )
+        for event in events:
+            if not event.order_id:
+                event.order_id = order_ids.get(event.payment_intent_id)
+    existing = set(
+        Order.objects.filter(pk__in={event.order_id for event in events if event.order_id}).values_list('pk', flat=True)
+    )
+
+    settings_instance = get_settings(CheckoutSettings)
+    notify = bool(settings_instance and settings_instance.enable_email_notifications)
+    now = timezone.now()
+    for event in events:
+        event.processed_at = now
+        transition = TRANSITIONS.get(event.target_status)
+        if event.order_id not in existing or transition is None or event.provider in UNVERIFIED_PROVIDERS:
+            event.status = 'ignored'
+            continue
+        try:
+            with transaction.atomic():
+                # Statut relu sous verrou : une commande n'est payée qu'une fois
+                order = Order.objects.select_for_update().get(pk=event.order_id)
+                transition(order, notify)
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement de l'événement {event}: {e}", exc_info=True)
+            event.status = 'failed'
+            event.error = str(e)
+        else:
+            event.status = 'processed'
+
+    PaymentEvent.objects.bulk_update(events, ['status', 'error', 'order', 'processed_at'])
+    return len(events)
@@ -73,6 +73,59 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'accounts.CustomUser'
 LOGOUT_REDIRECT_URL = '/'
 
+# Cache partagé par tous les workers (gunicorn, commandes de gestion) : versions des
+# réglages et des taux de change, résumés de panier, paniers anonymes, disjoncteur
+# de paiement. En production, Redis (REDIS_URL, ex. « redis://redis:6379/1 ») : un
+# cache local au processus ne convient pas, chaque worker aurait ses propres versions
+# et les invalidations ne se propageraient pas (voir production.py). Les versions des
+# réglages et des taux n'expirent pas : avec une politique d'éviction « volatile-* »
+# (ou noeviction), Redis ne les supprime jamais pour faire de la place.
+# Sans REDIS_URL (développement, tests), cache mémoire du processus.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Stockage des paniers anonymes (voir cart/storage.py) :
+# "cart.storage.SignedCookieCartStorage", "cart.storage.CacheCartStorage"
+# ou "cart.storage.DatabaseCartStorage" (un Cart en base par session).
+CART_GUEST_STORAGE = "cart.storage.SignedCookieCartStorage"
+CART_COOKIE_NAME = "cart"
+CART_COOKIE_AGE = 60 * 60 * 24 * 30
+
+# Sert les vues JSON du panier en asynchrone (cart/async_views.py) ; à activer
+# uniquement derrière un serveur ASGI (cmz.asgi), sous WSGI elles seraient plus lentes
+CART_ASYNC_VIEWS = False
+
+# HTML compilé des gabarits d'emails MJML (voir checkout/emails.py)
+MJML_CACHE_DIR = os.path.join(BASE_DIR, "mjml_cache")
+
+# Passerelle de paiement (voir checkout/payments.py) : "checkout.payments.StripeGateway"
+# ou "checkout.payments.FakeGateway" (hors ligne, latence simulée en secondes)
+CHECKOUT_PAYMENT_GATEWAY = "checkout.payments.StripeGateway"
+CHECKOUT_FAKE_GATEWAY_LATENCY = 0
+CHECKOUT_FAKE_GATEWAY_FAILURE_RATE = 0
+
+# Délais (secondes) des appels au prestataire de paiement et disjoncteur (checkout/breaker.py) :
+# ouvert après THRESHOLD échecs consécutifs, un appel d'essai au bout de RESET secondes
+CHECKOUT_PAYMENT_CONNECT_TIMEOUT = 2
+CHECKOUT_PAYMENT_TIMEOUT = 5
+CHECKOUT_PAYMENT_BREAKER_THRESHOLD = 5
+CHECKOUT_PAYMENT_BREAKER_RESET = 30
+
+# Références de commande réservées par blocs par chaque worker (voir checkout/sequences.py)
+CHECKOUT_ORDER_SEQUENCE_BLOCK = 50
+
 TAILWIND_APP_NAME = 'theme'
 
 INTERNAL_IPS = ["127.0.0.1",]
@@ -84,6 +137,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "cart.middleware.CartStorageMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -1,7 +1,13 @@
+from django.core.exceptions import ImproperlyConfigured
+
 from .base import *
 
 DEBUG = False
 
+# Les workers doivent partager leur cache (voir CACHES dans base.py)
+if not REDIS_URL:
+    raise ImproperlyConfigured("REDIS_URL doit désigner le serveur Redis partagé par les workers.")
+
 try:
     from .local import *
 except ImportError:
@@ -164,60 +164,76 @@ document.addEventListener('DOMContentLoaded', function () {
                 });
         }
 
-        // Fonction pour mettre à jour la quantité d'un article
-        function updateCartItem(e) {
-            const itemId = e.target.getAttribute('data-item-id');
-            const quantity = e.target.value;
+        // Les modifications rapprochées sont regroupées et envoyées en un seul appel à /cart/batch/
+        let pendingOperations = [];
+        let hiddenRows = [];
+        let flushTimer = null;
+
+        function queueCartOperation(operation) {
+            pendingOperations.push(operation);
+            clearTimeout(flushTimer);
+            flushTimer = setTimeout(flushCartOperations, 400);
+        }
+
+        function flushCartOperations() {
+            const operations = pendingOperations;
+            const rows = hiddenRows;
+            pendingOperations = [];
+            hiddenRows = [];
+            if (operations.length === 0) {
+                return;
+            }
 
-            fetch(`/cart/update/${itemId}/`, {
+            // Échec du lot : le serveur l'a annulé en entier, on réaffiche les lignes
+            // masquées par anticipation puis on recharge l'état réel du panier
+            function restoreCart(message) {
+                rows.forEach(row => {
+                    row.style.display = '';
+                });
+                toastr.error(message || 'Erreur lors de la mise à jour du panier.');
+                fetchCartData();
+            }
+
+            fetch('/cart/batch/', {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
+                    'Content-Type': 'application/json',
                     'X-CSRFToken': getCSRFToken(),
                     'X-Requested-With': 'XMLHttpRequest'
                 },
-                body: `quantity=${quantity}`
+                body: JSON.stringify({ operations: operations })
             })
-                .then(response => response.json())
-                .then(data => {
-                    console.log('Update Cart Response:', data); // Log pour débogage
-                    if (data.success) {
+                .then(response => response.json()
+                    .catch(() => ({}))
+                    .then(data => ({ ok: response.ok, data: data })))
+                .then(({ ok, data }) => {
+                    console.log('Batch Cart Response:', data); // Log pour débogage
+                    if (ok && data.success) {
                         fetchCartData();
                     } else {
-                        toastr.error('Erreur lors de la mise à jour du panier.');
+                        restoreCart(data.message);
                     }
                 })
                 .catch(error => {
-                    console.error('Error updating cart item:', error);
-                    toastr.error('Erreur lors de la mise à jour du panier.');
+                    console.error('Error updating cart:', error);
+                    restoreCart();
                 });
         }
 
+        // Fonction pour mettre à jour la quantité d'un article
+        function updateCartItem(e) {
+            const itemId = parseInt(e.target.getAttribute('data-item-id'), 10);
+            const quantity = parseInt(e.target.value, 10);
+            queueCartOperation({ op: 'update', item_id: itemId, quantity: quantity });
+        }
+
         // Fonction pour supprimer un article
         function removeCartItem(e) {
-            const itemId = e.target.getAttribute('data-item-id');
-
-            fetch(`/cart/remove/${itemId}/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                    'X-CSRFToken': getCSRFToken(),
-                    'X-Requested-With': 'XMLHttpRequest'
-                },
-            })
-                .then(response => response.json())
-                .then(data => {
-                    console.log('Remove Cart Response:', data); // Log pour débogage
-                    if (data.success) {
-                        fetchCartData();
-                    } else {
-                        toastr.error('Erreur lors de la suppression du produit.');
-                    }
-                })
-                .catch(error => {
-                    console.error('Error removing cart item:', error);
-                    toastr.error('Erreur lors de la suppression du produit.');
-                });
+            const itemId = parseInt(e.target.getAttribute('data-item-id'), 10);
+            const row = e.target.closest('.cart-item');
+            row.style.display = 'none';
+            hiddenRows.push(row);
+            queueCartOperation({ op: 'remove', item_id: itemId });
         }
 
         // Fonction pour obtenir le token CSRF
@@ -237,8 +253,26 @@ document.addEventListener('DOMContentLoaded', function () {
             return cookieValue;
         }
 
+        // Résumé léger pour le badge : servi depuis le cache et revalidé par ETag
+        function fetchCartSummary() {
+            fetch('/cart/summary/', { cache: 'no-cache' })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Erreur lors de la récupération du résumé du panier');
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    cartCount.textContent = data.cart_item_count;
+                    cartTotal.textContent = data.cart_total.toFixed(2);
+                })
+                .catch(error => {
+                    console.error('Error fetching cart summary:', error);
+                });
+        }
+
         // Initialiser le compteur du panier au chargement de la page
-        fetchCartData();
+        fetchCartSummary();
     } else {
         console.warn('Certains éléments du panier sont manquants dans le DOM.');
     }
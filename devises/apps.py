@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class DevisesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "devises"
-    verbose_name = "Devises"
\ No newline at end of file
+    verbose_name = "Devises"
+
+    def ready(self):
+        from . import rates  # noqa: F401
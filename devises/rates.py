@@ -0,0 +1,145 @@
+"""
+Table des taux de change en mémoire, indexée par date.
+
+L'historique de chaque devise est chargé une fois (une requête) dans deux listes triées
+(dates, taux) ; ``get_rate`` renvoie le dernier taux connu à une date par recherche
+dichotomique, sans requête.
+
+Un enregistrement ou une suppression de RateCurrency (signaux post_save / post_delete)
+met à jour, au commit, la table du processus sur place et change la version de la
+devise dans le cache Django, partagé par les workers (voir CACHES). Chaque processus
+relit cette version au plus toutes les ``VERSION_CHECK_INTERVAL`` secondes et recharge
+alors la seule devise modifiée : un taux saisi sur un worker est vu par les autres
+dans ce délai, sans lecture du cache à chaque conversion. Une table est de toute façon
+rechargée au bout de ``TABLE_MAX_AGE`` secondes, ce qui borne l'effet de deux
+modifications simultanées sur deux workers.
+Après un ``bulk_create`` ou un ``update``, appeler ``invalidate_rates``.
+"""
+import time
+from bisect import bisect_right
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import RateCurrency
+
+# Secondes entre deux lectures de la version partagée, et âge maximal d'une table
+VERSION_CHECK_INTERVAL = 5
+TABLE_MAX_AGE = 300
+
+_tables = {}
+
+
+class RateTable:
+    """Historique d'une devise : {pk: (date, taux)} et ses listes triées par date."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = {pk: (rate_date, rate) for pk, rate_date, rate in rows}
+        self.loaded_at = self.checked_at = time.monotonic()
+        self._index()
+
+    def _index(self):
+        # À date égale, la ligne la plus récente (pk le plus grand) l'emporte
+        ordered = sorted((rate_date, pk, rate) for pk, (rate_date, rate) in self.rows.items())
+        self.dates = [rate_date for rate_date, pk, rate in ordered]
+        self.rates = [rate for rate_date, pk, rate in ordered]
+
+    def upsert(self, pk, rate_date, rate):
+        self.rows[pk] = (rate_date, rate)
+        self._index()
+
+    def remove(self, pk):
+        if self.rows.pop(pk, None) is not None:
+            self._index()
+
+    def rate_at(self, at):
+        index = bisect_right(self.dates, at) - 1
+        return self.rates[index] if index >= 0 else None
+
+
+def _version_key(currency_id):
+    return f'rates:version:{currency_id}'
+
+
+def get_rates_version(currency_id):
+    version = cache.get(_version_key(currency_id))
+    if version is None:
+        cache.add(_version_key(currency_id), time.time_ns(), None)
+        version = cache.get(_version_key(currency_id))
+    return version
+
+
+def _bump_version(currency_id):
+    # Nouvelle valeur plutôt qu'incr : deux workers ne peuvent pas obtenir la même version
+    version = time.time_ns()
+    cache.set(_version_key(currency_id), version, None)
+    return version
+
+
+def get_rate_table(currency_id):
+    """
+    Table de la devise, rechargée si sa version a changé dans un autre processus
+    (vérifiée au plus toutes les VERSION_CHECK_INTERVAL secondes) ou si elle est trop ancienne.
+    """
+    table = _tables.get(currency_id)
+    now = time.monotonic()
+    if table is not None and now - table.checked_at < VERSION_CHECK_INTERVAL:
+        return table
+    version = get_rates_version(currency_id)
+    if table is None or table.version != version or now - table.loaded_at >= TABLE_MAX_AGE:
+        rows = RateCurrency.objects.filter(currency_id=currency_id).values_list('pk', 'date', 'rate')
+        table = _tables[currency_id] = RateTable(version, rows)
+    else:
+        table.checked_at = now
+    return table
+
+
+def get_rate(currency_id, at):
+    """
+    Dernier taux de la devise à la date `at` (date ou datetime), ou None si aucun taux
+    n'est connu à cette date.
+    """
+    if not currency_id or at is None:
+        return None
+    if isinstance(at, datetime):
+        at = timezone.localdate(at) if timezone.is_aware(at) else at.date()
+    return get_rate_table(currency_id).rate_at(at)
+
+
+def invalidate_rates(currency_id=None):
+    """Force le rechargement d'une devise (ou de toutes) dans tous les processus."""
+    currency_ids = [currency_id] if currency_id else list(_tables)
+    for currency_id in currency_ids:
+        _bump_version(currency_id)
+        _tables.pop(currency_id, None)
+
+
+def _apply_change(currency_id, change):
+    table = _tables.get(currency_id)
+    # Mise à jour sur place uniquement si la table était à jour : sinon elle sera rechargée
+    up_to_date = table is not None and table.version == get_rates_version(currency_id)
+    version = _bump_version(currency_id)
+    if up_to_date:
+        change(table)
+        table.version = version
+
+
+@receiver(post_save, sender=RateCurrency)
+def rate_saved(sender, instance, **kwargs):
+    pk, currency_id = instance.pk, instance.currency_id
+    rate_date = instance.date if isinstance(instance.date, date) else date.fromisoformat(instance.date)
+    rate = Decimal(str(instance.rate))
+    # Appliqué au commit : un rollback ne laisse pas de taux fantôme en mémoire
+    transaction.on_commit(lambda: _apply_change(currency_id, lambda table: table.upsert(pk, rate_date, rate)))
+
+
+@receiver(post_delete, sender=RateCurrency)
+def rate_deleted(sender, instance, **kwargs):
+    pk, currency_id = instance.pk, instance.currency_id
+    transaction.on_commit(lambda: _apply_change(currency_id, lambda table: table.remove(pk)))
@@ -0,0 +1,99 @@
+"""
+Tests for the devises app.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from devises import rates
+from devises.models import Currency, RateCurrency
+from devises.rates import get_rate
+
+
+class RateTableTest(TestCase):
+    """Test the in-memory, date-indexed exchange-rate table."""
+
+    def setUp(self):
+        cache.clear()
+        rates._tables.clear()
+        self.addCleanup(rates._tables.clear)
+        self.currency = Currency.objects.create(code="USD")
+        with self.captureOnCommitCallbacks(execute=True):
+            for day, rate in ((1, "1.1000"), (10, "1.2000"), (20, "1.3000")):
+                RateCurrency.objects.create(currency=self.currency, date=date(2025, 1, day), rate=Decimal(rate))
+
+    def rate_queries(self, queries):
+        return [query for query in queries if 'devises_ratecurrency' in query['sql']]
+
+    def test_as_of_lookup(self):
+        """Test the latest rate on or before a date is found without further queries."""
+        self.assertIsNone(get_rate(self.currency.pk, date(2024, 12, 31)))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_rate(self.currency.pk, date(2025, 1, 1)), Decimal("1.1000"))
+            self.assertEqual(get_rate(self.currency.pk, date(2025, 1, 15)), Decimal("1.2000"))
+            self.assertEqual(get_rate(self.currency.pk, timezone.make_aware(timezone.datetime(2025, 3, 1))), Decimal("1.3000"))
+        self.assertEqual(len(queries), 0)
+
+    def test_changes_applied_in_place(self):
+        """Test saved and deleted rates update the warm table without a reload."""
+        get_rate(self.currency.pk, date(2025, 1, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            new_rate = RateCurrency.objects.create(currency=self.currency, date=date(2025, 1, 15), rate=Decimal("1.2500"))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_rate(self.currency.pk, date(2025, 1, 16)), Decimal("1.2500"))
+        self.assertEqual(len(queries), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_rate.delete()
+        self.assertEqual(get_rate(self.currency.pk, date(2025, 1, 16)), Decimal("1.2000"))
+
+    def expire_check(self, seconds=rates.VERSION_CHECK_INTERVAL):
+        """Age the warm table as if `seconds` had passed since it was last checked."""
+        table = rates._tables[self.currency.pk]
+        table.checked_at -= seconds
+        table.loaded_at -= seconds
+
+    def test_other_worker_change_reloads(self):
+        """Test a version bump from another process reloads this currency at the next check."""
+        get_rate(self.currency.pk, date(2025, 1, 1))
+        RateCurrency.objects.filter(date=date(2025, 1, 20)).update(rate=Decimal("1.4000"))
+        self.assertEqual(get_rate(self.currency.pk, date(2025, 2, 1)), Decimal("1.3000"))
+        # Another worker saved: only the shared version changes here
+        rates._bump_version(self.currency.pk)
+        self.assertEqual(get_rate(self.currency.pk, date(2025, 2, 1)), Decimal("1.3000"))
+        self.expire_check()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_rate(self.currency.pk, date(2025, 2, 1)), Decimal("1.4000"))
+        self.assertEqual(len(self.rate_queries(queries)), 1)
+
+    def test_unchanged_version_checked_then_reused(self):
+        """Test an expired check without a new version keeps the table, until its maximum age."""
+        get_rate(self.currency.pk, date(2025, 1, 1))
+        table = rates._tables[self.currency.pk]
+        RateCurrency.objects.filter(date=date(2025, 1, 20)).update(rate=Decimal("1.4000"))
+        self.expire_check()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_rate(self.currency.pk, date(2025, 2, 1)), Decimal("1.3000"))
+        self.assertEqual(self.rate_queries(queries), [])
+        self.assertIs(rates._tables[self.currency.pk], table)
+        # A missed concurrent change is picked up once the table is too old
+        self.expire_check(rates.TABLE_MAX_AGE)
+        self.assertEqual(get_rate(self.currency.pk, date(2025, 2, 1)), Decimal("1.4000"))
+
+    def test_order_save_uses_no_rate_query(self):
+        """Test saving an order on a warm process runs no rate query."""
+        from orders.models import Order
+        Order.objects.create(customer_name="Client", email="client@example.com", country="FR", currency=self.currency)
+        order = Order.objects.get()
+        order.order_date = timezone.now() - timedelta(days=1)
+        get_rate(self.currency.pk, order.order_date)
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+            order.calculate_totals()
+        self.assertEqual(self.rate_queries(queries), [])
+        self.assertEqual(order.currency_rate, Decimal("1.3000"))
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.9 on 2026-10-17 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("factures", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="invoice",
+            name="number",
+            field=models.CharField(
+                blank=True,
+                help_text="Laisser vide pour attribuer le numéro suivant de l'année",
+                max_length=20,
+                unique=True,
+                verbose_name="Numéro de facture",
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.9 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+INVOICE_SEQUENCE_PREFIX = "invoice:"
+
+
+def move_invoice_counters(apps, schema_editor):
+    # Les compteurs « invoice:<année> » étaient tenus dans checkout.Sequence
+    Sequence = apps.get_model("checkout", "Sequence")
+    InvoiceSequence = apps.get_model("factures", "InvoiceSequence")
+    counters = Sequence.objects.filter(name__startswith=INVOICE_SEQUENCE_PREFIX)
+    InvoiceSequence.objects.bulk_create([
+        InvoiceSequence(year=int(counter.name[len(INVOICE_SEQUENCE_PREFIX):]), last_value=counter.last_value)
+        for counter in counters
+    ])
+    counters.delete()
+
+
+def restore_invoice_counters(apps, schema_editor):
+    Sequence = apps.get_model("checkout", "Sequence")
+    InvoiceSequence = apps.get_model("factures", "InvoiceSequence")
+    Sequence.objects.bulk_create([
+        Sequence(name=f"{INVOICE_SEQUENCE_PREFIX}{counter.year}", last_value=counter.last_value)
+        for counter in InvoiceSequence.objects.all()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0012_sequence_order_reference"),
+        ("factures", "0003_alter_invoice_number"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "year",
+                    models.PositiveIntegerField(unique=True, verbose_name="Année"),
+                ),
+                (
+                    "last_value",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Dernier numéro"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Séquence de factures",
+                "verbose_name_plural": "Séquences de factures",
+            },
+        ),
+        migrations.RunPython(move_invoice_counters, restore_invoice_counters),
+    ]
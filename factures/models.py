@@ -1,6 +1,42 @@
-from django.db import models
-from django.utils.timezone import now
+from django.db import models, transaction
+from django.db.models import F
+from django.utils.timezone import localdate, now
 from product.models import ProductPage, ProductVariant
+from taxes.pricing import PricingLine, price_lines
+
+# Numérotation continue par année civile, par exemple « F2025-00042 »
+INVOICE_NUMBER_FORMAT = "F{year}-{number:05d}"
+
+
+class InvoiceSequence(models.Model):
+    """Dernier numéro de facture attribué pour une année (voir next_invoice_number)."""
+    year = models.PositiveIntegerField(unique=True, verbose_name="Année")
+    last_value = models.PositiveIntegerField(default=0, verbose_name="Dernier numéro")
+
+    class Meta:
+        verbose_name = "Séquence de factures"
+        verbose_name_plural = "Séquences de factures"
+
+    def __str__(self):
+        return f"{self.year} : {self.last_value}"
+
+
+def next_invoice_number(year):
+    """
+    Numéro de la prochaine facture de l'année `year`. À appeler dans la transaction
+    qui enregistre la facture : la ligne du compteur reste verrouillée jusqu'au commit
+    et un échec annule aussi l'incrément (numérotation sans trou ni doublon).
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise transaction.TransactionManagementError(
+            "La numérotation des factures doit se faire dans la transaction de la facture."
+        )
+    # L'UPDATE passe en premier : c'est lui qui prend le verrou
+    counter = InvoiceSequence.objects.filter(year=year)
+    if not counter.update(last_value=F('last_value') + 1):
+        InvoiceSequence.objects.bulk_create([InvoiceSequence(year=year)], ignore_conflicts=True)
+        counter.update(last_value=F('last_value') + 1)
+    return INVOICE_NUMBER_FORMAT.format(year=year, number=counter.values_list('last_value', flat=True).get())
 
 
 class Invoice(models.Model):
@@ -10,7 +46,10 @@ class Invoice(models.Model):
         ("cancelled", "Annulée"),   # Annulée
     ]
 
-    number = models.CharField(max_length=20, unique=True, verbose_name="Numéro de facture")
+    number = models.CharField(
+        max_length=20, unique=True, blank=True, verbose_name="Numéro de facture",
+        help_text="Laisser vide pour attribuer le numéro suivant de l'année",
+    )
     billing_address = models.TextField(verbose_name="Adresse de facturation")
     total_ht = models.DecimalField(max_digits=10, decimal_places=2, default=0.0, verbose_name="Total HT")
     total_tva = models.DecimalField(max_digits=10, decimal_places=2, default=0.0, verbose_name="TVA")
@@ -21,6 +60,50 @@ class Invoice(models.Model):
     cancelled_at = models.DateTimeField(null=True, blank=True, verbose_name="Annulée le")
     cancellation_reason = models.TextField(null=True, blank=True, verbose_name="Raison d'annulation")
 
+    def save(self, *args, **kwargs):
+        if self.number and self._number_rolled_back():
+            # Numéro et ligne annulés avec la transaction : la facture est à recréer
+            self._clear_number()
+        if self.number:
+            return super().save(*args, **kwargs)
+        # Numéro et facture dans la même transaction : numérotation sans trou
+        adding = self._state.adding
+        try:
+            with transaction.atomic():
+                self.number = next_invoice_number(localdate(self.created_at).year)
+                super().save(*args, **kwargs)
+                # Confirmé au commit : sinon la ligne et le numéro ont été annulés
+                self._number_pending = adding
+                transaction.on_commit(self._confirm_number)
+        except Exception:
+            if adding:
+                self._clear_number()
+            else:
+                self.number = ""
+            raise
+
+    def _confirm_number(self):
+        self._number_pending = False
+
+    def _clear_number(self):
+        self.number = ""
+        self.pk = None
+        self._state.adding = True
+        self._number_pending = False
+
+    def _number_rolled_back(self):
+        """
+        Vrai si la transaction qui a attribué le numéro a été annulée. Hors transaction,
+        un numéro non confirmé par son rappel on_commit a été annulé ; dans une transaction
+        (le rappel peut être encore en attente), la ligne enregistrée doit encore exister.
+        """
+        if not getattr(self, "_number_pending", False):
+            return False
+        if not transaction.get_connection().in_atomic_block:
+            return True
+        # La clé primaire d'une ligne annulée peut être réattribuée : la date l'identifie aussi
+        return not Invoice.objects.filter(pk=self.pk, number=self.number, created_at=self.created_at).exists()
+
     def cancel(self, reason):
         """
         Annule une facture avec justification.
@@ -32,6 +115,13 @@ class Invoice(models.Model):
         self.cancellation_reason = reason
         self.save()
 
+    def calculate_totals(self):
+        """Totaux HT/TVA/TTC des lignes, par le moteur de prix (voir taxes.pricing)."""
+        pricing = price_lines(line.pricing_line() for line in self.lines.all())
+        self.total_ht, self.total_tva, self.total_ttc = pricing.ht, pricing.tva, pricing.ttc
+        self.save(update_fields=['total_ht', 'total_tva', 'total_ttc'])
+        return pricing
+
     def generate_pdf(self):
         """
         Génération de facture PDF (Factur-X ou autre).
@@ -53,17 +143,23 @@ class InvoiceLine(models.Model):
     tax_rate = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Taux de TVA (%)")
     weight = models.DecimalField(max_digits=10, decimal_places=2, default=0.0, verbose_name="Poids du produit")
 
+    def pricing_line(self):
+        return PricingLine(unit_price=self.unit_price_ht, quantity=self.quantity, tax_rate=self.tax_rate, source=self)
+
+    def _priced(self):
+        return price_lines([self.pricing_line()]).lines[0]
+
     def calculate_ht(self):
         """Calcule le montant HT pour cette ligne"""
-        return self.unit_price_ht * self.quantity
+        return self._priced().ht
 
     def calculate_tva(self):
         """Calcule la TVA pour cette ligne"""
-        return self.calculate_ht() * (self.tax_rate / 100)
+        return self._priced().tva
 
     def calculate_ttc(self):
         """Calcule le montant TTC pour cette ligne"""
-        return self.calculate_ht() + self.calculate_tva()
+        return self._priced().ttc
 
     def __str__(self):
         return f"{self.product.title if self.product else 'Produit inconnu'} x {self.quantity}"
@@ -0,0 +1,141 @@
+"""
+Tests for the factures app.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from factures.models import Invoice, InvoiceSequence, next_invoice_number
+
+
+def create_invoice(**fields):
+    return Invoice.objects.create(billing_address="1 rue", due_date=timezone.now() + timedelta(days=30), **fields)
+
+
+class InvoiceNumberTest(TestCase):
+    """Test gap-free invoice numbers."""
+
+    def test_invoice_numbers_are_gap_free(self):
+        """Test a failed invoice does not consume its number."""
+        first = create_invoice()
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                create_invoice()
+                raise ValueError("échec après numérotation")
+        second = create_invoice()
+        year = first.created_at.year
+        self.assertEqual((first.number, second.number), (f"F{year}-00001", f"F{year}-00002"))
+        # Each year starts again at 1
+        previous = create_invoice(created_at=first.created_at.replace(year=year - 1))
+        self.assertEqual(previous.number, f"F{year - 1}-00001")
+        self.assertEqual(dict(InvoiceSequence.objects.values_list('year', 'last_value')), {year: 2, year - 1: 1})
+
+    def test_rolled_back_number_is_cleared(self):
+        """Test an invoice saved again after a rollback gets a new number instead of the cancelled one."""
+        invoice = Invoice(billing_address="1 rue", due_date=timezone.now() + timedelta(days=30))
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                invoice.save()
+                allocated = invoice.number
+                raise ValueError("échec après numérotation")
+        other = create_invoice()
+        self.assertEqual(other.number, allocated)
+        invoice.save()
+        year = invoice.created_at.year
+        self.assertEqual(invoice.number, f"F{year}-00002")
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    @override_settings(TIME_ZONE="Europe/Paris")
+    def test_year_in_local_time(self):
+        """Test an invoice created on New Year's Eve after 23:00 UTC is numbered in the new local year."""
+        invoice = create_invoice(created_at=datetime(2024, 12, 31, 23, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(invoice.number, "F2025-00001")
+
+    def test_failed_save_clears_number(self):
+        """Test a save failing after numbering leaves the invoice without the cancelled number."""
+        invoice = Invoice(billing_address="1 rue", due_date=timezone.now() + timedelta(days=30))
+        with mock.patch("django.db.models.Model.save", side_effect=ValueError("échec")):
+            with self.assertRaises(ValueError):
+                invoice.save()
+        self.assertEqual((invoice.number, invoice.pk), ("", None))
+        invoice.save()
+        self.assertEqual(invoice.number, f"F{invoice.created_at.year}-00001")
+
+    def test_number_kept_within_its_transaction(self):
+        """Test later saves in the allocating transaction keep the number."""
+        with transaction.atomic():
+            invoice = create_invoice()
+            invoice.status = "paid"
+            invoice.save()
+        invoice.cancel("erreur de saisie")
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.number, invoice.status), (f"F{invoice.created_at.year}-00001", "cancelled"))
+        self.assertEqual(Invoice.objects.count(), 1)
+
+
+class InvoiceNumberConcurrencyTest(TransactionTestCase):
+    """Test many threads creating invoices at once."""
+
+    serialized_rollback = True
+    threads = 8
+    per_thread = 25
+
+    def test_numbering_requires_transaction(self):
+        with self.assertRaises(transaction.TransactionManagementError):
+            next_invoice_number(2025)
+
+    def test_committed_number_confirmed(self):
+        """Test a committed invoice keeps its number on later saves, a rolled back one gets a new one."""
+        invoice = create_invoice()
+        invoice.status = "paid"
+        invoice.save()
+        cancelled = Invoice(billing_address="1 rue", due_date=timezone.now() + timedelta(days=30))
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                cancelled.save()
+                raise ValueError("échec après numérotation")
+        cancelled.save()
+        year = invoice.created_at.year
+        self.assertEqual(
+            list(Invoice.objects.order_by('pk').values_list('number', 'status')),
+            [(f"F{year}-00001", "paid"), (f"F{year}-00002", "pending")],
+        )
+
+    def test_invoice_numbers_are_contiguous(self):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.per_thread):
+                    for attempt in range(200):
+                        try:
+                            create_invoice()
+                            break
+                        except OperationalError:
+                            # SQLite locks the whole database: retry
+                            time.sleep(0.005)
+                    else:
+                        errors.append("locked")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+        year = timezone.now().year
+        numbers = sorted(Invoice.objects.values_list('number', flat=True))
+        total = self.threads * self.per_thread
+        self.assertEqual(numbers, [f"F{year}-{number:05d}" for number in range(1, total + 1)])
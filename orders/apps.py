@@ -1 +1,9 @@
 from django.apps import AppConfig
+
+
+class OrdersConfig(AppConfig):
+    default_auto_field = "django.db.models.AutoField"
+    name = "orders"
+
+    def ready(self):
+        from . import sales  # noqa: F401
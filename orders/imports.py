@@ -0,0 +1,221 @@
+"""
+Import de commandes en masse (marketplaces, anciens systèmes).
+
+Les fichiers sont lus en flux et importés par lots : la mémoire occupée ne dépend que de
+la taille des lots. Chaque lot coûte un nombre fixe de requêtes, quelle que soit sa
+taille : ``bulk_create`` des commandes, des lignes et des options de variante, puis
+recalcul ensembliste des totaux (voir orders.totals) et report au cumul des ventes.
+
+Les produits (par SKU), devises, options de variante et matrices de taxe sont résolus
+dans des dictionnaires construits une fois au début de l'import.
+
+Formats acceptés :
+
+- CSV : une ligne de commande par ligne de fichier, avec une colonne ``order`` (référence
+  externe). Les lignes d'une même commande doivent se suivre ; les colonnes de la
+  commande sont lues sur sa première ligne.
+- JSONL : un objet commande par ligne, ses lignes dans une liste ``lines``.
+
+Colonnes de commande : customer_name, email, country, currency (code, devise par défaut
+si vide), status (draft par défaut), shipping_cost, billing_address. Colonnes de ligne :
+sku, quantity, unit_price_ht, unit_price_ttc, weight, options (identifiants de
+VariantOption séparés par « | » en CSV, liste en JSONL).
+
+``bulk_create`` contourne ``save`` : le taux de change et la devise locale (celle de la
+boutique au moment de l'import) sont posés ici, et l'index des références Wagtail n'est
+pas mis à jour pour les commandes importées.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_countries import countries
+
+from checkout.models import store_currency
+from devises.models import Currency
+from devises.rates import get_rate
+from product.models import ProductPage, VariantOption
+from taxes.pricing import resolve_rates
+
+from .models import Order, OrderLine
+from .sales import add_orders
+from .totals import recalculate_totals
+
+STATUSES = {code for code, label in Order.STATUS_CHOICES}
+LINE_FIELDS = ('sku', 'quantity', 'unit_price_ht', 'unit_price_ttc', 'weight', 'options')
+
+
+class OrderImportError(ValueError):
+    """Ligne du fichier invalide ; `line_number` est la ligne fautive (à partir de 1)."""
+
+    def __init__(self, message, line_number=None):
+        super().__init__(f"Ligne {line_number} : {message}" if line_number else message)
+        self.line_number = line_number
+
+
+def read_csv(stream):
+    """Commandes d'un fichier CSV (une ligne de commande par ligne), en flux."""
+    reader = csv.DictReader(stream)
+    if 'order' not in (reader.fieldnames or []):
+        raise OrderImportError("colonne « order » manquante", 1)
+    rows = enumerate(reader, start=2)
+    for key, group in groupby(rows, key=lambda numbered: numbered[1].get('order')):
+        group = list(group)
+        line_number, first = group[0]
+        order = {field: value for field, value in first.items() if field not in LINE_FIELDS}
+        order['line_number'] = line_number
+        order['lines'] = [
+            dict({field: row.get(field) for field in LINE_FIELDS}, line_number=number)
+            for number, row in group
+        ]
+        for line in order['lines']:
+            line['options'] = [value for value in (line['options'] or '').split('|') if value]
+        yield order
+
+
+def read_jsonl(stream):
+    """Commandes d'un fichier JSONL (un objet commande par ligne), en flux."""
+    for line_number, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            order = json.loads(text)
+        except json.JSONDecodeError as error:
+            raise OrderImportError(f"JSON invalide ({error.msg})", line_number)
+        order['line_number'] = line_number
+        for line in order.get('lines') or []:
+            line.setdefault('line_number', line_number)
+        yield order
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def _decimal(value, default=None):
+    if value in (None, ''):
+        return default
+    return Decimal(str(value))
+
+
+class OrderImporter:
+    """Importe des commandes normalisées (voir read_csv / read_jsonl) par lots."""
+
+    def __init__(self, tax_user=None):
+        self.products = {
+            sku: (pk, tax_product_id)
+            for sku, pk, tax_product_id in ProductPage.objects.exclude(sku='').values_list('sku', 'pk', 'tax_product_id')
+        }
+        self.currencies = dict(Currency.objects.values_list('code', 'pk'))
+        self.default_currency_id = self.currencies.get(getattr(settings, 'DEFAULT_CURRENCY', None))
+        # Comme Order.save : devise des montants locaux, lue une fois pour tout l'import
+        self.local_currency = store_currency()
+        self.options = set(VariantOption.objects.values_list('pk', flat=True))
+        # Matrice de taxe de chaque catégorie de produit pour la catégorie fiscale du client
+        self.matrices = {
+            tax_product_id: matrice_id
+            for tax_product_id, (rate, matrice_id) in resolve_rates(
+                {tax_product_id for pk, tax_product_id in self.products.values()}, tax_user
+            ).items()
+        }
+        self.orders = self.lines = 0
+
+    def build_order(self, data, now):
+        line_number = data['line_number']
+        currency_code = data.get('currency') or None
+        if currency_code and currency_code not in self.currencies:
+            raise OrderImportError(f"devise inconnue « {currency_code} »", line_number)
+        country = (data.get('country') or '').upper()
+        if not countries.alpha2(country):
+            raise OrderImportError(f"pays inconnu « {data.get('country')} »", line_number)
+        status = data.get('status') or 'draft'
+        if status not in STATUSES:
+            raise OrderImportError(f"statut inconnu « {status} »", line_number)
+        if not data.get('lines'):
+            raise OrderImportError("commande sans ligne", line_number)
+        currency_id = self.currencies[currency_code] if currency_code else self.default_currency_id
+        try:
+            shipping_cost = _decimal(data.get('shipping_cost'), Decimal('0'))
+        except InvalidOperation:
+            raise OrderImportError("frais de port invalides", line_number)
+        return Order(
+            customer_name=data.get('customer_name') or '',
+            email=data.get('email') or '',
+            country=country,
+            currency_id=currency_id,
+            # Comme Order.save : taux du jour, 1 à défaut
+            currency_rate=get_rate(currency_id, now) or 1,
+            local_currency=self.local_currency,
+            status=status,
+            shipping_cost=shipping_cost,
+            billing_address=data.get('billing_address') or None,
+        )
+
+    def build_line(self, order, data):
+        line_number = data.get('line_number')
+        try:
+            product_id, tax_product_id = self.products[data.get('sku')]
+        except KeyError:
+            raise OrderImportError(f"SKU inconnu « {data.get('sku')} »", line_number)
+        try:
+            quantity = int(data.get('quantity') or 1)
+            unit_price_ht = _decimal(data.get('unit_price_ht'))
+            unit_price_ttc = _decimal(data.get('unit_price_ttc'))
+            weight = _decimal(data.get('weight'), Decimal('0'))
+        except (ValueError, InvalidOperation):
+            raise OrderImportError("quantité, prix ou poids invalide", line_number)
+        if unit_price_ht is None or quantity < 1:
+            raise OrderImportError("prix HT manquant ou quantité nulle", line_number)
+        options = []
+        for value in data.get('options') or []:
+            try:
+                option = int(value)
+            except (TypeError, ValueError):
+                option = None
+            if option not in self.options:
+                raise OrderImportError(f"option de variante inconnue « {value} »", line_number)
+            options.append(option)
+        line = OrderLine(
+            order=order,
+            product_id=product_id,
+            quantity=quantity,
+            unit_price_ht=unit_price_ht,
+            unit_price_ttc=unit_price_ttc,
+            tax_rate_id=self.matrices.get(tax_product_id),
+            weight=weight,
+        )
+        return line, options
+
+    def import_chunk(self, chunk):
+        """Importe un lot de commandes dans une transaction ; rien n'est écrit si une ligne est invalide."""
+        now = timezone.now()
+        orders, lines, options = [], [], []
+        for data in chunk:
+            order = self.build_order(data, now)
+            orders.append(order)
+            for line_data in data['lines']:
+                line, line_options = self.build_line(order, line_data)
+                lines.append(line)
+                options.append(line_options)
+
+        Through = OrderLine.variant_option.through
+        with transaction.atomic():
+            Order.objects.bulk_create(orders)
+            for line in lines:
+                # Identifiant de la commande connu seulement après son insertion
+                line.order_id = line.order.pk
+            OrderLine.objects.bulk_create(lines)
+            Through.objects.bulk_create([
+                Through(orderline_id=line.pk, variantoption_id=option)
+                for line, line_options in zip(lines, options)
+                for option in line_options
+            ])
+            imported = Order.objects.filter(pk__in=[order.pk for order in orders])
+            recalculate_totals(imported)
+            # bulk_create ne déclenche pas les signaux du cumul des ventes
+            add_orders(imported)
+        self.orders += len(orders)
+        self.lines += len(lines)
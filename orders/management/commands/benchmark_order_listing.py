@@ -0,0 +1,109 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from orders.models import Order, OrderLine
+from orders.pagination import KeysetPaginator, encode_cursor
+from orders.views import OrderIndexView
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la liste des commandes de l'admin (première page et page profonde) sur N "
+        "commandes, par clé (created_at, id) et, pour comparaison, par OFFSET. Les commandes "
+        "de test sont créées dans une transaction annulée à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000, help="Nombre de commandes créées")
+        parser.add_argument('--lines', type=int, default=1, help="Lignes par commande")
+        parser.add_argument('--repeat', type=int, default=20, help="Mesures par scénario")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Taille des lots d'insertion")
+
+    def handle(self, *args, **options):
+        if min(options['orders'], options['repeat'], options['batch_size']) < 1 or options['lines'] < 0:
+            raise CommandError("--orders, --repeat et --batch-size doivent être positifs.")
+        try:
+            with transaction.atomic():
+                self.populate(options)
+                self.measure(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, options):
+        start = time.perf_counter()
+        base = timezone.now() - timedelta(seconds=options['orders'])
+        created_at = Order._meta.get_field('created_at')
+        # Dates réalistes (une par commande) : auto_now_add les écraserait toutes à maintenant
+        created_at.auto_now_add = False
+        try:
+            for offset in range(0, options['orders'], options['batch_size']):
+                orders = Order.objects.bulk_create([
+                    Order(
+                        customer_name=f"Client {index}", email=f"client{index}@example.com", country="FR",
+                        status="confirmed", local_total_ttc=Decimal("42.00"), currency_rate=1,
+                        created_at=base + timedelta(seconds=index),
+                    )
+                    for index in range(offset, min(offset + options['batch_size'], options['orders']))
+                ])
+                OrderLine.objects.bulk_create([
+                    OrderLine(order=order, quantity=1, unit_price_ht=Decimal("35.00"))
+                    for order in orders for _ in range(options['lines'])
+                ])
+        finally:
+            created_at.auto_now_add = True
+        self.stdout.write(f"{options['orders']} commande(s) créées en {time.perf_counter() - start:.1f} s")
+
+    def timed(self, func, repeat):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), len(queries)
+
+    def measure(self, options):
+        user = get_user_model().objects.create_superuser("benchmark-listing", "benchmark@example.com", "benchmark")
+        client = Client()
+        client.force_login(user)
+        index_url = reverse('order:index')
+        results_url = reverse('order:index_results')
+        per_page = 20
+        deep = Order.objects.order_by('-created_at', '-pk')[options['orders'] * 9 // 10]
+        cursor = encode_cursor(deep.created_at, deep.pk)
+        queryset = OrderIndexView(model=Order).get_base_queryset()
+        keyset = KeysetPaginator(queryset, per_page)
+        ordered = queryset.order_by('-created_at', '-pk')
+        paginator = Paginator(ordered, per_page)
+        deep_page = options['orders'] * 9 // 10 // per_page
+
+        scenarios = [
+            # La page complète inclut le menu et l'habillage de l'admin, hors liste
+            ("Page admin complète, première page", lambda: client.get(index_url)),
+            ("Liste admin, première page", lambda: client.get(results_url)),
+            ("Liste admin, page à 90 %", lambda: client.get(results_url, {'after': cursor})),
+            ("Requêtes par clé, page à 90 %", lambda: keyset.page(after=cursor)),
+            ("Requêtes par OFFSET, page à 90 %", lambda: (
+                Paginator(ordered, per_page).count, list(paginator.page(deep_page).object_list))),
+        ]
+        for label, func in scenarios:
+            elapsed, queries = self.timed(func, options['repeat'])
+            self.stdout.write(f"{label} : {elapsed:.1f} ms (médiane), {queries} requête(s)")
@@ -0,0 +1,55 @@
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.imports import READERS, OrderImporter, OrderImportError
+from taxes.models import TaxUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe des commandes depuis un fichier CSV ou JSONL, lu en flux et enregistré par "
+        "lots (bulk_create), les totaux étant recalculés une fois par lot. Voir orders.imports "
+        "pour les colonnes attendues."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier à importer (.csv ou .jsonl)")
+        parser.add_argument('--format', choices=sorted(READERS), help="Format du fichier (déduit de l'extension par défaut)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Nombre de commandes par lot")
+        parser.add_argument('--tax-user', type=int, help="Catégorie fiscale (TaxUser) des clients, pour les matrices de taxe des lignes")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f"Format inconnu « {file_format} » : utiliser --format ({', '.join(sorted(READERS))}).")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size doit être positif.")
+        if options['tax_user'] and not TaxUser.objects.filter(pk=options['tax_user']).exists():
+            raise CommandError(f"Catégorie fiscale {options['tax_user']} introuvable.")
+
+        importer = OrderImporter(tax_user=options['tax_user'])
+        start = time.perf_counter()
+        try:
+            with path.open(newline='', encoding='utf-8') as stream:
+                orders = READERS[file_format](stream)
+                # Un lot à la fois en mémoire ; chaque lot est validé dans sa propre transaction
+                while chunk := list(islice(orders, options['batch_size'])):
+                    importer.import_chunk(chunk)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"{importer.orders} commande(s) importée(s)...")
+        except OSError as error:
+            raise CommandError(f"Lecture impossible : {error}")
+        except OrderImportError as error:
+            raise CommandError(
+                f"{error} — {importer.orders} commande(s) déjà importée(s) dans les lots précédents."
+            )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"{importer.orders} commande(s) et {importer.lines} ligne(s) importées en {elapsed:.2f} s "
+            f"({importer.lines / elapsed if elapsed else 0:.0f} lignes/s)."
+        ))
@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from orders.sales import SOURCES, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Régénère le cumul journalier des ventes (DailySales) depuis les commandes, pour "
+        "une période (toutes les dates par défaut). À lancer après une modification en "
+        "masse des commandes, qui ne passe pas par les signaux."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="Premier jour (AAAA-MM-JJ), le plus ancien par défaut")
+        parser.add_argument('--end', type=date.fromisoformat, help="Dernier jour inclus (AAAA-MM-JJ), aujourd'hui par défaut")
+        parser.add_argument('--source', action='append', choices=sorted(SOURCES), help="Limiter à cette source (répétable)")
+
+    def handle(self, *args, **options):
+        sources = options['source'] or list(SOURCES)
+        start = options['start'] or self.first_day(sources)
+        end = options['end'] or timezone.localdate()
+        if start is None:
+            self.stdout.write("Aucune commande : rien à régénérer.")
+            return
+        if start > end:
+            raise CommandError("--start doit précéder --end.")
+
+        began = time.perf_counter()
+        count = rebuild(start, end, sources)
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} case(s) régénérée(s) du {start} au {end} en {time.perf_counter() - began:.2f} s"
+        ))
+
+    def first_day(self, sources):
+        firsts = [
+            SOURCES[name].model.objects.aggregate(first=Min(SOURCES[name].date_field))['first'] for name in sources
+        ]
+        firsts = [timezone.localdate(first) for first in firsts if first]
+        return min(firsts, default=None)
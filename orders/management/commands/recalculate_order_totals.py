@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from orders.models import Order
+from orders.sales import rebuild
+from orders.totals import recalculate_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule en base les totaux HT, TVA et TTC (et en devise) des commandes, en deux "
+        "requêtes quel que soit leur nombre, au taux de change enregistré sur chaque commande, "
+        "puis régénère le cumul des ventes de la période concernée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', choices=[code for code, label in Order.STATUS_CHOICES],
+                            help="Limiter aux commandes de ce statut (répétable)")
+        parser.add_argument('--ids', type=int, nargs='+', help="Limiter à ces identifiants de commande")
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['status']:
+            orders = orders.filter(status__in=options['status'])
+        if options['ids']:
+            orders = orders.filter(pk__in=options['ids'])
+        if not orders.exists():
+            raise CommandError("Aucune commande à recalculer.")
+
+        start = time.perf_counter()
+        count = recalculate_totals(orders)
+        # Les UPDATE ne passent pas par les signaux : cumul des ventes régénéré sur la période
+        dates = orders.aggregate(first=Min('created_at'), last=Max('created_at'))
+        rebuild(timezone.localdate(dates['first']), timezone.localdate(dates['last']), ['orders'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"{count} commande(s) recalculée(s) en {elapsed * 1000:.0f} ms"))
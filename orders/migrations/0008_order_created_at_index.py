@@ -0,0 +1,28 @@
+# Generated by Django 5.0.9 on 2026-10-17 03:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("devises", "0003_alter_currency_options"),
+        ("expeditions", "0001_initial"),
+        ("orders", "0007_rename_order_orderline_order"),
+        ("wagtailcore", "0094_alter_page_locale"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="order",
+            options={"verbose_name": "Commande", "verbose_name_plural": "Commandes"},
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["created_at", "id"], name="orders_order_created_idx"
+            ),
+        ),
+    ]
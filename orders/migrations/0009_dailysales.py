@@ -0,0 +1,96 @@
+# Generated by Django 5.0.9 on 2026-10-17 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0008_order_created_at_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailySales",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Date")),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("orders", "Commandes"), ("checkout", "Boutique")],
+                        max_length=20,
+                        verbose_name="Source",
+                    ),
+                ),
+                (
+                    "currency",
+                    models.CharField(blank=True, max_length=10, verbose_name="Devise"),
+                ),
+                (
+                    "country",
+                    models.CharField(blank=True, max_length=2, verbose_name="Pays"),
+                ),
+                ("status", models.CharField(max_length=50, verbose_name="Statut")),
+                (
+                    "order_count",
+                    models.IntegerField(default=0, verbose_name="Commandes"),
+                ),
+                (
+                    "total_ht",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Total HT",
+                    ),
+                ),
+                (
+                    "total_tva",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Total TVA",
+                    ),
+                ),
+                (
+                    "total_ttc",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Total TTC",
+                    ),
+                ),
+                (
+                    "shipping",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Frais de port",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ventes du jour",
+                "verbose_name_plural": "Ventes journalières",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailysales",
+            constraint=models.UniqueConstraint(
+                fields=("date", "source", "currency", "country", "status"),
+                name="orders_dailysales_unique_bucket",
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.9 on 2026-10-17 04:33
+
+from django.db import migrations, models
+
+AMOUNTS = ("order_count", "total_ht", "total_tva", "total_ttc", "shipping")
+
+
+def backfill_local_currency(apps, schema_editor):
+    """
+    Devise de la boutique sur les commandes existantes, et cases DailySales
+    re-clées sur cette devise (les cases « orders » portaient la devise du client).
+    """
+    CheckoutSettings = apps.get_model("checkout", "CheckoutSettings")
+    Order = apps.get_model("orders", "Order")
+    DailySales = apps.get_model("orders", "DailySales")
+    settings_instance = CheckoutSettings.objects.first()
+    currency = settings_instance.currency if settings_instance else ""
+    Order.objects.update(local_currency=currency)
+
+    buckets = {}
+    for row in DailySales.objects.order_by("pk"):
+        key = (row.date, row.source, currency, row.country, row.status)
+        if key in buckets:
+            merged = buckets[key]
+            for field in AMOUNTS:
+                setattr(merged, field, getattr(merged, field) + getattr(row, field))
+        else:
+            row.currency = currency
+            buckets[key] = row
+    DailySales.objects.all().delete()
+    for row in buckets.values():
+        row.pk = None
+    DailySales.objects.bulk_create(buckets.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkout", "0014_order_currency"),
+        ("orders", "0009_dailysales"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="local_currency",
+            field=models.CharField(
+                blank=True, editable=False, max_length=10, verbose_name="Devise locale"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="dailysales",
+            name="currency",
+            field=models.CharField(
+                blank=True, max_length=10, verbose_name="Devise des montants"
+            ),
+        ),
+        migrations.RunPython(backfill_local_currency, migrations.RunPython.noop),
+    ]
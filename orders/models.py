@@ -1,17 +1,35 @@
 from django.db import models
+from django.db.models import F, Sum
 from modelcluster.models import ClusterableModel
 from wagtail.models import LockableMixin, RevisionMixin, PreviewableMixin
 from wagtail.admin.panels import FieldPanel, InlinePanel
 from product.models import ProductPage, ProductVariant, VariantOption
-from devises.models import RateCurrency, Currency
-from checkout.models import CheckoutSettings
+from devises.models import Currency
+from devises.rates import get_rate
+from checkout.models import CheckoutSettings, store_currency
 from taxes.models import TaxMatrice
+from taxes.pricing import CENT, PricingLine, from_cents, price_lines, sql_line_cents
 from expeditions.models import ShippingOption, ShippingLabel, ShippingAddress
 from django_countries.fields import CountryField
 from wagtail.snippets.models import register_snippet
 from modelcluster.fields import ParentalKey
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from decimal import ROUND_HALF_UP, Decimal
+
+
+def line_totals():
+    """
+    Agrégats des lignes de commande (HT et TVA en centimes, poids), aux arrondis du moteur
+    de prix : le taux est lu dans la matrice de la ligne par jointure. Sommes en entiers
+    64 bits : une commande peut dépasser 2**31 centimes.
+    """
+    ht_cents, tva_cents = sql_line_cents(F('unit_price_ht'), F('quantity'), F('tax_rate__tax_rate'))
+    return {
+        'ht_cents': Sum(ht_cents, output_field=models.BigIntegerField()),
+        'tva_cents': Sum(tva_cents, output_field=models.BigIntegerField()),
+        'weight': Sum('weight'),
+    }
 
 
 def get_default_currency():
@@ -49,6 +67,8 @@ class Order(ClusterableModel, LockableMixin, RevisionMixin, PreviewableMixin):
         blank=True,
         related_name="order",
     )
+    # Devise des montants local_* : celle de la boutique à la création de la commande
+    local_currency = models.CharField(max_length=10, blank=True, editable=False, verbose_name="Devise locale")
     local_total_ht = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     local_total_tva = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     local_total_ttc = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
@@ -74,20 +94,15 @@ class Order(ClusterableModel, LockableMixin, RevisionMixin, PreviewableMixin):
     order_date = models.DateTimeField(auto_now=True, null=True, blank=True)
 
     def get_exchange_rate(self):
-        """Récupère le taux de change basé sur la devise et la date de la commande."""
-        if not self.currency or not self.order_date:
-            return None
-
-        try:
-            rate = RateCurrency.objects.filter(
-                currency=self.currency, date__lte=self.order_date
-            ).order_by('-date').first()
-            return rate.rate if rate else None
-        except RateCurrency.DoesNotExist:
+        """Récupère le taux de change basé sur la devise et la date de la commande (table en mémoire)."""
+        if not self.currency_id or not self.order_date:
             return None
+        return get_rate(self.currency_id, self.order_date)
 
     def save(self, *args, **kwargs):
         """Override save pour enregistrer le taux de change au moment de la création de la commande."""
+        if self._state.adding and not self.local_currency:
+            self.local_currency = store_currency()
         exchange_rate = self.get_exchange_rate()
         if exchange_rate:
             self.currency_rate = exchange_rate
@@ -96,18 +111,31 @@ class Order(ClusterableModel, LockableMixin, RevisionMixin, PreviewableMixin):
         
         super().save(*args, **kwargs)  # Appelle la méthode save d'origine
 
+    def aggregate_lines(self):
+        """HT, TVA (Decimal) et poids des lignes, en une requête d'agrégation."""
+        totals = self.lines.aggregate(**line_totals())
+        return {
+            'ht': from_cents(totals['ht_cents'] or 0),
+            'tva': from_cents(totals['tva_cents'] or 0),
+            'weight': totals['weight'] or Decimal('0'),
+        }
+
     def calculate_totals(self):
-        """Calcule les totaux en fonction du taux de change."""
-        lines = self.lines.all()
-        self.local_total_ht = sum(line.calculate_ht() for line in lines)
-        self.local_total_tva = sum(line.calculate_tva() for line in lines)
+        """
+        Calcule les totaux en fonction du taux de change. Les lignes sont agrégées en base
+        (voir line_totals) ; pour recalculer de nombreuses commandes, voir orders.totals.
+        """
+        totals = self.aggregate_lines()
+        self.local_total_ht = totals['ht']
+        self.local_total_tva = totals['tva']
         self.local_total_ttc = self.local_total_ht + self.local_total_tva + self.shipping_cost
 
         exchange_rate = self.get_exchange_rate()
         if exchange_rate:
-            self.foreign_total_ht = self.local_total_ht / exchange_rate
-            self.foreign_total_tva = self.local_total_tva / exchange_rate
-            self.foreign_total_ttc = self.local_total_ttc / exchange_rate
+            # Arrondi au demi-centime supérieur, comme le moteur de prix et orders.totals
+            self.foreign_total_ht = (self.local_total_ht / exchange_rate).quantize(CENT, ROUND_HALF_UP)
+            self.foreign_total_tva = (self.local_total_tva / exchange_rate).quantize(CENT, ROUND_HALF_UP)
+            self.foreign_total_ttc = (self.local_total_ttc / exchange_rate).quantize(CENT, ROUND_HALF_UP)
         else:
             self.foreign_total_ht = self.local_total_ht
             self.foreign_total_tva = self.local_total_tva
@@ -116,11 +144,15 @@ class Order(ClusterableModel, LockableMixin, RevisionMixin, PreviewableMixin):
         self.save()
 
     def get_total_weight(self):
-        return sum(line.weight for line in self.lines.all())
+        return self.aggregate_lines()['weight']
     
     class Meta:
         verbose_name = "Commande"
         verbose_name_plural = "Commandes"
+        indexes = [
+            # Tri et pagination par clé de la liste des commandes (voir orders.pagination)
+            models.Index(fields=["created_at", "id"], name="orders_order_created_idx"),
+        ]
 
     def __str__(self):
         return f"Commande {self.id} - {self.customer_name}"
@@ -172,13 +204,65 @@ class OrderLine(LockableMixin, RevisionMixin, PreviewableMixin, models.Model):
             # Sauvegardez à nouveau pour appliquer les modifications ManyToMany
             super().save(*args, **kwargs)
 
+    def pricing_line(self):
+        """Ligne pour le moteur de prix : prix HT et taux de la matrice choisie (0 sans matrice)."""
+        return PricingLine(
+            unit_price=self.unit_price_ht,
+            quantity=self.quantity,
+            tax_rate=self.tax_rate.tax_rate if self.tax_rate else 0,
+            source=self,
+        )
+
+    def _priced(self):
+        return price_lines([self.pricing_line()]).lines[0]
+
     def calculate_ht(self):
         """Calcule le prix hors taxe pour cette ligne de commande."""
-        return self.unit_price_ht * self.quantity
+        return self._priced().ht
 
     def calculate_tva(self):
         """Calcule la TVA pour cette ligne de commande."""
-        return (self.calculate_ht() * (self.tax_rate.tax_rate / 100)) if self.tax_rate else 0.0
+        return self._priced().tva
+
+    def calculate_ttc(self):
+        """Calcule le prix TTC pour cette ligne de commande."""
+        return self._priced().ttc
 
     def __str__(self):
         return f"{self.product} x {self.quantity}"
+
+
+class DailySales(models.Model):
+    """
+    Ventes agrégées par jour, source, devise, pays et statut (voir orders.sales).
+    Tenue à jour à chaque enregistrement de commande ; les tableaux de bord et exports
+    lisent cette table plutôt que les commandes. Les montants sont dans la devise
+    ``currency`` : celle de la boutique enregistrée sur chaque commande à sa création.
+    """
+    SOURCE_CHOICES = [
+        ("orders", "Commandes"),
+        ("checkout", "Boutique"),
+    ]
+    date = models.DateField(verbose_name="Date")
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, verbose_name="Source")
+    currency = models.CharField(max_length=10, blank=True, verbose_name="Devise des montants")
+    country = models.CharField(max_length=2, blank=True, verbose_name="Pays")
+    status = models.CharField(max_length=50, verbose_name="Statut")
+    order_count = models.IntegerField(default=0, verbose_name="Commandes")
+    # Les commandes boutique n'enregistrent que leur total TTC : HT et TVA n'y sont pas ventilés
+    total_ht = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total HT")
+    total_tva = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total TVA")
+    total_ttc = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total TTC")
+    shipping = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Frais de port")
+
+    class Meta:
+        verbose_name = "Ventes du jour"
+        verbose_name_plural = "Ventes journalières"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "source", "currency", "country", "status"], name="orders_dailysales_unique_bucket"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.get_source_display()} {self.currency} {self.country} {self.status}"
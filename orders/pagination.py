@@ -0,0 +1,107 @@
+"""
+Pagination par clé (keyset) pour les listes longues.
+
+Au lieu d'un numéro de page (COUNT(*) puis OFFSET, dont le coût croît avec la page), la
+page suivante est demandée par un curseur : les clés de tri (date, id) de sa dernière
+ligne, et la page précédente par celles de sa première ligne. Chaque page est une seule
+requête LIMIT qui démarre dans l'index (voir Order.Meta.indexes), à coût constant quelle
+que soit la profondeur. En contrepartie, le nombre total de pages n'est pas connu.
+"""
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    return f"{value.isoformat()}~{pk}"
+
+
+def decode_cursor(cursor):
+    """(valeur, id) d'un curseur, ou None s'il est absent ou invalide (première page)."""
+    try:
+        value, pk = (cursor or '').rsplit('~', 1)
+        return datetime.fromisoformat(value), int(pk)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    """Page de résultats ; `next_cursor` / `previous_cursor` valent None en bout de liste."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Pagine `queryset` sur (`field`, pk), dans l'ordre décroissant si `descending`.
+    `after` donne la page qui suit un curseur, `before` celle qui le précède.
+    """
+
+    # Le total n'est pas calculé : c'est tout l'intérêt de la pagination par clé
+    count = None
+
+    def __init__(self, queryset, per_page, field='created_at', descending=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.descending = descending
+
+    def _ordering(self, descending):
+        prefix = '-' if descending else ''
+        return [f'{prefix}{self.field}', f'{prefix}pk']
+
+    def _beyond(self, cursor, descending):
+        # Forme « champ <= v ET (champ < v OU pk < id) » : la première condition est une
+        # borne d'index, la page se lit à partir de la position du curseur
+        value, pk = cursor
+        lookup = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{self.field}__{lookup}e': value})
+            & (Q(**{f'{self.field}__{lookup}': value}) | Q(**{f'pk__{lookup}': pk}))
+        )
+
+    def _cursor(self, obj):
+        return encode_cursor(getattr(obj, self.field), obj.pk)
+
+    def page(self, after=None, before=None):
+        after, before = decode_cursor(after), decode_cursor(before)
+        backwards = before is not None and after is None
+        descending = self.descending != backwards
+        queryset = self.queryset.order_by(*self._ordering(descending))
+        cursor = before if backwards else after
+        if cursor:
+            queryset = queryset.filter(self._beyond(cursor, descending))
+
+        # Une ligne de plus pour savoir s'il reste une page dans ce sens
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows)
+        has_next = more if not backwards else True
+        has_previous = more if backwards else cursor is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor(rows[-1]) if has_next else None,
+            previous_cursor=self._cursor(rows[0]) if has_previous else None,
+        )
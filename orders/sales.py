@@ -0,0 +1,204 @@
+"""
+Cumul journalier des ventes (modèle ``DailySales``).
+
+Chaque commande compte dans une seule case (jour, source, devise, pays, statut). Les
+signaux de ``orders.Order`` et ``checkout.Order`` y reportent chaque changement par
+différence : la contribution d'avant l'enregistrement (relue en base au pre_save) est
+retirée, la nouvelle ajoutée, par UPDATE ... SET champ = champ + delta. Les deltas sont
+écrits dans la transaction de la commande : un rollback les annule aussi, et deux
+commandes enregistrées en même temps ne s'écrasent pas.
+
+Les chemins en masse ne déclenchent pas de signaux : l'import appelle ``add_orders``,
+et ``rebuild`` régénère les cases d'une période depuis les commandes (commande
+``rebuild_daily_sales``), par exemple après un ``update`` ou un recalcul des totaux.
+
+Le jour est la date locale (TIME_ZONE) de création de la commande. La devise d'une
+case est celle de ses montants, relue sur la commande (``local_currency`` ou
+``currency``, la devise de la boutique à sa création) : un changement de devise de la
+boutique ne déplace pas les commandes existantes.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from checkout.models import Order as CheckoutOrder
+
+from .models import DailySales, Order
+
+AMOUNTS = ('order_count', 'total_ht', 'total_tva', 'total_ttc', 'shipping')
+ZERO = Decimal('0')
+
+
+def _day(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _decimal(value):
+    return Decimal(str(value or 0))
+
+
+class OrdersSource:
+    """Commandes du back-office (orders.Order)."""
+    name = 'orders'
+    model = Order
+    date_field = 'created_at'
+    fields = (
+        'created_at', 'local_currency', 'country', 'status',
+        'local_total_ht', 'local_total_tva', 'local_total_ttc', 'shipping_cost',
+    )
+
+    def instance_values(self, order):
+        return {
+            'created_at': order.created_at,
+            'local_currency': order.local_currency,
+            'country': getattr(order.country, 'code', order.country),
+            'status': order.status,
+            'local_total_ht': order.local_total_ht,
+            'local_total_tva': order.local_total_tva,
+            'local_total_ttc': order.local_total_ttc,
+            'shipping_cost': order.shipping_cost,
+        }
+
+    def contribution(self, values):
+        key = (_day(values['created_at']), self.name, values['local_currency'], values['country'] or '', values['status'])
+        amounts = (1, *(_decimal(values[field]) for field in ('local_total_ht', 'local_total_tva', 'local_total_ttc', 'shipping_cost')))
+        return key, amounts
+
+    def aggregate(self, queryset):
+        rows = queryset.order_by().annotate(day=TruncDate('created_at')).values(
+            'day', 'local_currency', 'country', 'status',
+        ).annotate(
+            order_count=Count('pk'), total_ht=Sum('local_total_ht'), total_tva=Sum('local_total_tva'),
+            total_ttc=Sum('local_total_ttc'), shipping=Sum('shipping_cost'),
+        )
+        for row in rows:
+            key = (row['day'], self.name, row['local_currency'], row['country'] or '', row['status'])
+            yield key, tuple(row[field] or ZERO for field in AMOUNTS)
+
+
+class CheckoutSource:
+    """Commandes de la boutique (checkout.Order) : total TTC seul, dans la devise de la commande."""
+    name = 'checkout'
+    model = CheckoutOrder
+    date_field = 'date_created'
+    fields = ('date_created', 'currency', 'status', 'total_amount')
+
+    def instance_values(self, order):
+        return {
+            'date_created': order.date_created, 'currency': order.currency,
+            'status': order.status, 'total_amount': order.total_amount,
+        }
+
+    def contribution(self, values):
+        key = (_day(values['date_created']), self.name, values['currency'], '', values['status'])
+        return key, (1, ZERO, ZERO, _decimal(values['total_amount']), ZERO)
+
+    def aggregate(self, queryset):
+        rows = queryset.order_by().annotate(day=TruncDate('date_created')).values('day', 'currency', 'status').annotate(
+            order_count=Count('pk'), total_ttc=Sum('total_amount'),
+        )
+        for row in rows:
+            yield (row['day'], self.name, row['currency'], '', row['status']), (
+                row['order_count'], ZERO, ZERO, row['total_ttc'] or ZERO, ZERO,
+            )
+
+
+SOURCES = {source.name: source for source in (OrdersSource(), CheckoutSource())}
+SOURCES_BY_MODEL = {source.model: source for source in SOURCES.values()}
+
+
+def _bucket(key):
+    return dict(zip(('date', 'source', 'currency', 'country', 'status'), key))
+
+
+def apply(deltas):
+    """Ajoute les deltas {case: (nombre, HT, TVA, TTC, port)} aux cases, créées au besoin."""
+    deltas = {key: amounts for key, amounts in deltas.items() if any(amounts)}
+    if not deltas:
+        return
+    with transaction.atomic():
+        DailySales.objects.bulk_create([DailySales(**_bucket(key)) for key in deltas], ignore_conflicts=True)
+        for key, amounts in deltas.items():
+            DailySales.objects.filter(**_bucket(key)).update(
+                **{field: F(field) + amount for field, amount in zip(AMOUNTS, amounts)}
+            )
+            if amounts[0] < 0:
+                DailySales.objects.filter(**_bucket(key), order_count__lte=0).delete()
+
+
+def _merge(deltas, key, amounts, sign=1):
+    current = deltas.get(key, (0, ZERO, ZERO, ZERO, ZERO))
+    deltas[key] = tuple(total + sign * amount for total, amount in zip(current, amounts))
+
+
+def add_orders(queryset):
+    """Compte les commandes de `queryset` (orders.Order ou checkout.Order) : une requête d'agrégation."""
+    deltas = {}
+    for key, amounts in SOURCES_BY_MODEL[queryset.model].aggregate(queryset):
+        _merge(deltas, key, amounts)
+    apply(deltas)
+
+
+def rebuild(start, end, sources=None):
+    """
+    Régénère les cases du `start` au `end` inclus depuis les commandes ; renvoie le
+    nombre de cases écrites. Une requête d'agrégation par source.
+    """
+    rows = []
+    with transaction.atomic():
+        for name in sources or SOURCES:
+            source = SOURCES[name]
+            DailySales.objects.filter(source=name, date__range=(start, end)).delete()
+            queryset = source.model.objects.filter(**{f'{source.date_field}__date__range': (start, end)})
+            rows.extend(
+                DailySales(**_bucket(key), **dict(zip(AMOUNTS, amounts)))
+                for key, amounts in source.aggregate(queryset)
+            )
+        DailySales.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def _previous_contribution(source, instance):
+    if instance._state.adding or instance.pk is None:
+        return None
+    values = source.model.objects.filter(pk=instance.pk).values(*source.fields).first()
+    return source.contribution(values) if values else None
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=CheckoutOrder)
+def remember_previous_sales(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._sales_previous = _previous_contribution(SOURCES_BY_MODEL[sender], instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=CheckoutOrder)
+def update_sales_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    source = SOURCES_BY_MODEL[sender]
+    deltas = {}
+    previous = getattr(instance, '_sales_previous', None)
+    if previous:
+        _merge(deltas, *previous, sign=-1)
+    key, amounts = source.contribution(source.instance_values(instance))
+    _merge(deltas, key, amounts)
+    apply(deltas)
+
+
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=CheckoutOrder)
+def update_sales_on_delete(sender, instance, **kwargs):
+    # Valeurs relues en base : l'instance supprimée peut être périmée
+    previous = _previous_contribution(SOURCES_BY_MODEL[sender], instance)
+    if previous:
+        deltas = {}
+        _merge(deltas, *previous, sign=-1)
+        apply(deltas)
@@ -0,0 +1,393 @@
+"""
+Tests for the orders app.
+"""
+
+import json
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from devises import rates
+from devises.models import Currency, RateCurrency
+from checkout.models import CheckoutSettings, Order as CheckoutOrder, store_currency
+from checkout.webhooks import mark_order_paid
+from orders.models import DailySales, Order, OrderLine
+from orders.totals import recalculate_totals
+from product.models import ProductPage, ProductVariant, VariantOption
+from taxes.models import TaxMatrice, TaxProduct, TaxUser
+from wagtail.models import Page
+from taxes.pricing import PricingLine, price_lines
+
+TOTAL_FIELDS = [
+    'local_total_ht', 'local_total_tva', 'local_total_ttc', 'foreign_total_ht', 'foreign_total_tva', 'foreign_total_ttc',
+]
+
+
+class OrderTotalsTest(TestCase):
+    """Test order totals aggregated in the database."""
+
+    def setUp(self):
+        cache.clear()
+        rates._tables.clear()
+        self.addCleanup(rates._tables.clear)
+        tax_user = TaxUser.objects.create(tax_name="Particulier")
+        self.normal, self.reduit = (
+            TaxMatrice.objects.create(
+                tax_product=TaxProduct.objects.create(tax_name=name), tax_user=tax_user,
+                tax_rate=Decimal(rate), tax_account="445710",
+            )
+            for name, rate in (("Normal", "20.00"), ("Réduit", "5.50"))
+        )
+        self.usd = Currency.objects.create(code="USD")
+        with self.captureOnCommitCallbacks(execute=True):
+            RateCurrency.objects.create(currency=self.usd, date=date(2000, 1, 1), rate=Decimal("2.000000"))
+
+    def create_order(self, lines, currency=None, shipping_cost="0.00"):
+        Order.objects.create(
+            customer_name="Client", email="client@example.com", country="FR",
+            currency=currency, shipping_cost=Decimal(shipping_cost),
+        )
+        order = Order.objects.latest('pk')
+        OrderLine.objects.bulk_create([
+            OrderLine(order=order, unit_price_ht=Decimal(price), quantity=quantity, tax_rate=matrice, weight=Decimal("0.50"))
+            for price, quantity, matrice in lines
+        ])
+        return order
+
+    def test_calculate_totals_matches_engine(self):
+        """Test the aggregate applies the pricing engine's per-line rounding in one query."""
+        lines = [("0.99", 1, self.reduit), ("10.01", 3, self.normal), ("7.00", 2, None)] * 50
+        order = self.create_order(lines, currency=self.usd, shipping_cost="4.90")
+        expected = price_lines(
+            PricingLine(unit_price=Decimal(price), quantity=quantity, tax_rate=matrice.tax_rate if matrice else 0)
+            for price, quantity, matrice in lines
+        )
+        with CaptureQueriesContext(connection) as queries:
+            order.calculate_totals()
+        # Queries after the UPDATE are Wagtail's reference index, run on every save
+        statements = [query['sql'] for query in queries]
+        computing = statements[:next(index for index, sql in enumerate(statements) if sql.startswith('UPDATE'))]
+        self.assertEqual(len([sql for sql in computing if 'orders_orderline' in sql]), 1)
+        order.refresh_from_db()
+        self.assertEqual((order.local_total_ht, order.local_total_tva), (expected.ht, expected.tva))
+        self.assertEqual(order.local_total_ttc, expected.ttc + Decimal("4.90"))
+        self.assertEqual(order.foreign_total_ttc, (order.local_total_ttc / 2).quantize(Decimal("0.01")))
+        self.assertEqual(order.get_total_weight(), Decimal("75.00"))
+
+    def test_bulk_recalculation_matches_calculate_totals(self):
+        """Test the set-based recalculation gives the per-order totals in constant queries."""
+        orders = [
+            self.create_order([("19.99", 2, self.normal), ("3.33", 1, self.reduit)], currency=self.usd, shipping_cost="5.00"),
+            self.create_order([("12.50", 4, None)]),
+            self.create_order([]),
+        ]
+        expected = []
+        for order in orders:
+            order.calculate_totals()
+            order.refresh_from_db()
+            expected.append([getattr(order, field) for field in TOTAL_FIELDS])
+        Order.objects.update(**{field: Decimal("0") for field in TOTAL_FIELDS})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(recalculate_totals(), 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(
+            [list(values) for values in Order.objects.order_by('pk').values_list(*TOTAL_FIELDS)], expected
+        )
+
+    def test_large_amounts(self):
+        """Test totals beyond 2**31 cents are neither truncated nor wrapped."""
+        order = self.create_order([("15000000.00", 2, self.normal), ("-0.99", 3, self.reduit)])
+        order.calculate_totals()
+        order.refresh_from_db()
+        expected = [getattr(order, field) for field in TOTAL_FIELDS]
+        self.assertEqual((order.local_total_ht, order.local_total_tva), (Decimal("29999997.03"), Decimal("5999999.84")))
+        Order.objects.update(**{field: Decimal("0") for field in TOTAL_FIELDS})
+        recalculate_totals()
+        self.assertEqual(list(Order.objects.values_list(*TOTAL_FIELDS).get()), expected)
+
+    def test_command(self):
+        """Test the command filters orders by status."""
+        self.create_order([("10.00", 1, self.normal)])
+        confirmed = self.create_order([("10.00", 1, self.normal)])
+        Order.objects.filter(pk=confirmed.pk).update(status="confirmed")
+        out = StringIO()
+        call_command('recalculate_order_totals', status=['confirmed'], stdout=out)
+        self.assertIn("1 commande(s)", out.getvalue())
+        self.assertEqual(
+            list(Order.objects.order_by('pk').values_list('local_total_ttc', flat=True)), [Decimal("0"), Decimal("12.00")]
+        )
+
+
+class ImportOrdersTest(TestCase):
+    """Test the streaming bulk order import."""
+
+    def setUp(self):
+        cache.clear()
+        rates._tables.clear()
+        self.addCleanup(rates._tables.clear)
+        CheckoutSettings.objects.create(currency="EUR")
+        self.tax_user = TaxUser.objects.create(tax_name="Particulier")
+        tax_product = TaxProduct.objects.create(tax_name="Normal")
+        self.matrice = TaxMatrice.objects.create(
+            tax_product=tax_product, tax_user=self.tax_user, tax_rate=Decimal("20.00"), tax_account="445710"
+        )
+        root = Page.get_first_root_node()
+        for sku in ("TSHIRT", "MUG"):
+            root.add_child(instance=ProductPage(
+                title=sku, slug=sku.lower(), price=Decimal("10.00"), sku=sku, tax_product=tax_product
+            ))
+        variant = ProductVariant.objects.create(name="Taille")
+        self.small, self.large = (VariantOption.objects.create(variant=variant, name=name) for name in ("S", "L"))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.tmp.name) / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def import_orders(self, path, **options):
+        out = StringIO()
+        call_command('import_orders', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_csv_import(self):
+        """Test consecutive CSV rows form one order, with options, tax matrices and totals."""
+        path = self.write("orders.csv", "\n".join([
+            "order,customer_name,email,country,status,shipping_cost,sku,quantity,unit_price_ht,weight,options",
+            f"A1,Alice,alice@example.com,fr,confirmed,4.90,TSHIRT,2,10.00,0.20,{self.small.pk}|{self.large.pk}",
+            "A1,Alice,alice@example.com,fr,confirmed,4.90,MUG,1,5.00,0.30,",
+            "A2,Bob,bob@example.com,BE,,,MUG,3,5.00,,",
+        ]))
+        output = self.import_orders(path, batch_size=1, tax_user=self.tax_user.pk)
+        self.assertIn("2 commande(s) et 3 ligne(s)", output)
+        alice, bob = Order.objects.order_by('pk')
+        self.assertEqual((alice.status, alice.country.code, bob.status), ("confirmed", "FR", "draft"))
+        self.assertEqual(alice.lines.count(), 2)
+        self.assertEqual(
+            set(alice.lines.get(product__sku="TSHIRT").variant_option.values_list('pk', flat=True)),
+            {self.small.pk, self.large.pk},
+        )
+        self.assertEqual(set(OrderLine.objects.values_list('tax_rate', flat=True)), {self.matrice.pk})
+        self.assertEqual((alice.local_total_ht, alice.local_total_tva), (Decimal("25.00"), Decimal("5.00")))
+        self.assertEqual(alice.local_total_ttc, Decimal("34.90"))
+        self.assertEqual(DailySales.objects.get(status="confirmed").total_ttc, Decimal("34.90"))
+        # bulk_create skips Order.save: the importer records the store currency itself
+        self.assertEqual(store_currency(), "EUR")
+        self.assertEqual(set(DailySales.objects.values_list('currency', flat=True)), {store_currency()})
+        self.assertEqual(alice.local_currency, store_currency())
+        self.assertEqual(bob.get_total_weight(), Decimal("0"))
+
+    def test_jsonl_import_in_constant_queries(self):
+        """Test a chunk costs a bounded number of queries whatever its number of orders."""
+        order = {
+            "customer_name": "Client", "email": "client@example.com", "country": "FR",
+            "lines": [{"sku": "MUG", "quantity": 1, "unit_price_ht": "5.00", "options": [self.small.pk]}],
+        }
+        small = self.write("small.jsonl", json.dumps(order) + "\n")
+        large = self.write("large.jsonl", "\n".join(json.dumps(order) for _ in range(200)))
+        with CaptureQueriesContext(connection) as small_queries:
+            self.import_orders(small)
+        with CaptureQueriesContext(connection) as large_queries:
+            self.import_orders(large, batch_size=500)
+        # SQLite splits bulk inserts at 999 parameters: a few more INSERTs, never one per order
+        self.assertLess(len(large_queries), len(small_queries) + 10)
+        self.assertEqual(Order.objects.count(), 201)
+        self.assertEqual(OrderLine.variant_option.through.objects.count(), 201)
+
+    def test_invalid_row_rolls_back_its_chunk(self):
+        """Test an unknown SKU aborts the import, keeping earlier chunks only."""
+        path = self.write("orders.csv", "\n".join([
+            "order,customer_name,email,country,sku,quantity,unit_price_ht",
+            "A1,Alice,alice@example.com,FR,MUG,1,5.00",
+            "A2,Bob,bob@example.com,FR,MUG,1,5.00",
+            "A2,Bob,bob@example.com,FR,UNKNOWN,1,5.00",
+        ]))
+        with self.assertRaisesMessage(CommandError, "Ligne 4 : SKU inconnu « UNKNOWN »"):
+            self.import_orders(path, batch_size=1)
+        self.assertEqual(list(Order.objects.values_list('customer_name', flat=True)), ["Alice"])
+
+
+# Admin pages rendered in tests: no collectstatic manifest
+STATIC_STORAGES = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=STATIC_STORAGES)
+class OrderListingTest(TestCase):
+    """Test the keyset-paginated orders admin listing."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.user)
+        start = timezone.now() - timedelta(days=1)
+        for index in range(45):
+            order = Order.objects.create(customer_name=f"Client {index:02d}", email="client@example.com", country="FR")
+            Order.objects.filter(pk=order.pk).update(created_at=start + timedelta(minutes=index))
+        OrderLine.objects.bulk_create([
+            OrderLine(order=order, unit_price_ht=Decimal("10.00")) for order in Order.objects.all() for _ in range(2)
+        ])
+
+    def listing(self, **params):
+        response = self.client.get(reverse('order:index_results'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def names(self, page):
+        return [order.customer_name for order in page]
+
+    def test_pages_follow_cursors(self):
+        """Test next and previous cursors walk the listing newest first."""
+        first = self.listing()
+        self.assertEqual(self.names(first)[:2], ["Client 44", "Client 43"])
+        self.assertFalse(first.has_previous())
+        second = self.listing(after=first.next_cursor)
+        third = self.listing(after=second.next_cursor)
+        self.assertEqual(self.names(third), [f"Client {index:02d}" for index in range(4, -1, -1)])
+        self.assertFalse(third.has_next())
+        self.assertEqual(self.names(self.listing(before=second.previous_cursor)), self.names(first))
+        self.assertEqual([order.line_count for order in second], [2] * 20)
+        response = self.client.get(reverse('order:index'))
+        self.assertContains(response, f"after={quote(first.next_cursor)}")
+
+    def test_oldest_first(self):
+        """Test the ascending order also paginates by key."""
+        page = self.listing(ordering="created_at")
+        self.assertEqual(self.names(self.listing(ordering="created_at", after=page.next_cursor))[0], "Client 20")
+
+    def test_queries_do_not_depend_on_depth(self):
+        """Test a deep page costs the same queries as the first, with no COUNT."""
+        with CaptureQueriesContext(connection) as first_queries:
+            first = self.listing()
+        cursor = self.listing(after=first.next_cursor).next_cursor
+        with CaptureQueriesContext(connection) as deep_queries:
+            self.listing(after=cursor)
+        self.assertEqual(len(deep_queries), len(first_queries))
+        self.assertFalse([query for query in deep_queries if 'COUNT(*)' in query['sql'] and 'orders_order' in query['sql']])
+
+
+@override_settings(STORAGES=STATIC_STORAGES)
+class DailySalesTest(TestCase):
+    """Test the incrementally maintained daily sales rollup."""
+
+    def setUp(self):
+        cache.clear()
+        rates._tables.clear()
+        self.addCleanup(rates._tables.clear)
+        self.today = timezone.localdate()
+
+    def buckets(self):
+        return {
+            (row.source, row.country, row.status): (row.order_count, row.total_ht, row.total_ttc, row.shipping)
+            for row in DailySales.objects.filter(date=self.today)
+        }
+
+    def create_order(self, status="draft", shipping_cost="5.00"):
+        Order.objects.create(
+            customer_name="Client", email="client@example.com", country="FR",
+            status=status, shipping_cost=Decimal(shipping_cost),
+        )
+        order = Order.objects.latest('pk')
+        OrderLine.objects.create(order=order, unit_price_ht=Decimal("10.00"), quantity=2)
+        order.calculate_totals()
+        return order
+
+    def test_order_changes_move_between_buckets(self):
+        """Test saves, status changes and deletes keep the rollup in step."""
+        order = self.create_order()
+        self.create_order()
+        self.assertEqual(self.buckets(), {
+            ("orders", "FR", "draft"): (2, Decimal("40.00"), Decimal("50.00"), Decimal("10.00")),
+        })
+        order.status = "confirmed"
+        order.save()
+        self.assertEqual(self.buckets(), {
+            ("orders", "FR", "draft"): (1, Decimal("20.00"), Decimal("25.00"), Decimal("5.00")),
+            ("orders", "FR", "confirmed"): (1, Decimal("20.00"), Decimal("25.00"), Decimal("5.00")),
+        })
+        order.delete()
+        self.assertEqual(list(self.buckets()), [("orders", "FR", "draft")])
+
+    def test_checkout_orders_and_payment_worker(self):
+        """Test storefront orders are counted in the store currency when the worker marks them paid."""
+        order = CheckoutOrder.objects.create(total_amount=Decimal("42.00"), payment_method="Stripe", delivery_option="pickup")
+        mark_order_paid(order, notify=False)
+        row = DailySales.objects.get(source="checkout")
+        self.assertEqual((row.status, row.order_count, row.total_ttc), ("paid", 1, Decimal("42.00")))
+        self.assertEqual(row.currency, order.currency)
+        self.assertEqual(order.currency, store_currency())
+
+    def test_store_currency_change_keeps_buckets(self):
+        """Test orders stay in the bucket of the currency they were recorded in."""
+        settings_instance = CheckoutSettings.objects.create(currency="EUR")
+        order = self.create_order()
+        checkout_order = CheckoutOrder.objects.create(
+            total_amount=Decimal("42.00"), payment_method="Stripe", delivery_option="pickup"
+        )
+        self.assertEqual((order.local_currency, checkout_order.currency), ("EUR", "EUR"))
+        with self.captureOnCommitCallbacks(execute=True):
+            settings_instance.currency = "USD"
+            settings_instance.save()
+
+        order.status = "confirmed"
+        order.save()
+        mark_order_paid(checkout_order, notify=False)
+        self.create_order()
+        rows = DailySales.objects.filter(date=self.today)
+        self.assertEqual(
+            {(row.source, row.currency, row.status): row.order_count for row in rows},
+            {("orders", "EUR", "confirmed"): 1, ("checkout", "EUR", "paid"): 1, ("orders", "USD", "draft"): 1},
+        )
+        expected = self.buckets()
+        call_command('rebuild_daily_sales', stdout=StringIO())
+        self.assertEqual(self.buckets(), expected)
+
+    def test_rollback_discards_deltas(self):
+        """Test a failed transaction leaves the rollup untouched."""
+        order = self.create_order()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            order.status = "cancelled"
+            order.save()
+            raise RuntimeError
+        self.assertEqual(list(self.buckets()), [("orders", "FR", "draft")])
+
+    def test_rebuild_matches_incremental_rollup(self):
+        """Test the rebuild command regenerates the same buckets from the orders."""
+        self.create_order()
+        self.create_order(status="confirmed", shipping_cost="0.00")
+        CheckoutOrder.objects.create(total_amount=Decimal("9.99"), payment_method="COD", delivery_option="delivery")
+        expected = self.buckets()
+        Order.objects.update(status="draft")
+        expected[("orders", "FR", "draft")] = (2, Decimal("40.00"), Decimal("45.00"), Decimal("5.00"))
+        del expected[("orders", "FR", "confirmed")]
+        out = StringIO()
+        call_command('rebuild_daily_sales', stdout=out)
+        self.assertIn("2 case(s)", out.getvalue())
+        self.assertEqual(self.buckets(), expected)
+
+    def test_admin_reads_the_rollup(self):
+        """Test the read-only listing, export and dashboard panel."""
+        self.create_order()
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.get(reverse('dailysales:index'), {'export': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"2", b"".join(response.streaming_content))
+        self.assertEqual(self.client.get(reverse('dailysales:add')).status_code, 302)
+        self.assertContains(self.client.get(reverse('wagtailadmin_home')), "Ventes des 7 derniers jours")
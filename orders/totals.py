@@ -0,0 +1,52 @@
+"""
+Recalcul des totaux de commande en masse, pour le back-office.
+
+Deux UPDATE ensemblistes, quel que soit le nombre de commandes : le premier écrit HT et
+TVA depuis des sous-requêtes corrélées d'agrégation sur les lignes (voir line_totals),
+le second en déduit le TTC (frais de port compris) et les totaux en devise. Les arrondis
+sont ceux de ``Order.calculate_totals``.
+
+Contrairement à ``calculate_totals``, le taux de change n'est pas relu : c'est le taux
+enregistré sur la commande (``currency_rate``) qui s'applique, et ``order_date`` n'est
+pas modifiée.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf, Round
+
+from .models import Order, OrderLine, line_totals
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def _lines_cents(name):
+    lines = OrderLine.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    total = lines.annotate(total=line_totals()[name]).values('total')
+    cents = Coalesce(Subquery(total, output_field=BigIntegerField()), 0)
+    return ExpressionWrapper(cents * Value(Decimal('0.01')), output_field=MONEY)
+
+
+def _in_currency(amount):
+    rate = Coalesce(NullIf(F('currency_rate'), Value(Decimal('0'))), Value(Decimal('1')))
+    return Round(ExpressionWrapper(amount / rate, output_field=MONEY), 2)
+
+
+def recalculate_totals(orders=None):
+    """
+    Recalcule les totaux des commandes `orders` (QuerySet, toutes par défaut) ; renvoie leur
+    nombre. Le QuerySet est réévalué à chaque passage : ne pas le filtrer sur les totaux.
+    """
+    orders = Order.objects.all() if orders is None else orders
+    with transaction.atomic():
+        count = orders.update(local_total_ht=_lines_cents('ht_cents'), local_total_tva=_lines_cents('tva_cents'))
+        # Second passage : dans un UPDATE, chaque expression lit les valeurs d'avant la mise à jour
+        ttc = ExpressionWrapper(F('local_total_ht') + F('local_total_tva') + F('shipping_cost'), output_field=MONEY)
+        orders.update(
+            local_total_ttc=ttc,
+            foreign_total_ht=_in_currency(F('local_total_ht')),
+            foreign_total_tva=_in_currency(F('local_total_tva')),
+            foreign_total_ttc=_in_currency(ttc),
+        )
+    return count
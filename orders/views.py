@@ -1,9 +1,67 @@
+from datetime import timedelta
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from wagtail.admin.ui.components import Component
+from wagtail.admin.ui.tables import Column
+from wagtail.admin.views.generic import IndexView
 from wagtail.admin.viewsets.model import ModelViewSet
 from wagtail.admin.panels import FieldPanel, InlinePanel
-from .models import Order, OrderLine
+from .models import DailySales, Order, OrderLine
+from .pagination import KeysetPaginator
 from wagtail.models import LockableMixin, RevisionMixin, PreviewableMixin
+from wagtail.permission_policies import ModelPermissionPolicy
 from django.http import HttpResponse
 
+
+class OrderIndexView(IndexView):
+    """
+    Liste des commandes paginée par clé (created_at, id) : coût constant quelle que soit
+    la page, sans COUNT(*). Devise et option d'expédition sont jointes, le nombre de
+    lignes est une sous-requête évaluée pour les seules lignes de la page.
+    """
+    results_template_name = "orders/order_index_results.html"
+    default_ordering = "-created_at"
+    cursor_kwargs = ("after", "before")
+
+    def get_base_queryset(self):
+        line_count = (
+            OrderLine.objects.filter(order=OuterRef("pk")).order_by().values("order")
+            .annotate(count=Count("pk")).values("count")
+        )
+        return super().get_base_queryset().select_related("currency", "shipping_option").annotate(
+            line_count=Coalesce(Subquery(line_count, output_field=IntegerField()), 0)
+        )
+
+    def get_valid_orderings(self):
+        # Seul l'ordre de la clé de pagination est proposé
+        return ["created_at", "-created_at"]
+
+    @property
+    def columns(self):
+        columns = super().columns
+        for column in columns:
+            if column.sort_key not in self.get_valid_orderings():
+                column.sort_key = None
+        return columns
+
+    def order_queryset(self, queryset):
+        # L'ordre est posé par le paginateur, qui l'inverse pour la page précédente
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, descending=self.ordering != "created_at")
+        page = paginator.page(**{key: self.request.GET.get(key) for key in self.cursor_kwargs})
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        # Pas de total : le compte affiché au filtrage est celui de la page
+        context["items_count"] = len(context["object_list"])
+        return context
+
+
 class OrderViewSet(LockableMixin, RevisionMixin, PreviewableMixin, ModelViewSet):
     model = Order
     name = "order"
@@ -13,7 +71,18 @@ class OrderViewSet(LockableMixin, RevisionMixin, PreviewableMixin, ModelViewSet)
     menu_order = 200
     add_to_settings_menu = False
     add_to_admin_menu = True
-    list_display = ("id", "customer_name", "email", "status", "", "created_at")
+    index_view_class = OrderIndexView
+    list_display = (
+        "id",
+        "customer_name",
+        "email",
+        "status",
+        Column("line_count", label="Lignes"),
+        "local_total_ttc",
+        "currency",
+        "shipping_option",
+        "created_at",
+    )
     search_fields = ("id", "customer_name", "email", "status")
     form_fields = [
         "customer_name",
@@ -83,3 +152,55 @@ class OrderViewSet(LockableMixin, RevisionMixin, PreviewableMixin, ModelViewSet)
             'local_total_ttc': instance.local_total_ttc,
         }
         return self.render_preview(context)
+
+
+class ReadOnlyPermissionPolicy(ModelPermissionPolicy):
+    """Consultation seule : le cumul des ventes n'est écrit que par orders.sales."""
+
+    def user_has_permission(self, user, action):
+        return action not in ("add", "change", "delete") and super().user_has_permission(user, action)
+
+    def user_has_any_permission(self, user, actions):
+        return any(self.user_has_permission(user, action) for action in actions)
+
+
+class DailySalesViewSet(ModelViewSet):
+    """Ventes journalières : liste filtrable et export CSV / XLSX, lus dans le cumul seul."""
+    model = DailySales
+    menu_label = "Ventes"
+    menu_icon = "table"
+    icon = "table"
+    menu_order = 210
+    add_to_admin_menu = True
+    copy_view_enabled = False
+    exclude_form_fields = []
+    list_display = (
+        "date", "source", "currency", "country", "status",
+        "order_count", "total_ht", "total_tva", "total_ttc", "shipping",
+    )
+    list_export = list_display
+    export_filename = "ventes-journalieres"
+    list_filter = ("date", "source", "currency", "country", "status")
+
+    @property
+    def permission_policy(self):
+        return ReadOnlyPermissionPolicy(self.model)
+
+
+class SalesSummaryPanel(Component):
+    """Tableau de bord : commandes et chiffre d'affaires TTC des derniers jours, depuis le cumul."""
+    name = "sales_summary"
+    template_name = "orders/home/sales_summary.html"
+    order = 90
+    days = 7
+    # Les commandes annulées ne comptent pas dans le chiffre d'affaires
+    excluded_statuses = ("cancelled", "canceled")
+
+    def get_context_data(self, parent_context):
+        context = super().get_context_data(parent_context)
+        since = timezone.localdate() - timedelta(days=self.days - 1)
+        context["days"] = (
+            DailySales.objects.filter(date__gte=since).exclude(status__in=self.excluded_statuses)
+            .values("date").annotate(order_count=Sum("order_count"), total_ttc=Sum("total_ttc")).order_by("-date")
+        )
+        return context
@@ -1,6 +1,18 @@
 from wagtail import hooks
-from .views import OrderViewSet
+from .models import DailySales
+from .views import DailySalesViewSet, OrderViewSet, ReadOnlyPermissionPolicy, SalesSummaryPanel
 
 @hooks.register("register_admin_viewset")
 def register_order_viewset():
     return OrderViewSet()
+
+
+@hooks.register("register_admin_viewset")
+def register_daily_sales_viewset():
+    return DailySalesViewSet()
+
+
+@hooks.register("construct_homepage_panels")
+def add_sales_summary_panel(request, panels):
+    if ReadOnlyPermissionPolicy(DailySales).user_has_permission(request.user, "view"):
+        panels.append(SalesSummaryPanel())
@@ -8,6 +8,7 @@ from wagtail.models import Orderable
 from wagtail.admin.panels import PageChooserPanel
 from autoslug import AutoSlugField
 from wagtail.models import Page
+from .provider import CachedSettingMixin
 
 # Sous-modèle pour les horaires
 class Horaire(models.Model):
@@ -47,7 +48,7 @@ class HorairesOuverture(ClusterableModel, BaseGenericSetting):
 
 # Modèle pour l'organisation (Identité légale)
 @register_setting
-class OrganisationSettings(BaseGenericSetting):
+class OrganisationSettings(CachedSettingMixin, BaseGenericSetting):
     nom_entreprise = models.CharField(max_length=255, help_text="Nom de l'entreprise")
     numero_siret = models.CharField(max_length=14, help_text="Numéro de SIRET")
     numero_tva = models.CharField(max_length=50, blank=True, help_text="Numéro de TVA")
@@ -0,0 +1,118 @@
+"""
+Chargement mémoïsé des réglages (CheckoutSettings, SMTPSettings, OrganisationSettings).
+
+Chaque modèle de réglages est chargé au plus une fois par requête : l'instance est
+rangée sur la requête sous l'attribut utilisé par Wagtail, de sorte que les gabarits
+(``settings.app.Modele``) réutilisent la même instance.
+
+D'une requête à l'autre, l'instance est gardée en mémoire du processus avec le numéro
+de version du modèle lu dans le cache Django (partagé par les workers, voir CACHES) :
+une lecture de clé remplace les requêtes du réglage. Un enregistrement ou une
+suppression remplace cette version au commit (signaux post_save / post_delete) : tous
+les workers rechargent le réglage à leur prochaine requête, et aucun ne peut relire
+l'ancienne ligne sous la nouvelle version.
+"""
+import copy
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+_process_cache = {}
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _version_key(model):
+    return f'settings:version:{_label(model)}'
+
+
+def get_settings_version(model):
+    version = cache.get(_version_key(model))
+    if version is None:
+        cache.add(_version_key(model), time.time_ns(), None)
+        version = cache.get(_version_key(model))
+    return version
+
+
+def invalidate_settings(model):
+    """Invalide le réglage `model` dans tous les processus."""
+    # Nouvelle valeur plutôt qu'incr : deux invalidations simultanées ne donnent pas
+    # la même version (incr n'est pas atomique sur tous les caches)
+    cache.set(_version_key(model), time.time_ns(), None)
+    for key in [key for key in _process_cache if key[0] == _label(model)]:
+        _process_cache.pop(key, None)
+
+
+def load_settings(model, request=None, loader=None, site_id=None):
+    """
+    Renvoie l'instance du réglage : depuis la requête, sinon depuis le cache du processus
+    si sa version est à jour, sinon via `loader` (par défaut, la première instance).
+    Renvoie None si le réglage n'existe pas encore (non mis en cache).
+    """
+    attr_name = model.get_cache_attr_name()
+    if request is not None and hasattr(request, attr_name):
+        return getattr(request, attr_name)
+
+    key = (_label(model), site_id)
+    version = get_settings_version(model)
+    cached = _process_cache.get(key)
+    if cached is not None and cached[0] == version:
+        # Copie par requête : les caches d'URL de page de l'instance restent propres à la requête
+        instance = copy.copy(cached[1])
+        instance._page_url_cache = {}
+    else:
+        instance = loader() if loader else model.base_queryset().first()
+        if instance is None:
+            return None
+        _process_cache[key] = (version, instance)
+        instance = copy.copy(instance)
+        instance._page_url_cache = {}
+
+    if request is not None:
+        setattr(request, attr_name, instance)
+    return instance
+
+
+def get_settings(model, request=None):
+    """Équivalent mémoïsé de ``model.objects.first()``."""
+    return load_settings(model, request)
+
+
+class CachedSettingMixin:
+    """
+    À placer avant BaseGenericSetting / BaseSiteSetting : ``load`` et ``for_request``
+    (utilisés par le processeur de contexte ``settings`` de Wagtail) passent par le cache.
+    """
+
+    @classmethod
+    def load(cls, request_or_site=None):
+        from wagtail.models import Site
+        if isinstance(request_or_site, Site):
+            return super().load(request_or_site)
+        return load_settings(cls, request_or_site, loader=cls._get_or_create)
+
+    @classmethod
+    def for_request(cls, request):
+        from wagtail.models import Site
+        attr_name = cls.get_cache_attr_name()
+        if hasattr(request, attr_name):
+            return getattr(request, attr_name)
+        site = Site.find_for_request(request)
+        if site is None:
+            return super().for_request(request)
+        instance = load_settings(cls, request, loader=lambda: cls.for_site(site), site_id=site.pk)
+        instance._request = request
+        return instance
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_settings(sender, **kwargs):
+    if isinstance(sender, type) and issubclass(sender, CachedSettingMixin):
+        # Au commit : avant, un autre worker relirait l'ancienne ligne sous la nouvelle version
+        transaction.on_commit(lambda: invalidate_settings(sender))
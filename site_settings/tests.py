@@ -1,3 +1,83 @@
-from django.test import TestCase
+"""
+Tests for the site_settings app.
+"""
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from checkout.models import CheckoutSettings
+from site_settings import provider
+from site_settings.models import OrganisationSettings
+from site_settings.provider import get_settings
+
+
+class SettingsProviderTest(TestCase):
+    """Test the memoized settings provider."""
+
+    def setUp(self):
+        cache.clear()
+        provider._process_cache.clear()
+        self.addCleanup(provider._process_cache.clear)
+        self.organisation = OrganisationSettings.objects.create(
+            nom_entreprise="Boutique", numero_siret="12345678900011", adresse_rue="1 rue",
+            adresse_code_postal="75001", adresse_ville="Paris", adresse_pays="France",
+        )
+        self.factory = RequestFactory()
+
+    def settings_queries(self, queries):
+        return [query for query in queries if 'site_settings_organisationsettings' in query['sql']]
+
+    def test_loaded_once_then_served_from_process_cache(self):
+        """Test one settings query for the first request and only a version read afterwards."""
+        request = self.factory.get("/")
+        with CaptureQueriesContext(connection) as queries:
+            first = get_settings(OrganisationSettings, request)
+            self.assertIs(get_settings(OrganisationSettings, request), first)
+            self.assertIs(OrganisationSettings.load(request), first)
+        self.assertEqual(len(self.settings_queries(queries)), 1)
+        with CaptureQueriesContext(connection) as queries:
+            other = get_settings(OrganisationSettings, self.factory.get("/"))
+        self.assertEqual(self.settings_queries(queries), [])
+        self.assertLessEqual(len(queries), 1)
+        self.assertIsNot(other, first)
+        self.assertEqual(other.nom_entreprise, "Boutique")
+
+    def test_template_reuses_request_instance(self):
+        """Test templates reading settings.* share the instance loaded by the view."""
+        request = self.factory.get("/")
+        get_settings(OrganisationSettings, request)
+        template = Template("{{ settings.site_settings.OrganisationSettings.nom_entreprise }}")
+        from wagtail.contrib.settings.context_processors import settings as settings_processor
+        with CaptureQueriesContext(connection) as queries:
+            rendered = template.render(Context(settings_processor(request)))
+        self.assertEqual(rendered, "Boutique")
+        self.assertEqual(len(queries), 0)
+
+    def test_save_invalidates(self):
+        """Test a save is seen by the next request once committed."""
+        get_settings(OrganisationSettings)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organisation.nom_entreprise = "Nouvelle"
+            self.organisation.save()
+            # Before the commit, other workers must keep the old version: reloading
+            # now would cache the old row under the new version
+            self.assertEqual(get_settings(OrganisationSettings).nom_entreprise, "Boutique")
+        self.assertEqual(get_settings(OrganisationSettings).nom_entreprise, "Nouvelle")
+
+    def test_shared_version_invalidates_other_workers(self):
+        """Test a version bump made by another process triggers a reload."""
+        get_settings(OrganisationSettings)
+        OrganisationSettings.objects.update(nom_entreprise="Autre worker")
+        self.assertEqual(get_settings(OrganisationSettings).nom_entreprise, "Boutique")
+        # Another worker saved: only the shared version key changes here
+        cache.incr(provider._version_key(OrganisationSettings))
+        self.assertEqual(get_settings(OrganisationSettings).nom_entreprise, "Autre worker")
+
+    def test_missing_settings_not_cached(self):
+        """Test a missing settings row returns None until it is created."""
+        self.assertIsNone(get_settings(CheckoutSettings))
+        CheckoutSettings.objects.create(store_name="Créé")
+        self.assertEqual(get_settings(CheckoutSettings).store_name, "Créé")
@@ -6,6 +6,7 @@ from cryptography.fernet import Fernet
 from django.core.mail import EmailMessage, get_connection
 import smtplib
 from django.db import models
+from site_settings.provider import CachedSettingMixin
 
 # Clé Fernet sécurisée
 FERNET_SECRET_KEY = b"nNjpIl9Ax2LRtm-p6ryCRZ8lRsL0DtuY0f9JeAe2wG0="
@@ -14,7 +15,7 @@ if not FERNET_SECRET_KEY:
     raise RuntimeError("FERNET_SECRET_KEY is not defined in the environment variables.")
 
 @register_setting
-class SMTPSettings(BaseSiteSetting):
+class SMTPSettings(CachedSettingMixin, BaseSiteSetting):
     email_host = models.CharField(max_length=255, verbose_name="Email Host")
     email_port = models.PositiveIntegerField(
     verbose_name="Email Port",
@@ -0,0 +1,89 @@
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+
+from taxes.models import TaxMatrice, TaxProduct, TaxUser
+from taxes.pricing import price_cart_items
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le chiffrage de paniers de N lignes : une requête TaxMatrice et un calcul "
+        "Decimal par ligne (ancien chemin) contre le moteur de prix (une requête, centimes "
+        "entiers). Les taxes de test sont créées dans une transaction annulée à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1000, help="Nombre de lignes par panier")
+        parser.add_argument('--repeat', type=int, default=20, help="Nombre de paniers chiffrés par chemin")
+        parser.add_argument('--tax-products', type=int, default=10, help="Nombre de catégories de produit distinctes")
+
+    def handle(self, *args, **options):
+        if min(options['lines'], options['repeat'], options['tax_products']) < 1:
+            raise CommandError("--lines, --repeat et --tax-products doivent être positifs.")
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        tax_user = TaxUser.objects.create(tax_name="Benchmark")
+        tax_products = [TaxProduct.objects.create(tax_name=f"Benchmark {index}") for index in range(options['tax_products'])]
+        TaxMatrice.objects.bulk_create([
+            TaxMatrice(tax_product=tax_product, tax_user=tax_user, tax_rate=Decimal(rate), tax_account="445710")
+            for tax_product, rate in zip(tax_products, ["20.00", "10.00", "5.50", "2.10"] * len(tax_products))
+        ])
+        items = [
+            SimpleNamespace(
+                unit_price=Decimal(index % 5000) / 100 + Decimal("0.99"),
+                quantity=1 + index % 3,
+                product=SimpleNamespace(
+                    tax_product_id=tax_products[index % len(tax_products)].pk, tax_included=index % 2 == 0,
+                ),
+            )
+            for index in range(options['lines'])
+        ]
+
+        def per_line():
+            total_ht = total_tva = Decimal("0")
+            for item in items:
+                matrice = TaxMatrice.objects.filter(
+                    tax_product_id=item.product.tax_product_id, tax_user=tax_user, is_active=True,
+                ).first()
+                rate = matrice.tax_rate if matrice else Decimal("0")
+                amount = item.unit_price * item.quantity
+                if item.product.tax_included:
+                    ht = amount / (1 + rate / 100)
+                else:
+                    ht = amount
+                total_ht += ht
+                total_tva += ht * rate / 100
+            return total_ht + total_tva
+
+        def engine():
+            return price_cart_items(items, tax_user).ttc
+
+        self.stdout.write(f"Paniers de {options['lines']} lignes, {options['repeat']} chiffrages par chemin")
+        for label, price in (("Requête et calcul par ligne", per_line), ("Moteur de prix", engine)):
+            # Requêtes comptées sur un seul panier : le journal de la connexion est borné
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                price()
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                total = price()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label} : {elapsed / options['repeat'] * 1000:.2f} ms par panier, "
+                f"{len(queries)} requête(s), total TTC {Decimal(total).quantize(Decimal('0.01'))}"
+            )
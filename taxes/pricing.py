@@ -0,0 +1,204 @@
+"""
+Moteur de prix : HT, TVA et TTC d'un ensemble de lignes en une passe.
+
+Les taux de toutes les lignes sont résolus en une seule requête sur TaxMatrice, pour le
+couple (TaxProduct du produit, TaxUser du client). Les calculs se font en centimes
+entiers : chaque ligne est arrondie une fois (demi-centime arrondi en s'éloignant de zéro,
+comme ROUND_HALF_UP et le ROUND SQL, y compris pour les avoirs et remises négatifs) et les
+totaux sont la somme exacte des lignes, sans dérive d'arrondi entre panier, commande et
+facture.
+
+Une ligne peut aussi porter son taux (lignes de commande et de facture déjà taxées) ;
+sans taux ni matrice pour le client, la ligne est taxée au taux par défaut donné
+(0 par défaut).
+
+``sql_line_cents`` reproduit ces arrondis en expressions SQL, pour agréger des lignes
+HT en base (totaux de commande) sans les charger.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import BigIntegerField, Value
+from django.db.models.functions import Cast, Coalesce, Round, Sign
+
+from .models import TaxMatrice
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    """Montant Decimal (ou int, float, str) en centimes entiers, arrondi au plus proche."""
+    return int((Decimal(str(amount or 0)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (Decimal(cents) / 100).quantize(CENT)
+
+
+def _div_round(numerator, denominator):
+    """Division entière arrondie au plus proche, moitié en s'éloignant de zéro (`denominator` > 0)."""
+    quotient = (2 * abs(numerator) + denominator) // (2 * denominator)
+    return -quotient if numerator < 0 else quotient
+
+
+def _rate_basis_points(rate):
+    """Taux en pourcentage (Decimal, 2 décimales) en points de base : 20.00 % -> 2000."""
+    return int((Decimal(str(rate or 0)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+@dataclass
+class PricingLine:
+    """
+    Ligne à chiffrer. `unit_price` est TTC si `tax_included`, HT sinon.
+    `tax_rate` (en %) court-circuite la résolution par `tax_product_id`.
+    """
+    unit_price: Decimal
+    quantity: int = 1
+    tax_product_id: int = None
+    tax_included: bool = False
+    tax_rate: Decimal = None
+    source: object = None
+
+
+@dataclass
+class PricedLine:
+    source: object
+    quantity: int
+    tax_rate: Decimal
+    ht_cents: int
+    tva_cents: int
+    tax_matrice_id: int = None
+
+    @property
+    def ttc_cents(self):
+        return self.ht_cents + self.tva_cents
+
+    @property
+    def ht(self):
+        return from_cents(self.ht_cents)
+
+    @property
+    def tva(self):
+        return from_cents(self.tva_cents)
+
+    @property
+    def ttc(self):
+        return from_cents(self.ttc_cents)
+
+
+@dataclass
+class Pricing:
+    lines: list = field(default_factory=list)
+    ht_cents: int = 0
+    tva_cents: int = 0
+
+    @property
+    def ttc_cents(self):
+        return self.ht_cents + self.tva_cents
+
+    @property
+    def ht(self):
+        return from_cents(self.ht_cents)
+
+    @property
+    def tva(self):
+        return from_cents(self.tva_cents)
+
+    @property
+    def ttc(self):
+        return from_cents(self.ttc_cents)
+
+    def tva_by_rate(self):
+        """TVA par taux, pour le récapitulatif des factures : {Decimal('20.00'): Decimal('3.40')}."""
+        totals = defaultdict(int)
+        for line in self.lines:
+            totals[line.tax_rate] += line.tva_cents
+        return {rate: from_cents(cents) for rate, cents in sorted(totals.items())}
+
+
+def resolve_rates(tax_product_ids, tax_user):
+    """{tax_product_id: (taux, id TaxMatrice)} des matrices actives du client, en une requête."""
+    tax_user_id = getattr(tax_user, 'pk', tax_user)
+    tax_product_ids = {tax_product_id for tax_product_id in tax_product_ids if tax_product_id}
+    if not tax_user_id or not tax_product_ids:
+        return {}
+    rows = TaxMatrice.objects.filter(
+        tax_user_id=tax_user_id, tax_product_id__in=tax_product_ids, is_active=True,
+    ).order_by('pk').values_list('tax_product_id', 'tax_rate', 'pk')
+    rates = {}
+    for tax_product_id, rate, matrice_id in rows:
+        # En cas de doublon, la première matrice créée l'emporte
+        rates.setdefault(tax_product_id, (rate, matrice_id))
+    return rates
+
+
+def price_lines(lines, tax_user=None, default_rate=None):
+    """
+    Chiffre les PricingLine données ; renvoie un Pricing (lignes et totaux). Les lignes
+    sans taux ni matrice active pour `tax_user` sont taxées à `default_rate` (en %).
+    """
+    lines = list(lines)
+    rates = resolve_rates((line.tax_product_id for line in lines if line.tax_rate is None), tax_user)
+    fallback = (Decimal(str(default_rate or 0)), None)
+    pricing = Pricing()
+    for line in lines:
+        if line.tax_rate is not None:
+            rate, matrice_id = Decimal(str(line.tax_rate)), None
+        else:
+            rate, matrice_id = rates.get(line.tax_product_id, fallback)
+        basis_points = _rate_basis_points(rate)
+        amount = to_cents(line.unit_price) * line.quantity
+        if line.tax_included:
+            ht_cents = _div_round(amount * 10000, 10000 + basis_points)
+            tva_cents = amount - ht_cents
+        else:
+            ht_cents = amount
+            tva_cents = _div_round(amount * basis_points, 10000)
+        priced = PricedLine(
+            line.source, line.quantity, (Decimal(basis_points) / 100).quantize(CENT), ht_cents, tva_cents, matrice_id
+        )
+        pricing.lines.append(priced)
+        pricing.ht_cents += ht_cents
+        pricing.tva_cents += tva_cents
+    return pricing
+
+
+def sql_line_cents(unit_price, quantity, tax_rate):
+    """
+    Expressions (HT, TVA) en centimes entiers d'une ligne au prix unitaire HT, avec les
+    arrondis de ``price_lines`` : à agréger avec Sum. `tax_rate` (en %) peut être nul.
+    Entiers 64 bits : pas de dépassement au-delà de 21 474 836,47 par ligne.
+    """
+    ht_cents = Cast(Round(unit_price * 100), BigIntegerField()) * quantity
+    basis_points = Cast(Round(Coalesce(tax_rate, Value(Decimal('0'))) * 100), BigIntegerField())
+    # _div_round en SQL : sur des entiers, SQLite et PostgreSQL font une division entière
+    # tronquée vers zéro ; la demi-unité prend le signe du montant (lignes négatives)
+    sign = Cast(Sign(ht_cents), BigIntegerField())
+    tva_cents = (2 * ht_cents * basis_points + sign * 10000) / 20000
+    return ht_cents, tva_cents
+
+
+def get_tax_user(user):
+    """Catégorie fiscale du client (None pour un visiteur anonyme)."""
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return None
+    return user.tax_user_id
+
+
+def price_cart_items(items, tax_user=None, default_rate=None):
+    """Chiffre des lignes de panier (CartItem ou GuestCartItem, produit déjà chargé)."""
+    return price_lines(
+        (
+            PricingLine(
+                unit_price=item.unit_price,
+                quantity=item.quantity,
+                tax_product_id=item.product.tax_product_id,
+                tax_included=item.product.tax_included,
+                source=item,
+            )
+            for item in items
+        ),
+        tax_user,
+        default_rate,
+    )
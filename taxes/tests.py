@@ -0,0 +1,117 @@
+"""
+Tests for the taxes app.
+"""
+
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.db import connection
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, Value
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from taxes.models import TaxMatrice, TaxProduct, TaxUser
+from taxes.pricing import PricingLine, price_cart_items, price_lines, sql_line_cents, to_cents
+
+
+def cart_item(price, quantity=1, tax_product=None, tax_included=False):
+    product = SimpleNamespace(tax_product_id=tax_product.pk if tax_product else None, tax_included=tax_included)
+    return SimpleNamespace(unit_price=Decimal(price), quantity=quantity, product=product)
+
+
+class PricingEngineTest(TestCase):
+    """Test the one-pass pricing engine."""
+
+    def setUp(self):
+        self.particulier = TaxUser.objects.create(tax_name="Particulier")
+        self.normal = TaxProduct.objects.create(tax_name="Normal")
+        self.reduit = TaxProduct.objects.create(tax_name="Réduit")
+        for tax_product, rate in ((self.normal, "20.00"), (self.reduit, "5.50")):
+            TaxMatrice.objects.create(
+                tax_product=tax_product, tax_user=self.particulier, tax_rate=Decimal(rate), tax_account="445710"
+            )
+
+    def test_rates_resolved_in_one_query(self):
+        """Test many lines cost a single TaxMatrice query."""
+        items = [cart_item("1.99", 3, self.normal if index % 2 else self.reduit) for index in range(200)]
+        with CaptureQueriesContext(connection) as queries:
+            pricing = price_cart_items(items, self.particulier)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(pricing.lines), 200)
+        self.assertEqual(pricing.ttc, pricing.ht + pricing.tva)
+
+    def test_cent_rounding_per_line(self):
+        """Test each line is rounded once and totals are the sum of lines."""
+        pricing = price_cart_items([
+            cart_item("0.99", 1, self.reduit),         # 0.99 HT, 0.05445 -> 0.05 TVA
+            cart_item("10.00", 3, self.normal, True),  # 30.00 TTC -> 25.00 HT + 5.00 TVA
+            cart_item("7.00", 1),                      # not taxed
+        ], self.particulier)
+        self.assertEqual([(line.ht, line.tva) for line in pricing.lines], [
+            (Decimal("0.99"), Decimal("0.05")),
+            (Decimal("25.00"), Decimal("5.00")),
+            (Decimal("7.00"), Decimal("0.00")),
+        ])
+        self.assertEqual((pricing.ht, pricing.tva, pricing.ttc), (Decimal("32.99"), Decimal("5.05"), Decimal("38.04")))
+        self.assertEqual(pricing.tva_by_rate(), {
+            Decimal("0.00"): Decimal("0.00"), Decimal("5.50"): Decimal("0.05"), Decimal("20.00"): Decimal("5.00"),
+        })
+
+    def test_inactive_or_unknown_rates(self):
+        """Test inactive matrices and anonymous customers fall back to the default rate."""
+        TaxMatrice.objects.filter(tax_product=self.normal).update(is_active=False)
+        items = [cart_item("10.00", 1, self.normal), cart_item("10.00", 1, self.reduit)]
+        self.assertEqual(price_cart_items(items, self.particulier).tva, Decimal("0.55"))
+        self.assertEqual(price_cart_items(items, self.particulier, Decimal("20.00")).tva, Decimal("2.55"))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(price_cart_items(items, None).tva, Decimal("0.00"))
+            self.assertEqual(price_cart_items(items, None, Decimal("20.00")).tva, Decimal("4.00"))
+        self.assertEqual(len(queries), 0)
+
+    def test_explicit_rates(self):
+        """Test lines carrying their own rate (orders, invoices) skip resolution."""
+        with CaptureQueriesContext(connection) as queries:
+            pricing = price_lines([PricingLine(unit_price=Decimal("12.34"), quantity=2, tax_rate=Decimal("20.00"))])
+        self.assertEqual(len(queries), 0)
+        self.assertEqual((pricing.ht, pricing.tva), (Decimal("24.68"), Decimal("4.94")))
+        self.assertEqual(to_cents(Decimal("0.005")), 1)
+
+    def test_sql_rounding_matches_engine(self):
+        """Test SQL line cents round credit lines and large amounts like price_lines."""
+        cases = [
+            ("0.10", 1, "5.00"),          # 0.005 TVA -> 0.01
+            ("-0.10", 1, "5.00"),         # credit line: -0.005 TVA -> -0.01
+            ("-0.99", 3, "5.50"),
+            ("-12.34", 2, "20.00"),
+            ("20000000.00", 10, "20.00"),  # over 2**31 cents
+        ]
+        matrice = TaxMatrice.objects.first()
+        for price, quantity, rate in cases:
+            with self.subTest(price=price):
+                ht_cents, tva_cents = sql_line_cents(
+                    Value(Decimal(price), output_field=DecimalField(max_digits=12, decimal_places=2)),
+                    Value(quantity), Value(Decimal(rate), output_field=DecimalField(max_digits=5, decimal_places=2)),
+                )
+                row = TaxMatrice.objects.filter(pk=matrice.pk).values_list(
+                    ExpressionWrapper(ht_cents, output_field=BigIntegerField()),
+                    ExpressionWrapper(tva_cents, output_field=BigIntegerField()),
+                ).get()
+                pricing = price_lines([PricingLine(unit_price=Decimal(price), quantity=quantity, tax_rate=Decimal(rate))])
+                self.assertEqual(row, (pricing.ht_cents, pricing.tva_cents))
+        self.assertEqual(to_cents(Decimal("-0.005")), -1)
+
+    def test_invoice_totals(self):
+        """Test invoices total their lines through the engine."""
+        from django.utils import timezone
+        from factures.models import Invoice, InvoiceLine
+        invoice = Invoice.objects.create(billing_address="1 rue", due_date=timezone.now())
+        for price, rate in (("19.99", "20.00"), ("3.33", "5.50")):
+            InvoiceLine.objects.create(
+                invoice=invoice, description="Ligne", unit_price_ht=Decimal(price), quantity=3, tax_rate=Decimal(rate)
+            )
+        invoice.calculate_totals()
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.total_ht, invoice.total_tva, invoice.total_ttc),
+                         (Decimal("69.96"), Decimal("12.54"), Decimal("82.50")))
+        line = invoice.lines.get(unit_price_ht=Decimal("3.33"))
+        self.assertEqual((line.calculate_ht(), line.calculate_tva()), (Decimal("9.99"), Decimal("0.55")))